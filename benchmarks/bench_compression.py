@@ -0,0 +1,63 @@
+"""
+Report the write/read throughput and the compression ratio of each codec on
+frames of the wandering Gaussian beam, stored as Mono8 frames.
+
+    python benchmarks/bench_compression.py
+"""
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from ophyd_basler.compression import CODECS, compression_options
+from ophyd_basler.custom_images import get_wandering_gaussian_beam
+
+num_frames, ny, nx = 64, 1040, 1024
+
+images = get_wandering_gaussian_beam(nf=num_frames, nx=nx, ny=ny, seed=6313448000)
+images = np.clip(images, 0, 255).astype(np.uint8)
+raw_mb = images.nbytes / 1e6
+
+print(f"{'codec':>16s} {'shuffle':>8s} {'write MB/s':>11s} {'read MB/s':>10s} {'ratio':>7s}")
+
+for codec in CODECS:
+    for shuffle in ("none", "byte", "bit"):
+        try:
+            options = compression_options(codec, level=5, shuffle=shuffle)
+        except ValueError:
+            continue
+        if (codec == "none" and shuffle != "none") or (codec.startswith("bitshuffle-") and shuffle != "bit"):
+            continue
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "images.h5")
+            with h5py.File(filename, "x") as f:
+                dataset = f.create_dataset(
+                    "/entry/image",
+                    shape=(0, ny, nx),
+                    maxshape=(None, ny, nx),
+                    chunks=(1, ny, nx),
+                    dtype=images.dtype,
+                    **options,
+                )
+                start = time.perf_counter()
+                for i, image in enumerate(images):
+                    dataset.resize(i + 1, axis=0)
+                    dataset[i] = image
+                f.flush()
+                write_time = time.perf_counter() - start
+                stored_mb = dataset.id.get_storage_size() / 1e6
+
+            with h5py.File(filename, "r") as f:
+                dataset = f["/entry/image"]
+                start = time.perf_counter()
+                for i in range(num_frames):
+                    dataset[i]
+                read_time = time.perf_counter() - start
+
+        print(
+            f"{codec:>16s} {shuffle:>8s} {raw_mb / write_time:11.1f} {raw_mb / read_time:10.1f} "
+            f"{raw_mb / stored_mb:7.2f}"
+        )
@@ -0,0 +1,57 @@
+"""
+Report the write throughput of compressed Mono8 frames of the wandering
+Gaussian beam, compressed by HDF5 on the writer thread, and by a pool of
+``ChunkCompressor`` workers of increasing size. The workers only speed up
+the writes with as many cores as workers.
+
+    python benchmarks/bench_compression_workers.py
+"""
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from ophyd_basler.compression import ChunkCompressor, compression_options
+from ophyd_basler.custom_images import get_wandering_gaussian_beam
+from ophyd_basler.writer import FrameWriter
+
+num_frames, ny, nx = 64, 1040, 1024
+codecs = (("lzf", "none"), ("gzip", "byte"), ("zstd", "none"), ("blosc-lz4", "byte"), ("bitshuffle-lz4", "bit"))
+workers = (0, 1, 2, 4, 8)
+
+images = get_wandering_gaussian_beam(nf=num_frames, nx=nx, ny=ny, seed=6313448000)
+images = np.clip(images, 0, 255).astype(np.uint8)
+raw_mb = images.nbytes / 1e6
+
+print(f"{os.cpu_count()} CPUs, write MB/s by number of compression workers (0: compressed by HDF5)")
+print(f"{'codec':>16s} {'shuffle':>8s}" + "".join(f"{n:>8d}" for n in workers))
+
+for codec, shuffle in codecs:
+    rates = []
+    for num_workers in workers:
+        compressor = ChunkCompressor(codec, level=5, shuffle=shuffle) if num_workers else None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with h5py.File(os.path.join(tmp_dir, "images.h5"), "x") as f:
+                dataset = f.create_dataset(
+                    "/entry/image",
+                    shape=(0, ny, nx),
+                    maxshape=(None, ny, nx),
+                    chunks=(1, ny, nx),
+                    dtype=images.dtype,
+                    **compression_options(codec, level=5, shuffle=shuffle),
+                )
+                start = time.perf_counter()
+                writer = FrameWriter(
+                    dataset,
+                    queue_size=num_frames,
+                    reserved=num_frames,
+                    compressor=compressor,
+                    workers=num_workers or 1,
+                )
+                for image in images:
+                    writer.submit(image, lambda index, error: None)
+                writer.close()
+                rates.append(raw_mb / (time.perf_counter() - start))
+    print(f"{codec:>16s} {shuffle:>8s}" + "".join(f"{rate:8.1f}" for rate in rates))
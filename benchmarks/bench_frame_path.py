@@ -0,0 +1,50 @@
+"""
+Compare copying grab results with ``np.array(res.Array)`` against filling
+recycled buffers of a ``FramePool`` from the zero-copy view, on the emulated
+camera.
+
+    python benchmarks/bench_frame_path.py
+"""
+import os
+import time
+
+import numpy as np
+from pypylon import pylon
+
+from ophyd_basler.acquisition import FramePool
+
+os.environ["PYLON_CAMEMU"] = "1"
+
+num_frames = 500
+
+camera_object = pylon.InstantCamera(pylon.TlFactory.GetInstance().CreateFirstDevice())
+camera_object.Open()
+camera_object.ExposureTimeAbs.SetValue(camera_object.ExposureTimeAbs.Min)
+
+pool = FramePool(size=2)
+
+
+def copy_array(res):
+    return np.array(res.Array)
+
+
+def fill_pool(res):
+    image = pool.fill(res)
+    pool.release(image)
+    return image
+
+
+for name, consume in (("np.array(res.Array)", copy_array), ("FramePool.fill()", fill_pool)):
+    elapsed = 0.0
+    camera_object.StartGrabbingMax(num_frames)
+    while camera_object.IsGrabbing():
+        with camera_object.RetrieveResult(5000, pylon.TimeoutHandling_ThrowException) as res:
+            start = time.perf_counter()
+            consume(res)
+            elapsed += time.perf_counter() - start
+    camera_object.StopGrabbing()
+    print(f"{name:>20s}: {1e6 * elapsed / num_frames:8.1f} us per frame")
+
+print(f"FramePool allocated {pool.allocations} buffers for {num_frames} frames")
+
+camera_object.Close()
@@ -0,0 +1,34 @@
+"""
+Compare the per-point overhead of the "single" and "continuous" grab modes on
+the emulated camera.
+
+    python benchmarks/bench_grab_modes.py
+"""
+import os
+import time
+from datetime import datetime
+
+import bluesky.plans as bp
+from bluesky.run_engine import RunEngine
+from ophyd.utils import make_dir_tree
+
+from ophyd_basler.basler_camera import BaslerCamera
+
+os.environ["PYLON_CAMEMU"] = "1"
+
+root_dir = "/tmp/basler"
+_ = make_dir_tree(datetime.now().year, base_path=root_dir)
+
+num_points = 100
+exposure_ms = 1
+
+RE = RunEngine({})
+camera = BaslerCamera(cam_num=0, root_dir=root_dir, name="basler_cam")
+camera.exposure_time.put(exposure_ms)
+
+for grab_mode in ("single", "continuous"):
+    camera.grab_mode.put(grab_mode)
+    start = time.perf_counter()
+    RE(bp.count([camera], num=num_points))
+    elapsed = time.perf_counter() - start
+    print(f"{grab_mode:>10s}: {1e3 * elapsed / num_points:8.2f} ms per point ({num_points} points)")
@@ -0,0 +1,65 @@
+"""
+Compare reading every frame of a few runs serially through
+``BaslerCamHDF5Handler`` against ``read_frames()`` with a thread pool.
+
+    python benchmarks/bench_parallel_reads.py
+"""
+import os
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from ophyd_basler.basler_handler import BaslerCamHDF5Handler, read_frames
+from ophyd_basler.compression import compression_options
+from ophyd_basler.custom_images import get_wandering_gaussian_beam
+
+num_files, num_frames, ny, nx = 4, 32, 1040, 1024
+workers = os.cpu_count()
+
+images = get_wandering_gaussian_beam(nf=num_frames, nx=nx, ny=ny, seed=6313448000)
+images = np.clip(16 * images, 0, 4095).astype(np.uint16)
+raw_mb = num_files * images.nbytes / 1e6
+
+# The frame cache would make the repeated reads free.
+BaslerCamHDF5Handler.frame_cache.max_bytes = 0
+
+print(f"{'codec':>14s} {'serial MB/s':>12s} {f'{workers} threads MB/s':>16s}")
+
+for codec, shuffle in (
+    ("gzip", "byte"),
+    ("lzf", "none"),
+    ("zstd", "byte"),
+    ("lz4", "byte"),
+    ("blosc-zstd", "bit"),
+    ("bitshuffle-lz4", "none"),
+):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filenames = []
+        for i in range(num_files):
+            filename = os.path.join(tmp_dir, f"images_{i}.h5")
+            with h5py.File(filename, "x") as f:
+                f.create_dataset(
+                    "/entry/image",
+                    data=images,
+                    chunks=(1, ny, nx),
+                    **compression_options(codec, level=5, shuffle=shuffle),
+                )
+            filenames.append(filename)
+
+        start = time.perf_counter()
+        for filename in filenames:
+            handler = BaslerCamHDF5Handler(filename)
+            for frame in range(num_frames):
+                handler(frame=frame)
+            handler.close()
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read_frames([(filename, frame) for filename in filenames for frame in range(num_frames)], workers=workers)
+        parallel_time = time.perf_counter() - start
+
+        BaslerCamHDF5Handler.file_pool.close()
+
+    print(f"{codec:>14s} {raw_mb / serial_time:12.1f} {raw_mb / parallel_time:16.1f}")
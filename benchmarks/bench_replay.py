@@ -0,0 +1,45 @@
+"""
+Measure the rate a recorded run is replayed at as fast as possible, with and
+without reading the frames ahead, for an uncompressed and an lzf-compressed
+recording.
+
+    python benchmarks/bench_replay.py
+"""
+import time
+from datetime import datetime
+
+import bluesky.plans as bp
+import numpy as np
+from bluesky.run_engine import RunEngine
+from ophyd.utils import make_dir_tree
+
+from ophyd_basler.custom_images import WanderingGaussianBeam
+from ophyd_basler.replay import ReplayBaslerCamera
+from ophyd_basler.simulation import SimulatedBaslerCamera
+
+root_dir = "/tmp/basler"
+_ = make_dir_tree(datetime.now().year, base_path=root_dir)
+
+num_frames = 200
+ny, nx = 1040, 1024
+
+frames = WanderingGaussianBeam(nf=64, nx=nx, ny=ny, seed=6313448000, dtype=np.uint8)[:]
+
+RE = RunEngine({})
+camera = SimulatedBaslerCamera(frames=frames, root_dir=root_dir, name="basler_cam")
+camera.exposure_time.put(0.01)
+
+for compression in ("none", "lzf"):
+    camera.compression.put(compression)
+    RE(bp.count([camera], num=num_frames))
+    recording = camera._data_file
+
+    for prefetch in (0, 4):
+        replay = ReplayBaslerCamera(source=recording, prefetch=prefetch, root_dir=root_dir, name="basler_cam")
+        replay.exposure_time.put(0.01)
+        replay.replay_speed.put(0)
+        replay.compression.put("none")
+        start = time.perf_counter()
+        RE(bp.count([replay], num=num_frames))
+        rate = num_frames / (time.perf_counter() - start)
+        print(f"{compression:>5s} recording, prefetching {prefetch} blocks: {rate:8.1f} frames/s")
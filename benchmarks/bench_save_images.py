@@ -0,0 +1,27 @@
+"""
+Compare writing emulator frames serially as PNG, as ``save_images()`` used
+to, against the parallel writers of each format.
+
+    python benchmarks/bench_save_images.py
+"""
+import os
+import tempfile
+import time
+
+import cv2
+
+from ophyd_basler.custom_images import IMAGE_FORMATS, WanderingGaussianBeam, save_images
+
+num_frames = 64
+beam = WanderingGaussianBeam(nf=num_frames, nx=1024, ny=1040, seed=6313448000)
+
+start = time.perf_counter()
+img_dir = tempfile.mkdtemp()
+for i, image in enumerate(beam):
+    cv2.imwrite(os.path.join(img_dir, "pattern_%03d.png" % i), image)
+print(f"{'serial png':>12s}: {(time.perf_counter() - start) / num_frames * 1e3:6.1f} ms per frame")
+
+for fmt in IMAGE_FORMATS:
+    start = time.perf_counter()
+    save_images(beam, fmt=fmt, workers=os.cpu_count())
+    print(f"{fmt:>12s}: {(time.perf_counter() - start) / num_frames * 1e3:6.1f} ms per frame")
@@ -0,0 +1,51 @@
+"""
+Measure the frame rate the storage, statistics and document pipeline sustains,
+with the simulated camera producing full frames as fast as they are retrieved.
+
+    python benchmarks/bench_simulated_camera.py
+"""
+import time
+from datetime import datetime
+
+import bluesky.plans as bp
+import bluesky.preprocessors as bpp
+import numpy as np
+from bluesky.run_engine import RunEngine
+from ophyd.utils import make_dir_tree
+
+from ophyd_basler.custom_images import WanderingGaussianBeam
+from ophyd_basler.simulation import SimulatedBaslerCamera
+from ophyd_basler.stats import STATS
+
+root_dir = "/tmp/basler"
+_ = make_dir_tree(datetime.now().year, base_path=root_dir)
+
+num_frames = 200
+ny, nx = 1040, 1024
+
+# Held in memory, so that producing a frame costs nothing.
+frames = WanderingGaussianBeam(nf=64, nx=nx, ny=ny, seed=6313448000, dtype=np.uint8)[:]
+
+RE = RunEngine({})
+camera = SimulatedBaslerCamera(frames=frames, root_dir=root_dir, name="basler_cam")
+camera.exposure_time.put(0.01)
+camera.fly_num_frames.put(num_frames)
+
+for label, compression, stats in (
+    ("uncompressed", "none", ()),
+    ("lzf", "lzf", ()),
+    ("lzf, all stats", "lzf", STATS),
+):
+    camera.compression.put(compression)
+    camera.stats.enabled.put(stats)
+    for grab_mode in ("single", "continuous"):
+        camera.grab_mode.put(grab_mode)
+        start = time.perf_counter()
+        RE(bp.count([camera], num=num_frames))
+        rate = num_frames / (time.perf_counter() - start)
+        print(f"{label:>16s}, {grab_mode:>10s} count: {rate:8.1f} frames/s")
+    camera.grab_mode.put("single")
+    start = time.perf_counter()
+    RE(bpp.stage_wrapper(bp.fly([camera]), [camera]))
+    rate = num_frames / (time.perf_counter() - start)
+    print(f"{label:>16s}, {'fly':>16s}: {rate:8.1f} frames/s")
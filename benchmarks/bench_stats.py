@@ -0,0 +1,49 @@
+"""
+Measure the per-frame cost of each statistic of ``compute_stats()``, and of
+all of them together, for the common pixel formats, then the cost of
+``compute_roi_stats()`` as regions of interest are added.
+
+    python benchmarks/bench_stats.py
+"""
+import time
+
+import numpy as np
+
+from ophyd_basler.stats import STATS, compute_roi_stats, compute_stats
+
+shape = (1024, 1280)
+num_frames = 50
+
+rng = np.random.default_rng(0)
+
+for dtype in (np.uint8, np.uint16):
+    frames = rng.integers(0, np.iinfo(dtype).max, size=(num_frames, *shape), dtype=dtype)
+    print(f"{np.dtype(dtype).name} frames of {shape[0]}x{shape[1]} pixels:")
+
+    start = time.perf_counter()
+    for frame in frames:
+        frame.mean()
+    print(f"{'mean':>12s}: {1e3 * (time.perf_counter() - start) / num_frames:6.2f} ms per frame")
+
+    for stats in [(name,) for name in STATS] + [STATS]:
+        start = time.perf_counter()
+        for frame in frames:
+            compute_stats(frame, stats)
+        label = stats[0] if len(stats) == 1 else "all"
+        print(f"{label:>12s}: {1e3 * (time.perf_counter() - start) / num_frames:6.2f} ms per frame")
+
+frames = rng.integers(0, 256, size=(num_frames, *shape), dtype=np.uint8)
+print(f"regions of interest of uint8 frames of {shape[0]}x{shape[1]} pixels:")
+for num_rois in (1, 2, 4, 8, 16, 32):
+    rois = {
+        f"roi{i}": (int(x), int(y), 128, 96)
+        for i, (x, y) in enumerate(
+            zip(rng.integers(0, shape[1] - 128, num_rois), rng.integers(0, shape[0] - 96, num_rois))
+        )
+    }
+    # One region spanning the frame, as a background region would.
+    rois["background"] = (0, 0, shape[1], shape[0])
+    start = time.perf_counter()
+    for frame in frames:
+        compute_roi_stats(frame, rois)
+    print(f"{num_rois + 1:>8d} ROIs: {1e3 * (time.perf_counter() - start) / num_frames:6.2f} ms per frame")
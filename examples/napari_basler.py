@@ -13,7 +13,7 @@ emulated_basler_camera = BaslerCamera(cam_num=0, verbose=True, name="basler_cam"
 
 # Generate images:
 ny, nx = emulated_basler_camera.image_shape.get()
-WGB = get_wandering_gaussian_beam(nf=256, nx=nx, ny=ny, seed=6313448000)  # noqa: F821
+WGB = WanderingGaussianBeam(nf=256, nx=nx, ny=ny, seed=6313448000)  # noqa: F821
 emulated_basler_camera.set_custom_images(WGB)
 emulated_basler_camera.exposure_time.put(10)  # in [ms]
 
@@ -13,7 +13,7 @@ from ophyd.utils import make_dir_tree
 import ophyd_basler
 from ophyd_basler.basler_camera import BaslerCamera  # noqa: F401
 from ophyd_basler.basler_handler import BaslerCamHDF5Handler
-from ophyd_basler.custom_images import get_wandering_gaussian_beam  # noqa: F401
+from ophyd_basler.custom_images import WanderingGaussianBeam, get_wandering_gaussian_beam  # noqa: F401
 from ophyd_basler.utils import configure_logger, logger_basler, plot_images  # noqa: F401
 
 plt.ion()
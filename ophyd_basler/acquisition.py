@@ -0,0 +1,391 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from pypylon import pylon
+
+from .utils import logger_basler as logger
+
+
+class FramePool:
+    """
+    A pool of NumPy frame buffers that are recycled between frames.
+
+    Frames are copied once, straight from the zero-copy view of a pylon grab
+    result, into a free buffer of the pool, so the grab result can be released
+    to pylon right away. The buffer goes back to the pool with ``release()``
+    once its data has been consumed.
+
+    Parameters
+    ----------
+    size : int
+        the maximum number of free buffers kept for reuse; buffers of
+        different shapes and dtypes can share the pool.
+    """
+
+    def __init__(self, size=4):
+        self._size = size
+        self._free = []
+        self._lock = threading.Lock()
+        self._allocations = 0
+
+    @property
+    def allocations(self):
+        """The number of buffers allocated so far."""
+        return self._allocations
+
+    def take(self, shape, dtype):
+        """
+        Take a free buffer of the given shape and dtype out of the pool,
+        allocating one if there is none.
+        """
+        with self._lock:
+            for i in range(len(self._free) - 1, -1, -1):
+                if self._free[i].shape == shape and self._free[i].dtype == dtype:
+                    return self._free.pop(i)
+            self._allocations += 1
+        return np.empty(shape, dtype=dtype)
+
+    def fill(self, grab_result):
+        """
+        Copy the image of a grab result into a buffer of the pool and return it.
+        """
+        with grab_result.GetArrayZeroCopy() as array:
+            buffer = self.take(array.shape, array.dtype)
+            np.copyto(buffer, array)
+        return buffer
+
+    def release(self, buffer):
+        """
+        Return a buffer to the pool.
+        """
+        with self._lock:
+            self._free.append(buffer)
+            # Evict the least recently released buffers, so that buffers of a stale shape or dtype do not linger.
+            del self._free[: max(len(self._free) - self._size, 0)]
+
+
+ACCUMULATE_MODES = ("sum", "mean", "max")
+
+
+def accumulated_dtype(mode, dtype):
+    """
+    Returns the dtype of frames of the given dtype accumulated with ``mode``:
+    a wide unsigned integer for sums, float32 for means, and the frame dtype
+    for maxima.
+    """
+    if mode not in ACCUMULATE_MODES:
+        raise ValueError(f"Unknown accumulate mode {mode!r}, expected one of {ACCUMULATE_MODES}.")
+    dtype = np.dtype(dtype)
+    if mode == "max":
+        return dtype
+    if mode == "mean":
+        return np.dtype(np.float32)
+    return np.dtype(np.uint32) if dtype.itemsize <= 2 else np.dtype(np.uint64)
+
+
+class FrameAccumulator:
+    """
+    Accumulates frames into a single frame, as their sum, mean or maximum.
+
+    Each frame is folded into the accumulator with a single ufunc call, so it
+    can be added straight from the zero-copy view of a grab result. Sums are
+    accumulated in a wide integer type, e.g. uint32 for Mono8 and Mono12.
+
+    Parameters
+    ----------
+    mode : str
+        one of ``ACCUMULATE_MODES``.
+    pool : FramePool
+        if given, the accumulator and result buffers are taken from the pool.
+    """
+
+    def __init__(self, mode, pool=None):
+        if mode not in ACCUMULATE_MODES:
+            raise ValueError(f"Unknown accumulate mode {mode!r}, expected one of {ACCUMULATE_MODES}.")
+        self._mode = mode
+        self._pool = pool
+        self._buffer = None
+        self._count = 0
+
+    @property
+    def count(self):
+        """The number of frames accumulated so far."""
+        return self._count
+
+    def _take(self, shape, dtype):
+        if self._pool is not None:
+            return self._pool.take(shape, dtype)
+        return np.empty(shape, dtype=dtype)
+
+    def add(self, frame):
+        """
+        Fold a frame into the accumulator.
+        """
+        if self._buffer is None:
+            dtype = frame.dtype if self._mode == "max" else accumulated_dtype("sum", frame.dtype)
+            self._buffer = self._take(frame.shape, dtype)
+            np.copyto(self._buffer, frame)
+        elif self._mode == "max":
+            np.maximum(self._buffer, frame, out=self._buffer)
+        else:
+            np.add(self._buffer, frame, out=self._buffer)
+        self._count += 1
+
+    def result(self):
+        """
+        Returns the accumulated frame, and resets the accumulator.
+
+        With a pool, the returned frame is a buffer of the pool.
+        """
+        if not self._count:
+            raise RuntimeError("No frame was accumulated.")
+        buffer, count = self._buffer, self._count
+        self._buffer = None
+        self._count = 0
+        if self._mode != "mean":
+            return buffer
+
+        mean = self._take(buffer.shape, np.float32)
+        np.multiply(buffer, np.float32(1 / count), out=mean)
+        if self._pool is not None:
+            self._pool.release(buffer)
+        return mean
+
+    def reset(self):
+        """
+        Discards the frames accumulated so far, returning the buffer to the pool.
+        """
+        if self._buffer is not None and self._pool is not None:
+            self._pool.release(self._buffer)
+        self._buffer = None
+        self._count = 0
+
+
+class ContinuousGrabber:
+    """
+    A persistent pylon grab loop running on a background thread.
+
+    The grab loop keeps the most recent frames in a bounded ring buffer, so
+    that a trigger only has to claim a frame instead of setting up and tearing
+    down the stream for every point.
+
+    Parameters
+    ----------
+    camera_object : pylon.InstantCamera
+        an opened camera object.
+    buffer_size : int
+        the maximum number of frames kept in the ring buffer; the oldest
+        frames are dropped when it is full.
+    timeout : float
+        the timeout of a single ``RetrieveResult`` call, in milliseconds.
+    on_frame : callable
+        if given, called as ``on_frame(frame_number, timestamp, image)`` on the
+        grab thread for every frame instead of storing it in the ring buffer,
+        so that no frame can be dropped.
+    pool : FramePool
+        if given, frames are copied into buffers of the pool; frames dropped
+        from the ring buffer or skipped by ``claim()`` are returned to it.
+    software_trigger : bool
+        if True, the frame start trigger of the camera is set to software
+        triggering while the grab loop runs, for ``software_trigger()``; the
+        previous trigger settings are restored by ``stop()``.
+    """
+
+    # The trigger of each frame, fired by software while the grab loop runs.
+    _SOFTWARE_TRIGGER = (("TriggerSelector", "FrameStart"), ("TriggerMode", "On"), ("TriggerSource", "Software"))
+
+    def __init__(
+        self, camera_object, buffer_size=16, timeout=5000, on_frame=None, pool=None, software_trigger=False
+    ):
+        self._camera_object = camera_object
+        self._frames = deque()
+        self._buffer_size = buffer_size
+        self._timeout = timeout
+        self._on_frame = on_frame
+        self._pool = pool
+        self._software_trigger = software_trigger
+        self._trigger_settings = None
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._error = None
+        self._frame_count = 0  # the number of frames received since start()
+        self._dropped = 0
+        self._skipped = 0
+
+    @property
+    def frame_count(self):
+        return self._frame_count
+
+    @property
+    def dropped(self):
+        """The number of frames that were pushed out of the ring buffer before being claimed."""
+        return self._dropped
+
+    @property
+    def skipped(self):
+        """The number of frames the camera reported as skipped because no grab buffer was free."""
+        return self._skipped
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, max_frames=None):
+        """
+        Start grabbing, either indefinitely or for ``max_frames`` frames.
+        """
+        if self.is_running():
+            raise RuntimeError("The grab loop is already running.")
+
+        self._frames.clear()
+        self._frame_count = 0
+        self._dropped = 0
+        self._skipped = 0
+        self._error = None
+        self._stop_event.clear()
+
+        if self._software_trigger:
+            self._trigger_settings = []
+            for feature, value in self._SOFTWARE_TRIGGER:
+                node = getattr(self._camera_object, feature)
+                self._trigger_settings.append((node, node.GetValue()))
+                node.SetValue(value)
+
+        if max_frames is None:
+            self._camera_object.StartGrabbing()
+        else:
+            self._camera_object.StartGrabbingMax(max_frames)
+
+        self._thread = threading.Thread(target=self._run, name="basler-grab-loop", daemon=True)
+        self._thread.start()
+        logger.debug(f"started the grab loop ({max_frames = })")
+
+    def stop(self):
+        """
+        Stop the grab loop and wait for the background thread to finish.
+        """
+        self._stop_event.set()
+        if self._camera_object.IsGrabbing():
+            self._camera_object.StopGrabbing()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._condition:
+            while self._frames:
+                self._discard(self._frames.popleft())
+            self._condition.notify_all()
+        if self._trigger_settings is not None:
+            # Restore the trigger settings in the reverse order, as the selector selects the others.
+            for node, value in reversed(self._trigger_settings):
+                node.SetValue(value)
+            self._trigger_settings = None
+        logger.debug(f"stopped the grab loop after {self._frame_count} frames ({self._dropped} dropped)")
+
+    def wait(self, timeout=None):
+        """
+        Wait for a finite grab started with ``start(max_frames=...)`` to end,
+        and re-raise the error of the grab loop, if any.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                raise TimeoutError(f"The grab loop did not finish within {timeout} s.")
+        if self._error is not None:
+            raise RuntimeError("The grab loop failed") from self._error
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set() and self._camera_object.IsGrabbing():
+                with self._camera_object.RetrieveResult(self._timeout, pylon.TimeoutHandling_Return) as res:
+                    if not res.IsValid():
+                        continue
+                    if not res.GrabSucceeded():
+                        logger.warning(f"failed to grab a frame: {res.GetErrorDescription()}")
+                        continue
+                    self._skipped += res.GetNumberOfSkippedImages()
+                    image = self._pool.fill(res) if self._pool is not None else np.array(res.Array)
+                if self._on_frame is not None:
+                    self._on_frame(self._frame_count, time.time(), image)
+                    self._frame_count += 1
+                else:
+                    self._append(image, time.time())
+        except Exception as e:
+            if not self._stop_event.is_set():
+                logger.exception("the grab loop failed")
+                self._error = e
+        finally:
+            with self._condition:
+                self._condition.notify_all()
+
+    def _discard(self, frame):
+        if self._pool is not None:
+            self._pool.release(frame[2])
+
+    def _append(self, image, timestamp):
+        with self._condition:
+            if len(self._frames) == self._buffer_size:
+                self._dropped += 1
+                self._discard(self._frames.popleft())
+            self._frames.append((self._frame_count, timestamp, image))
+            self._frame_count += 1
+            self._condition.notify_all()
+
+    def claim(self, after=None, timeout=None):
+        """
+        Claim a frame from the ring buffer.
+
+        The claimed frame, and any older frames, are removed from the ring
+        buffer; with a pool, the claimed image must be released by the caller.
+
+        Parameters
+        ----------
+        after : int
+            the first frame number that can be claimed; by default, only
+            frames received after this call are considered fresh.
+        timeout : float
+            how long to wait for a fresh frame, in seconds.
+
+        Returns
+        -------
+        (frame_number, timestamp, image)
+        """
+        with self._condition:
+            if after is None:
+                after = self._frame_count
+
+            def _ready():
+                return (
+                    self._error is not None
+                    or not self.is_running()
+                    or (self._frames and self._frames[-1][0] >= after)
+                )
+
+            if not self._condition.wait_for(_ready, timeout=timeout):
+                raise TimeoutError(f"No fresh frame received within {timeout} s.")
+            if self._error is not None:
+                raise RuntimeError("The grab loop failed") from self._error
+
+            while self._frames:
+                frame = self._frames.popleft()
+                if frame[0] >= after:
+                    return frame
+                self._discard(frame)
+
+            raise RuntimeError("The grab loop stopped before a fresh frame was received.")
+
+    def software_trigger(self, timeout=None):
+        """
+        Wait for the camera to be ready for a frame trigger, fire a software
+        trigger, and wait for the frame it produces.
+        """
+        if not self._software_trigger:
+            raise RuntimeError("The grab loop was not started for software triggering.")
+        ready_timeout = self._timeout if timeout is None else int(1e3 * timeout)
+        if not self._camera_object.WaitForFrameTriggerReady(ready_timeout, pylon.TimeoutHandling_Return):
+            raise TimeoutError(f"The camera was not ready for a frame trigger within {ready_timeout} ms.")
+        with self._condition:
+            after = self._frame_count
+        self._camera_object.ExecuteSoftwareTrigger()
+        return self.claim(after=after, timeout=timeout)
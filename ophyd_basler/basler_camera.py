@@ -1,26 +1,36 @@
 import datetime
-import itertools
+import hashlib
 import os
+import threading
 import warnings
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import h5py
 import numpy as np
 from event_model import compose_resource
 from ophyd import Component as Cpt
-from ophyd import Device, Signal
-from ophyd.sim import NullStatus, new_uid
+from ophyd import Device, DeviceStatus, Signal
+from ophyd.sim import new_uid
 from pypylon import pylon
 
 from . import ExternalFileReference, available_devices
-from .custom_images import save_images
+from .acquisition import ContinuousGrabber, FrameAccumulator, FramePool, accumulated_dtype
+from .compression import ChunkCompressor, compression_options
+from .corrections import FrameCorrection, average_frames
+from .custom_images import ImageCache, save_images
+from .stats import ROIPlugin, StatsPlugin
 from .utils import logger_basler as logger
+from .utils import pixel_format_channels, pixel_format_dtype
+from .writer import FrameWriter
 
 
 class BaslerCamera(Device):
     image = Cpt(ExternalFileReference, kind="normal")
     mean = Cpt(Signal, kind="hinted")
+    stats = Cpt(StatsPlugin, kind="normal")  # select the statistics with stats.enabled
+    rois = Cpt(ROIPlugin, kind="normal")  # set the regions of interest with rois.set_rois()
     exposure_time = Cpt(Signal, value=1000, kind="config")  # exposure time, in milliseconds
     user_defined_name = Cpt(Signal, kind="config")
     camera_model = Cpt(Signal, kind="config")
@@ -31,6 +41,25 @@ class BaslerCamera(Device):
     active_format = Cpt(Signal, kind="config")
     payload_size = Cpt(Signal, kind="config")
     grab_timeout = Cpt(Signal, value=5000, kind="config")
+    grab_mode = Cpt(Signal, value="single", kind="config")  # "single" or "continuous"
+    frame_buffer_size = Cpt(Signal, value=16, kind="config")
+    fly_num_frames = Cpt(Signal, value=100, kind="config")
+    compression = Cpt(Signal, value="lzf", kind="config")  # one of ophyd_basler.compression.CODECS
+    compression_level = Cpt(Signal, value=5, kind="config")
+    compression_shuffle = Cpt(Signal, value="none", kind="config")  # "none", "byte" or "bit"
+    compression_workers = Cpt(Signal, value=0, kind="config")  # > 0 to pre-compress chunks in parallel
+    write_queue_size = Cpt(Signal, value=16, kind="config")
+    frames_per_run = Cpt(Signal, value=0, kind="config")  # 0 if unknown
+    frames_per_trigger = Cpt(Signal, value=1, kind="config")  # frames accumulated into each datum
+    accumulate_mode = Cpt(Signal, value="sum", kind="config")  # "sum", "mean" or "max"
+    swmr = Cpt(Signal, value=False, kind="config")  # single-writer/multiple-reader HDF5 mode
+    correction_enabled = Cpt(Signal, value=True, kind="config")  # apply the loaded dark and flat frames
+    correct_stored = Cpt(Signal, value=False, kind="config")  # store the corrected frames, as float32
+    dark_source = Cpt(Signal, value="", kind="config")
+    flat_source = Cpt(Signal, value="", kind="config")
+    write_queue_depth = Cpt(Signal, value=0, kind="omitted")
+    write_queue_high_water = Cpt(Signal, value=0, kind="omitted")
+    fly_skipped_frames = Cpt(Signal, value=0, kind="config")  # frames the camera skipped during the last fly scan
 
     def __init__(
         self,
@@ -41,14 +70,28 @@ class BaslerCamera(Device):
         pixel_format="Mono8",
         trigger_mode="Off",
         verbose=False,
+        rois=None,
+        camera_object=None,
         **kwargs,
     ):
         """
         A class to instantiate a Basler ophyd object.
+
+        ``rois`` optionally names rectangular regions of interest, as
+        {name: (x, y, width, height)}, see ``ophyd_basler.stats.ROIPlugin``.
+
+        ``camera_object`` optionally replaces the pylon camera, e.g. with an
+        ``ophyd_basler.simulation.SimulatedCamera``; ``cam_num`` and
+        ``cam_name`` are then ignored.
         """
         super().__init__(*args, **kwargs)
 
-        if cam_name is not None:
+        if rois:
+            self.rois.set_rois(rois)
+
+        if camera_object is not None:
+            self._cam_num = None
+        elif cam_name is not None:
             basler_device_metadata, _ = available_devices()
             if cam_name in basler_device_metadata.user_defined_name.values:
                 self._cam_num = np.where(basler_device_metadata.user_defined_name.values == cam_name)[0][0]
@@ -65,16 +108,51 @@ class BaslerCamera(Device):
         # Used for the emulated cameras only.
         self._img_dir = None
 
+        # The HDF5 file and dataset, open while staged.
+        self._h5file_desc = None
+        self._dataset = None
+
         # Resource/datum docs related variables.
         self._asset_docs_cache = deque()
         self._resource_document = None
         self._datum_factory = None
 
-        transport_layer_factory = pylon.TlFactory.GetInstance()
-        device_info_list = transport_layer_factory.EnumerateDevices()
-        self.device_info = device_info_list[self._cam_num]
-        self.device = transport_layer_factory.CreateDevice(self.device_info)
-        self.camera_object = pylon.InstantCamera(self.device)
+        # The background grab loop, only used in the "continuous" grab mode.
+        self._grabber = None
+
+        # A single worker keeps the frames in trigger order.
+        self._executor = None
+
+        # Recycled frame buffers, allocated while staged.
+        self._frame_pool = None
+
+        # Events of the frames acquired during a fly scan.
+        self._fly_events = deque()
+        self._fly_error = None
+        self._fly_acquisition_mode = None
+
+        # The background HDF5 writer, running while staged.
+        self._writer = None
+
+        # The acquisition mode of the camera before it was staged, restored when unstaged.
+        self._acquisition_mode = None
+
+        # The dark/flat correction, and whether it is applied to the frames while staged.
+        self._correction = FrameCorrection()
+        self._correcting = False
+        self._store_corrected = False
+        self._correction_buffer = None
+
+        if camera_object is not None:
+            self.device_info = camera_object.GetDeviceInfo()
+            self.device = None
+            self.camera_object = camera_object
+        else:
+            transport_layer_factory = pylon.TlFactory.GetInstance()
+            device_info_list = transport_layer_factory.EnumerateDevices()
+            self.device_info = device_info_list[self._cam_num]
+            self.device = transport_layer_factory.CreateDevice(self.device_info)
+            self.camera_object = pylon.InstantCamera(self.device)
 
         # Temporarily open the camera to read the metadata
         self.camera_object.Open()
@@ -85,12 +163,13 @@ class BaslerCamera(Device):
         self.image_shape.put((self.camera_object.Height(), self.camera_object.Width()))
         self.pixel_level_min.put(self.camera_object.PixelDynamicRangeMin())
         self.pixel_level_max.put(self.camera_object.PixelDynamicRangeMax())
-        self.active_format.put(self.camera_object.PixelFormat.GetValue())
-        self.payload_size.put(self.camera_object.PayloadSize())
 
         self.camera_object.TriggerMode.SetValue(self._trigger_mode)
         self.camera_object.PixelFormat.SetValue(self._pixel_format)
 
+        self.active_format.put(self.camera_object.PixelFormat.GetValue())
+        self.payload_size.put(self.camera_object.PayloadSize())
+
         self.camera_object.Close()
 
         if self._verbose:
@@ -105,7 +184,7 @@ class BaslerCamera(Device):
             print(f"Trigger mode                : {self._trigger_mode}")
             print(f"GigE transport payload size : {self.payload_size.get():,} bytes")
 
-    def set_custom_images(self, images=None, img_dir=None):
+    def set_custom_images(self, images=None, img_dir=None, fmt="png", cache=True):
         """
         Set custom images for the emulated camera either via an ndarray or a
         directory with images.
@@ -113,9 +192,15 @@ class BaslerCamera(Device):
         Parameters
         ----------
         images : ndarray
-            an ndarray of the image data the images shaped as (num_frames, ny, nx)
+            an ndarray of the image data the images shaped as (num_frames, ny, nx),
+            or a sequence of frames such as a ``WanderingGaussianBeam``
         img_dir : str
             a directory name with a series of image files.
+        fmt : str
+            the format the images are saved in, see ``save_images()``.
+        cache : bool or ImageCache
+            whether to reuse the directory of identical images saved before,
+            see ``ImageCache``; True uses the default cache.
         """
 
         if images is None and img_dir is None:
@@ -126,7 +211,12 @@ class BaslerCamera(Device):
                 "passed."
             )
         if images is not None:
-            img_dir = save_images(images)
+            if cache is True:
+                cache = ImageCache()
+            if cache:
+                img_dir = cache.save_images(images, fmt=fmt)
+            else:
+                img_dir = save_images(images, fmt=fmt)
 
         elif img_dir is not None:
             logger.info(f"Using '{img_dir}' with the existing {len(os.listdir(img_dir))} images.")
@@ -140,59 +230,363 @@ class BaslerCamera(Device):
         self.camera_object.PixelFormat = (
             "Mono8"  # choose one pixel format; camera emulation does conversion on the fly
         )
+        self.active_format.put(self.camera_object.PixelFormat.GetValue())
 
         self.camera_object.Close()
 
+    def load_calibration(self, calibration, source):
+        """
+        Load the dark or flat frame used to correct the frames, from the next
+        time the camera is staged.
+
+        Parameters
+        ----------
+        calibration : str
+            "dark" or "flat".
+        source : str or ndarray
+            the frame, or a BASLER_CAM_HDF5 file whose frames are averaged,
+            e.g. the file of a previous run; None clears the calibration. A
+            frame is recorded as "array:<blake2b digest>:<shape>:<dtype>".
+        """
+        if source is None:
+            frame, label = None, ""
+        elif isinstance(source, (str, os.PathLike)):
+            frame, label = average_frames(source), str(source)
+        else:
+            frame = np.ascontiguousarray(source)
+            digest = hashlib.blake2b(frame.data, digest_size=16).hexdigest()
+            label = f"array:{digest}:{'x'.join(map(str, frame.shape))}:{frame.dtype}"
+        self._correction.set(calibration, frame)
+        getattr(self, f"{calibration}_source").put(label)
+
     def grab_image(self):
-        self.camera_object.StartGrabbingMax(1)
+        """
+        Grab a frame, accumulated over ``frames_per_trigger`` frames.
 
-        while self.camera_object.IsGrabbing():
-            with self.camera_object.RetrieveResult(
-                self.grab_timeout.get(), pylon.TimeoutHandling_ThrowException
-            ) as res:
-                if res.GrabSucceeded():
-                    image = np.array(res.Array)
-                else:
-                    raise Exception("Could not grab image with pylon")
+        In the "continuous" grab mode, the frames are claimed from the grab
+        loop started in ``stage()`` (firing a software trigger first for each
+        frame if the camera is in the software trigger mode). Otherwise, a grab
+        of ``frames_per_trigger`` frames is started and stopped around the call.
 
-        self.camera_object.StopGrabbing()
+        Several frames are folded as they arrive into their sum, mean or
+        maximum, depending on ``accumulate_mode``.
 
-        logger.debug(f"grabbed a frame with the shape {image.shape}")
-        logger.debug(f"{np.where(image.max()) = }  |  {image.max() = }")
-        return image
+        While staged, the image is a buffer borrowed from the frame pool; it is
+        returned to the pool once the frame has been committed.
+        """
+        num_frames = self.frames_per_trigger.get()
+        accumulator = None
+        if num_frames > 1:
+            accumulator = FrameAccumulator(self.accumulate_mode.get(), pool=self._frame_pool)
+
+        try:
+            if self._grabber is not None:
+                timeout = 1e-3 * self.grab_timeout.get()
+                after = None
+                for _ in range(num_frames):
+                    if self._trigger_mode == "On":
+                        frame_number, _, image = self._grabber.software_trigger(timeout=timeout)
+                    else:
+                        frame_number, _, image = self._grabber.claim(after=after, timeout=timeout)
+                    after = frame_number + 1
+                    if accumulator is not None:
+                        try:
+                            accumulator.add(image)
+                        finally:
+                            self._frame_pool.release(image)
+                if accumulator is not None:
+                    image = accumulator.result()
+                logger.debug(f"claimed {num_frames} frames with the shape {image.shape}")
+                return image
+
+            self.camera_object.StartGrabbingMax(num_frames)
+
+            while self.camera_object.IsGrabbing():
+                with self.camera_object.RetrieveResult(
+                    self.grab_timeout.get(), pylon.TimeoutHandling_ThrowException
+                ) as res:
+                    if not res.GrabSucceeded():
+                        raise Exception("Could not grab image with pylon")
+                    if accumulator is not None:
+                        with res.GetArrayZeroCopy() as array:
+                            accumulator.add(array)
+                    else:
+                        image = self._frame_pool.fill(res) if self._frame_pool is not None else np.array(res.Array)
+
+            self.camera_object.StopGrabbing()
+
+            if accumulator is not None:
+                image = accumulator.result()
+            logger.debug(f"grabbed {num_frames} frames with the shape {image.shape}")
+            return image
+        finally:
+            if accumulator is not None:
+                # Return the buffer of a partial accumulation to the pool, if a grab failed.
+                accumulator.reset()
 
     def trigger(self):
+        """
+        Start acquiring a frame and return immediately.
+
+        The frame is grabbed, written and reduced on a worker thread; the
+        returned status finishes once the frame is committed to the file, or
+        carries the exception if any of these steps fail.
+        """
         logger.debug("started trigger")
 
         super().trigger()
-        logger.debug("started grabbing")
-        image = self.grab_image()
+        status = DeviceStatus(self)
+        self._executor.submit(self._acquire, status)
+
+        return status
+
+    def _acquire(self, status):
+        try:
+            logger.debug("started grabbing")
+            image, mean, reductions = self._reduce(self.grab_image())
+
+            def _committed(datum_document, error):
+                if error is not None:
+                    status.set_exception(error)
+                    return
+                self.image.put(datum_document["datum_id"])
+                self.mean.put(mean)
+                for signal, value in reductions.items():
+                    signal.put(value)
+                logger.debug("finisihed trigger")
+                status.set_finished()
+
+            self._commit_frame(image, _committed)
+        except Exception as e:
+            logger.exception("failed to acquire a frame")
+            status.set_exception(e)
+
+    def _reduce(self, image):
+        """
+        Apply the dark/flat correction to a frame, and compute its mean,
+        statistics and region statistics from the corrected frame.
 
-        current_frame = next(self._counter)
+        Returns
+        -------
+        (image to store, mean, {signal: value})
+        """
+        corrected = image
+        if self._correcting:
+            if self._store_corrected:
+                # The corrected frame is stored instead of the raw frame, which can go back to the pool.
+                corrected = self._correction(image, out=self._frame_pool.take(image.shape, np.float32))
+                self._frame_pool.release(image)
+                image = corrected
+            else:
+                if self._correction_buffer is None or self._correction_buffer.shape != image.shape:
+                    self._correction_buffer = np.empty(image.shape, dtype=np.float32)
+                corrected = self._correction(image, out=self._correction_buffer)
+        return image, corrected.mean(), {**self.stats.compute(corrected), **self.rois.compute(corrected)}
 
-        logger.debug(f"finisihed grabbing frame {current_frame}")
-        logger.debug(f"original shape: {image.shape}")
+    def _commit_frame(self, image, callback):
+        """
+        Queue a frame for writing into the HDF5 dataset.
 
-        self._dataset.resize((current_frame + 1, *self.image_shape.get()))
+        Once the frame is written, its datum document is cached, the image is
+        returned to the frame pool, and ``callback(datum_document, error)`` is
+        called on the writer thread. No datum is emitted for a frame that
+        failed to be written.
+        """
 
-        logger.debug(f"{self._dataset = }\n{self._dataset.shape = }")
+        def _written(index, error):
+            self._frame_pool.release(image)
+            if error is not None:
+                callback(None, error)
+                return
 
-        self._dataset[current_frame, :, :] = image
+            logger.debug(f"wrote frame {index}")
+            datum_document = self._datum_factory(datum_kwargs={"frame": index})
+            self._asset_docs_cache.append(("datum", datum_document))
+            callback(datum_document, None)
 
-        datum_document = self._datum_factory(datum_kwargs={"frame": current_frame})
-        self._asset_docs_cache.append(("datum", datum_document))
+        self._writer.submit(image, _written, timeout=1e-3 * self.grab_timeout.get())
 
-        self.image.put(datum_document["datum_id"])
-        self.mean.put(image.mean())
+    def num_points_hint(self, name, doc):
+        """
+        A RunEngine callback preallocating the dataset from the ``num_points``
+        hint of the start document, e.g. ``RE.subscribe(camera.num_points_hint)``.
+        """
+        if name == "start" and self._writer is not None and "num_points" in doc:
+            self._writer.reserve(doc["num_points"])
 
-        super().trigger()
+    def _update_write_queue(self, depth, high_water):
+        self.write_queue_depth.put(depth)
+        self.write_queue_high_water.put(high_water)
+
+    def kickoff(self):
+        """
+        Start a burst of ``fly_num_frames`` frames.
+
+        The burst is free-running or hardware-triggered, depending on the
+        trigger mode and source configured on the camera. Every frame is
+        written to the file from the grab thread as soon as it arrives, and
+        its event is cached for ``collect()``. The frames are not
+        accumulated, so ``frames_per_trigger`` must be 1.
+        """
+        if self._writer is None:
+            raise RuntimeError("stage() must be called before kickoff().")
+        if self.frames_per_trigger.get() > 1:
+            # The file was created for accumulated frames, while a burst stores the raw frames.
+            raise RuntimeError("Fly scans do not accumulate frames, set frames_per_trigger to 1.")
+        if self._grabber is not None:
+            raise RuntimeError("Cannot kick off a fly scan while the continuous grab loop is running.")
+
+        num_frames = self.fly_num_frames.get()
+
+        self._fly_events = deque()
+        self._fly_error = None
+        self.fly_skipped_frames.put(0)
+        self._writer.reserve(self._writer.num_submitted + num_frames)
+        self._fly_acquisition_mode = self.camera_object.AcquisitionMode.GetValue()
+        self.camera_object.AcquisitionMode.SetValue("Continuous")
+        self.camera_object.MaxNumBuffer.SetValue(
+            max(self.camera_object.MaxNumBuffer.GetValue(), self.frame_buffer_size.get())
+        )
+
+        self._grabber = ContinuousGrabber(
+            self.camera_object,
+            timeout=self.grab_timeout.get(),
+            on_frame=self._fly_frame,
+            pool=self._frame_pool,
+        )
+        self._grabber.start(max_frames=num_frames)
+
+        status = DeviceStatus(self)
+        status.set_finished()
+        return status
+
+    def _fly_frame(self, frame_number, timestamp, image):
+        image, mean, reductions = self._reduce(image)
+        reductions = {signal.name: value for signal, value in reductions.items()}
+
+        def _committed(datum_document, error):
+            if error is not None:
+                self._fly_error = error
+                return
+            data = {self.image.name: datum_document["datum_id"], self.mean.name: mean, **reductions}
+            self._fly_events.append(
+                {
+                    "time": timestamp,
+                    "data": data,
+                    "timestamps": {key: timestamp for key in data},
+                    "filled": {self.image.name: False},
+                }
+            )
 
-        logger.debug("finisihed trigger")
+        self._commit_frame(image, _committed)
 
-        return NullStatus()
+    def complete(self):
+        """
+        Return a status that finishes when the burst started in ``kickoff()`` is
+        over, and fails if any of its frames was not received, written, or was
+        skipped by the camera; the number of skipped frames is recorded in
+        ``fly_skipped_frames``.
+        """
+        if self._grabber is None:
+            raise RuntimeError("kickoff() must be called before complete().")
+
+        grabber = self._grabber
+        num_frames = self.fly_num_frames.get()
+        status = DeviceStatus(self)
+
+        def _wait():
+            try:
+                grabber.wait()
+                # Only report the burst complete once all of its frames are on disk.
+                self._writer.flush()
+                if self._fly_error is not None:
+                    raise self._fly_error
+                if grabber.frame_count < num_frames:
+                    raise RuntimeError(f"Only {grabber.frame_count} of {num_frames} frames were received.")
+                self.fly_skipped_frames.put(grabber.skipped)
+                if grabber.skipped:
+                    raise RuntimeError(f"The camera skipped {grabber.skipped} frames during the fly scan.")
+            except Exception as e:
+                status.set_exception(e)
+            else:
+                status.set_finished()
+            finally:
+                grabber.stop()
+                self._grabber = None
+                self.camera_object.AcquisitionMode.SetValue(self._fly_acquisition_mode)
+
+        threading.Thread(target=_wait, name=f"{self.name}-complete", daemon=True).start()
+        return status
+
+    def describe_collect(self):
+        return {
+            "primary": {
+                **self.image.describe(),
+                **self.mean.describe(),
+                **self.stats.describe(),
+                **self.rois.describe(),
+            }
+        }
+
+    def collect(self):
+        """
+        Yield the events of the frames acquired since ``kickoff()``.
+        """
+        while self._fly_events:
+            yield self._fly_events.popleft()
 
     def stage(self):
+        # The whole configuration is checked before staging, so that an invalid one leaves the camera unstaged.
+
+        # Raises for an unknown codec, or a codec provided by a missing plugin.
+        compression = compression_options(
+            self.compression.get(),
+            level=self.compression_level.get(),
+            shuffle=self.compression_shuffle.get(),
+        )
+        # Optionally compress the frames in a worker pool and write the chunks directly.
+        compressor = None
+        if self.compression_workers.get() > 0:
+            compressor = ChunkCompressor(
+                self.compression.get(),
+                level=self.compression_level.get(),
+                shuffle=self.compression_shuffle.get(),
+            )
+
+        frame_shape = tuple(self.image_shape.get())
+        channels = pixel_format_channels(self.active_format.get())
+        if channels is not None:
+            frame_shape = (*frame_shape, channels)
+
+        if self.grab_mode.get() not in ("single", "continuous"):
+            raise ValueError(f"Unknown grab mode {self.grab_mode.get()!r}, expected 'single' or 'continuous'.")
+        if self.frames_per_trigger.get() < 1:
+            raise ValueError(f"frames_per_trigger must be at least 1, not {self.frames_per_trigger.get()}.")
+        # Raises for an unknown accumulate mode.
+        accumulated_dtype(self.accumulate_mode.get(), np.uint8)
+
+        self.rois.validate(frame_shape)
+
+        self._correcting = self.correction_enabled.get() and self._correction.active
+        self._store_corrected = self._correcting and self.correct_stored.get()
+        if self._correcting and self._correction.shape != frame_shape:
+            raise ValueError(
+                f"The calibration frames are shaped as {self._correction.shape}, not as the frames {frame_shape}."
+            )
+
         super().stage()
+        try:
+            self._stage_acquisition(frame_shape, compression, compressor)
+        except Exception:
+            if self._resource_document is not None:
+                self._asset_docs_cache.remove(("resource", self._resource_document))
+            self.unstage()
+            raise
+
+    def _stage_acquisition(self, frame_shape, compression, compressor):
+        """
+        Creates the file, the writer and the grab loop of the staged camera.
+        """
         date = datetime.datetime.now()
         self._assets_dir = date.strftime("%Y/%m/%d")
         data_file = f"{new_uid()}.h5"
@@ -215,24 +609,60 @@ class BaslerCamera(Device):
 
         logger.debug(f"{self._data_file = }")
 
-        self._h5file_desc = h5py.File(self._data_file, "x")
+        # Store the frames in the native dtype of the pixel format, e.g. uint8 for Mono8, unless corrected or
+        # accumulated over several frames.
+        if self._store_corrected:
+            dtype = np.float32
+        elif self.frames_per_trigger.get() > 1:
+            dtype = accumulated_dtype(self.accumulate_mode.get(), pixel_format_dtype(self.active_format.get()))
+        else:
+            dtype = pixel_format_dtype(self.active_format.get())
+
+        if self.swmr.get():
+            self._h5file_desc = h5py.File(self._data_file, "x", libver="latest")
+        else:
+            self._h5file_desc = h5py.File(self._data_file, "x")
         group = self._h5file_desc.create_group("/entry")
         self._dataset = group.create_dataset(
             "image",
-            data=np.full(fill_value=np.nan, shape=(1, *self.image_shape.get())),
-            maxshape=(None, *self.image_shape.get()),
-            chunks=(1, *self.image_shape.get()),
-            dtype="float64",
-            compression="lzf",
+            shape=(0, *frame_shape),
+            maxshape=(None, *frame_shape),
+            chunks=(1, *frame_shape),
+            dtype=dtype,
+            # Every allocated frame gets written, so skip writing fill values.
+            fill_time="never",
+            **compression,
         )
-        self._counter = itertools.count()
+        if self.swmr.get():
+            # No new objects can be created in the file from now on, but live readers can follow the dataset.
+            self._h5file_desc.swmr_mode = True
+
+        self._writer = FrameWriter(
+            self._dataset,
+            queue_size=self.write_queue_size.get(),
+            on_depth=self._update_write_queue,
+            reserved=self.frames_per_run.get(),
+            compressor=compressor,
+            workers=max(self.compression_workers.get(), 1),
+            swmr=self.swmr.get(),
+        )
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.name}-trigger")
+        # Enough buffers for a full ring buffer and write queue, plus the frames being grabbed and written.
+        self._frame_pool = FramePool(size=self.frame_buffer_size.get() + self.write_queue_size.get() + 2)
 
         self.camera_object.Open()
+        self._acquisition_mode = self.camera_object.AcquisitionMode.GetValue()
 
-        if self.camera_object.DeviceInfo.GetModelName() == "Emulation":
+        if self.frames_per_trigger.get() > 1:
+            # The frames of a trigger are grabbed from a single continuous acquisition.
+            self.camera_object.AcquisitionMode.SetValue("Continuous")
+        elif self.camera_object.DeviceInfo.GetModelName() == "Emulation":
             # This setting makes sure we continue our iteration over the set of
             # predefined images on each trigger.
-            self.camera_object.AcquisitionMode.SetValue("SingleFrame")
+            if self.grab_mode.get() == "continuous":
+                self.camera_object.AcquisitionMode.SetValue("Continuous")
+            else:
+                self.camera_object.AcquisitionMode.SetValue("SingleFrame")
 
         # Exposure time can't be less than self.camera_object.ExposureTime.Min.
         # We use seconds for ophyd, and microseconds for pylon:
@@ -262,16 +692,42 @@ class BaslerCamera(Device):
             else:
                 self.camera_object.ExposureTimeAbs.SetValue(1e3 * self.exposure_time.get())
 
+        if self.grab_mode.get() == "continuous":
+            self._grabber = ContinuousGrabber(
+                self.camera_object,
+                buffer_size=self.frame_buffer_size.get(),
+                timeout=self.grab_timeout.get(),
+                pool=self._frame_pool,
+                software_trigger=self._trigger_mode == "On",
+            )
+            self._grabber.start()
+
     def unstage(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._grabber is not None:
+            self._grabber.stop()
+            self._grabber = None
+        if self._writer is not None:
+            # Drain the write queue before the file is closed.
+            self._writer.close()
+            self._writer = None
+        self._frame_pool = None
+        self._correction_buffer = None
+        if self._acquisition_mode is not None:
+            self.camera_object.AcquisitionMode.SetValue(self._acquisition_mode)
+            self._acquisition_mode = None
         self.camera_object.Close()
         super().unstage()
-        del self._dataset
-        self._h5file_desc.close()
+        self._dataset = None
+        if self._h5file_desc is not None:
+            self._h5file_desc.close()
+            self._h5file_desc = None
         self._resource_document = None
         self._datum_factory = None
 
     def collect_asset_docs(self):
-        items = list(self._asset_docs_cache)
-        self._asset_docs_cache.clear()
-        for item in items:
-            yield item
+        # Pop the documents one at a time, as the writer thread keeps appending datums.
+        while self._asset_docs_cache:
+            yield self._asset_docs_cache.popleft()
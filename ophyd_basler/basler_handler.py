@@ -1,14 +1,604 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import h5py
+import hdf5plugin
+import numpy as np
 from area_detector_handlers.handlers import HandlerBase
+from event_model import unpack_datum_page, unpack_event_page
+
+# Importing the compression module registers the filters of hdf5plugin with HDF5.
+from .compression import ChunkDecompressor
+
+try:
+    import dask.array as da
+except ImportError:  # pragma: no cover
+    da = None
+
+
+def contiguous_runs(frames):
+    """
+    Splits increasing frame indices into runs of consecutive indices, and
+    returns them as a list of (start, stop, position) tuples, where position
+    is the index of ``start`` in ``frames``.
+    """
+    frames = np.asarray(frames)
+    breaks = np.flatnonzero(np.diff(frames) != 1) + 1
+    starts = np.concatenate([[0], breaks])
+    stops = np.concatenate([breaks, [len(frames)]])
+    return [(int(frames[a]), int(frames[a]) + int(b - a), int(a)) for a, b in zip(starts, stops)]
+
+
+class FilePool:
+    """
+    A least-recently-used pool of read-only h5py files, shared by handler
+    instances so that a file is opened once rather than for every frame.
+
+    At most ``max_open_files`` files are kept open; the least recently used
+    one is closed when another file has to be opened, and reopened on demand.
+    A file is also closed when the last handler using it is closed.
+    """
+
+    def __init__(self, max_open_files=32):
+        self.max_open_files = max_open_files
+        self._files = OrderedDict()
+        self._users = {}
+        self._lock = threading.RLock()
+
+    def acquire(self, filename):
+        with self._lock:
+            self._users[filename] = self._users.get(filename, 0) + 1
+
+    def release(self, filename):
+        with self._lock:
+            self._users[filename] -= 1
+            if not self._users[filename]:
+                del self._users[filename]
+                self.discard(filename)
+
+    def discard(self, filename):
+        """
+        Close a file of the pool, if it is open.
+        """
+        with self._lock:
+            h5file = self._files.pop(filename, None)
+            if h5file is not None:
+                h5file.close()
+
+    @contextmanager
+    def file(self, filename):
+        """
+        A context yielding the open file; the file is not evicted while in use.
+        """
+        with self._lock:
+            h5file = self._files.get(filename)
+            if h5file is None:
+                while len(self._files) >= self.max_open_files:
+                    _, evicted = self._files.popitem(last=False)
+                    evicted.close()
+                h5file = self._files[filename] = h5py.File(filename, "r")
+            else:
+                self._files.move_to_end(filename)
+            yield h5file
+
+    def close(self):
+        """
+        Close all the files of the pool.
+        """
+        with self._lock:
+            while self._files:
+                _, h5file = self._files.popitem()
+                h5file.close()
+
+
+class FrameCache:
+    """
+    A least-recently-used cache of decoded frames, keyed by the file, its
+    identity and the frame, and bounded by the total size of the frames it
+    holds.
+
+    Cached frames are read-only, so that they cannot be modified through the
+    arrays they are copied from. The ``hits`` and ``misses`` counters help
+    sizing ``max_bytes``; a budget of 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """The total size of the cached frames, in bytes."""
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, key):
+        """
+        Returns the cached frame, or None if it is not cached.
+        """
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._frames.move_to_end(key)
+            return frame
+
+    def put(self, key, frame):
+        """
+        Caches a frame, evicting the least recently used frames beyond the budget.
+        """
+        if frame.nbytes > self.max_bytes:
+            return
+        frame.setflags(write=False)
+        with self._lock:
+            previous = self._frames.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous.nbytes
+            self._frames[key] = frame
+            self._nbytes += frame.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class FrameMap:
+    """
+    Zero-copy, read-only views of the frames of an uncompressed dataset, taken
+    from a memory map of the file at the offsets HDF5 stored them at.
+
+    Only datasets without filters, stored contiguously or chunked frame by
+    frame, can be mapped. The file is remapped when a frame lies beyond the
+    mapped size, as the file may have grown since it was mapped.
+    """
+
+    def __init__(self, filename, frame_shape, dtype, offset=None, num_frames=0):
+        self._filename = filename
+        self._frame_shape = frame_shape
+        self._dtype = np.dtype(dtype)
+        self._nbytes = int(np.prod(frame_shape)) * self._dtype.itemsize
+        # The offset and number of frames of a contiguous dataset, which cannot be resized.
+        self._offset = offset
+        self._num_frames = num_frames
+        # The offsets of the frames of a chunked dataset, looked up as needed.
+        self._chunk_offsets = {}
+        self._map = None
+
+    @classmethod
+    def from_dataset(cls, filename, dataset):
+        """
+        Returns a map of the frames of the dataset, or None if they cannot be mapped.
+        """
+        if dataset.dtype.kind not in "uif" or dataset.id.get_create_plist().get_nfilters():
+            return None
+        if dataset.chunks is None:
+            offset = dataset.id.get_offset()
+            if offset is None:
+                return None
+            return cls(filename, dataset.shape[1:], dataset.dtype, offset=offset, num_frames=dataset.shape[0])
+        if dataset.chunks != (1, *dataset.shape[1:]):
+            return None
+        return cls(filename, dataset.shape[1:], dataset.dtype)
+
+    def locate(self, frame, dataset):
+        """
+        Looks up the offset of a frame of a chunked dataset, and returns
+        whether the frame is stored in the file.
+        """
+        if self._offset is not None or not 0 <= frame < dataset.shape[0]:
+            return False
+        info = dataset.id.get_chunk_info_by_coord((frame,) + (0,) * len(self._frame_shape))
+        if info.byte_offset is None:
+            return False
+        self._chunk_offsets[frame] = info.byte_offset
+        return True
+
+    def get(self, frame):
+        """
+        Returns a view of the frame, or None if its offset is not known.
+        """
+        if self._offset is None:
+            offset = self._chunk_offsets.get(frame)
+            if offset is None:
+                return None
+        elif 0 <= frame < self._num_frames:
+            offset = self._offset + frame * self._nbytes
+        else:
+            return None
+        if self._map is None or offset + self._nbytes > len(self._map):
+            self._map = np.memmap(self._filename, dtype=np.uint8, mode="r")
+        return np.ndarray(self._frame_shape, dtype=self._dtype, buffer=self._map, offset=offset)
 
 
 class BaslerCamHDF5Handler(HandlerBase):
+    """
+    Reads the frames of a BASLER_CAM_HDF5 file.
+
+    Calling the handler returns a frame as a new, writable array, read by h5py
+    or copied from the frame cache. With ``use_memmap`` enabled, the frames of
+    uncompressed datasets are instead returned as read-only views of a memory
+    map of the file, which must be copied to be modified.
+    """
+
     specs = {"BASLER_CAM_HDF5"}
 
+    # Opt in to serve the frames of uncompressed datasets as views of a memory map
+    # of the file; they bypass the frame cache, as the page cache already holds
+    # them. Files still being written, in SWMR mode or not, may not be up to date
+    # on disk, and must be read with this disabled.
+    use_memmap = False
+
+    # Shared by all the instances, so that the number of open files is capped per process.
+    file_pool = FilePool()
+
+    # Shared by all the instances, so that frames read repeatedly are decoded once per process.
+    frame_cache = FrameCache()
+
     def __init__(self, filename):
         self._name = filename
+        self._closed = False
+        self._frame_map = None
+        self._identity = None
+        self.file_pool.acquire(filename)
 
-    def __call__(self, frame):
-        with h5py.File(self._name, "r") as f:
+    def _file_identity(self):
+        """
+        Returns the inode, modification time and size of the file; when they
+        change, the file was rewritten or has grown, so it is reopened and its
+        frames are located again.
+        """
+        stat = os.stat(self._name)
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity != self._identity:
+            if self._identity is not None:
+                self.file_pool.discard(self._name)
+                self._frame_map = None
+            self._identity = identity
+        return identity
+
+    @contextmanager
+    def _entry(self, last_frame):
+        """
+        A context yielding the image dataset, reopening the file once if
+        ``last_frame`` lies beyond the dataset, as the file may have been
+        extended since it was opened.
+        """
+        with self.file_pool.file(self._name) as f:
             entry = f["/entry/image"]
+            if last_frame < entry.shape[0]:
+                yield entry
+                return
+
+        self.file_pool.discard(self._name)
+        with self.file_pool.file(self._name) as f:
+            yield f["/entry/image"]
+
+    def _mapped_frame(self, frame):
+        if self._frame_map is None:
+            with self._entry(frame) as entry:
+                self._frame_map = FrameMap.from_dataset(self._name, entry) or False
+        if not self._frame_map:
+            return None
+
+        image = self._frame_map.get(frame)
+        if image is None:
+            # The frame was not looked up yet, or is not stored in the file and is read by h5py instead.
+            with self._entry(frame) as entry:
+                if self._frame_map.locate(frame, entry):
+                    image = self._frame_map.get(frame)
+        return image
+
+    def __call__(self, frame):
+        identity = self._file_identity()
+        if self.use_memmap and self._frame_map is not False:
+            image = self._mapped_frame(frame)
+            if image is not None:
+                return image
+
+        key = (self._name, identity, frame)
+        image = self.frame_cache.get(key)
+        if image is None:
+            with self._entry(frame) as entry:
+                image = entry[frame]
+            self.frame_cache.put(key, image)
+        # The cached frame is shared, the caller gets its own copy.
+        return image.copy()
+
+    def get_frames(self, frames, out=None, workers=0):
+        """
+        Returns many frames at once, shaped as (len(frames), ny, nx).
+
+        Runs of consecutive frame indices are read with a single hyperslab
+        read each; indices that are not in increasing order are sorted first,
+        so that they are grouped into as few runs as possible.
+
+        Parameters
+        ----------
+        frames : sequence of int
+            the frame indices.
+        out : ndarray
+            an optional C-contiguous array to read the frames into.
+        workers : int
+            if positive, read and decompress the frames one by one in a pool
+            of that many threads instead, see ``read_frames()``.
+        """
+        if workers and len(frames):
+            return read_frames([(self._name, frame) for frame in frames], workers=workers, out=out)
+
+        frames = np.asarray(frames, dtype=np.int64)
+        if not len(frames):
+            with self.file_pool.file(self._name) as f:
+                entry = f["/entry/image"]
+                return np.empty((0, *entry.shape[1:]), dtype=entry.dtype) if out is None else out
+
+        if np.all(np.diff(frames) > 0):
+            return self._read_runs(frames, out)
+
+        unique_frames, inverse = np.unique(frames, return_inverse=True)
+        images = self._read_runs(unique_frames, None)
+        if out is None:
+            return images[inverse]
+        return np.take(images, inverse, axis=0, out=out)
+
+    def get_frame_range(self, start, stop, out=None):
+        """
+        Returns the frames ``start`` to ``stop`` (excluded) with a single read.
+        """
+        return self.get_frames(np.arange(start, stop), out=out)
+
+    def _read_runs(self, frames, out):
+        with self._entry(frames[-1]) as entry:
+            if out is None:
+                out = np.empty((len(frames), *entry.shape[1:]), dtype=entry.dtype)
+            for start, stop, position in contiguous_runs(frames):
+                entry.read_direct(
+                    out,
+                    source_sel=np.s_[start:stop],
+                    dest_sel=np.s_[position : position + stop - start],
+                )
+        return out
+
+    def to_dask(self):
+        """
+        Returns a lazy dask array over all the frames of the file, with one
+        dask chunk per HDF5 chunk; frames are only read when computed.
+        """
+        if da is None:
+            raise ImportError("Lazy access to the frames requires the 'dask' package.")
+        return _lazy_frames(self.file_pool, self._name)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._frame_map = None
+            self.file_pool.release(self._name)
+
+
+def _frame_decompressor(filename):
+    """
+    Returns a decompressor for the chunks of a file whose frames are chunked
+    one by one, or None if its frames must be read through h5py.
+    """
+    with BaslerCamHDF5Handler.file_pool.file(filename) as f:
+        entry = f["/entry/image"]
+        if entry.chunks is None or entry.chunks[0] != 1 or entry.chunks[1:] != entry.shape[1:]:
+            return None
+        decompressor = ChunkDecompressor.from_dataset(entry)
+    # The hdf5plugin filter decodes bitshuffle faster serially than NumPy does on a few cores.
+    if decompressor is not None and hdf5plugin.BSHUF_ID in decompressor.filter_ids:
+        return None
+    return decompressor
+
+
+def _read_frame(filename, frame, decompressor):
+    with BaslerCamHDF5Handler.file_pool.file(filename) as f:
+        entry = f["/entry/image"]
+        if decompressor is None:
             return entry[frame]
+        filter_mask, chunk = entry.id.read_direct_chunk((frame,) + (0,) * (entry.ndim - 1))
+
+    # Decompress outside of the pool lock, so that the other threads can read meanwhile.
+    return decompressor(chunk, filter_mask)[0]
+
+
+def read_frames(references, workers=4, out=None):
+    """
+    Reads frames from one or more files with a pool of threads, and returns
+    them in order, shaped as (len(references), ny, nx).
+
+    The raw chunks are read one at a time and decompressed in parallel, for
+    every codec of ``CODECS`` but "lzf", whose bindings hold the GIL. The
+    bitshuffle codecs, and frames that do not fill a chunk of their own, are
+    decoded by h5py, which serializes them.
+
+    Parameters
+    ----------
+    references : sequence of (filename, frame)
+        the frames to read.
+    workers : int
+        the number of threads.
+    out : ndarray
+        an optional array to read the frames into.
+    """
+    references = list(references)
+    if out is None:
+        if not references:
+            raise ValueError("No frames to read.")
+        with BaslerCamHDF5Handler.file_pool.file(references[0][0]) as f:
+            entry = f["/entry/image"]
+            out = np.empty((len(references), *entry.shape[1:]), dtype=entry.dtype)
+
+    # Look up the filter pipeline of each file once, rather than for every frame.
+    decompressors = {
+        filename: _frame_decompressor(filename) for filename in {filename for filename, _ in references}
+    }
+
+    def _read(i):
+        filename, frame = references[i]
+        out[i] = _read_frame(filename, frame, decompressors[filename])
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="basler-read") as executor:
+        for _ in executor.map(_read, range(len(references))):
+            pass
+
+    return out
+
+
+class _LazyImageDataset:
+    """
+    An array-like stand-in for /entry/image that dask can slice; each slice
+    reads through the shared file pool, so nothing holds the file open.
+    """
+
+    def __init__(self, file_pool, filename):
+        self._file_pool = file_pool
+        self._filename = filename
+        with file_pool.file(filename) as f:
+            entry = f["/entry/image"]
+            self.shape = entry.shape
+            self.dtype = entry.dtype
+            self.chunks = entry.chunks or entry.shape
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __getitem__(self, key):
+        with self._file_pool.file(self._filename) as f:
+            return f["/entry/image"][key]
+
+
+def _lazy_frames(file_pool, filename):
+    dataset = _LazyImageDataset(file_pool, filename)
+    return da.from_array(dataset, chunks=dataset.chunks, name=f"basler-{filename}-{dataset.shape}", asarray=False)
+
+
+def get_dask_array(documents, field="basler_cam_image", stream="primary"):
+    """
+    Returns a lazy dask array of the images recorded in a run, shaped as
+    (num_events, ny, nx), without reading any frame.
+
+    Parameters
+    ----------
+    documents : iterable of (name, doc)
+        the documents of the run, e.g. ``hdr.documents(fill=False)``.
+    field : str
+        the name of the image field.
+    stream : str
+        the name of the event stream.
+
+    Usage
+    -----
+
+        images = get_dask_array(hdr.documents(fill=False))
+        mean_image = images.mean(axis=0).compute()
+    """
+    if da is None:
+        raise ImportError("Lazy access to the frames requires the 'dask' package.")
+
+    resources = {}
+    datums = {}
+    descriptors = set()
+    datum_ids = []
+
+    for name, doc in documents:
+        if name == "resource" and doc["spec"] == "BASLER_CAM_HDF5":
+            resources[doc["uid"]] = os.path.join(doc.get("root", ""), doc["resource_path"])
+        elif name == "datum":
+            datums[doc["datum_id"]] = (doc["resource"], doc["datum_kwargs"]["frame"])
+        elif name == "datum_page":
+            for datum in unpack_datum_page(doc):
+                datums[datum["datum_id"]] = (datum["resource"], datum["datum_kwargs"]["frame"])
+        elif name == "descriptor" and doc.get("name") == stream and field in doc["data_keys"]:
+            descriptors.add(doc["uid"])
+        elif name == "event" and doc["descriptor"] in descriptors:
+            datum_ids.append(doc["data"][field])
+        elif name == "event_page" and doc["descriptor"] in descriptors:
+            datum_ids.extend(event["data"][field] for event in unpack_event_page(doc))
+
+    arrays = {}
+    blocks = []
+    # Slice each file once per run of consecutive frames, so that dask chunks stay aligned with the HDF5 chunks.
+    for resource_uid, frames in _group_by_resource(datums[datum_id] for datum_id in datum_ids):
+        if resource_uid not in arrays:
+            # Read through the shared pool directly, as no handler would be left to release the file.
+            arrays[resource_uid] = _lazy_frames(BaslerCamHDF5Handler.file_pool, resources[resource_uid])
+        for start, stop, _ in contiguous_runs(frames):
+            blocks.append(arrays[resource_uid][start:stop])
+
+    if not blocks:
+        raise ValueError(f"No {field!r} images found in the {stream!r} stream.")
+    return da.concatenate(blocks, axis=0)
+
+
+def _group_by_resource(references):
+    resource_uid, frames = None, []
+    for uid, frame in references:
+        if uid != resource_uid and frames:
+            yield resource_uid, frames
+            frames = []
+        resource_uid = uid
+        frames.append(frame)
+    if frames:
+        yield resource_uid, frames
+
+
+class BaslerCamSWMRReader:
+    """
+    Follows the frames of a BASLER_CAM_HDF5 file while it is being written in
+    SWMR mode, keeping the file open between polls.
+
+    Usage
+    -----
+
+        with BaslerCamSWMRReader(filename) as reader:
+            while acquiring:
+                new_frames = reader.poll()
+    """
+
+    def __init__(self, filename):
+        self._file = h5py.File(filename, "r", libver="latest", swmr=True)
+        self._dataset = self._file["/entry/image"]
+        self._next_frame = 0
+
+    @property
+    def num_frames(self):
+        """The number of frames returned by ``poll()`` so far."""
+        return self._next_frame
+
+    def poll(self):
+        """
+        Returns the frames written since the previous call, as an array shaped
+        as (num_new_frames, ny, nx).
+        """
+        self._dataset.refresh()
+        num_frames = self._dataset.shape[0]
+        frames = self._dataset[self._next_frame : num_frames]
+        self._next_frame = num_frames
+        return frames
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,434 @@
+import functools
+import struct
+import threading
+import zlib
+
+import h5py
+import hdf5plugin
+import lz4.block as lz4_block
+import lzf
+import numcodecs
+import numpy as np
+import zstandard
+
+CODECS = ("none", "lzf", "gzip", "bitshuffle-lz4", "bitshuffle-zstd", "blosc-lz4", "blosc-zstd", "zstd", "lz4")
+SHUFFLES = ("none", "byte", "bit")
+
+
+def compression_options(codec, level=5, shuffle="none"):
+    """
+    Returns the keyword arguments of ``h5py.Group.create_dataset()`` that set up
+    the compression filters of a dataset.
+
+    Parameters
+    ----------
+    codec : str
+        one of ``CODECS``; the bitshuffle, blosc, zstd and lz4 codecs are
+        provided by hdf5plugin.
+    level : int
+        the compression level, for the codecs that have one.
+    shuffle : str
+        one of ``SHUFFLES``: the shuffle filter applied before compression.
+        Bitshuffle codecs always bit-shuffle.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec {codec!r}, expected one of {CODECS}.")
+    if shuffle not in SHUFFLES:
+        raise ValueError(f"Unknown shuffle filter {shuffle!r}, expected one of {SHUFFLES}.")
+
+    if codec == "none":
+        return {}
+    if codec in ("lzf", "gzip", "zstd", "lz4") and shuffle == "bit":
+        raise ValueError(f"The {codec!r} codec does not support the bit shuffle filter.")
+    if codec == "lzf":
+        return {"compression": "lzf", "shuffle": shuffle == "byte"}
+    if codec == "gzip":
+        return {"compression": "gzip", "compression_opts": level, "shuffle": shuffle == "byte"}
+
+    if codec.startswith("bitshuffle-"):
+        return dict(hdf5plugin.Bitshuffle(cname=codec.split("-")[1], clevel=level))
+    if codec.startswith("blosc-"):
+        blosc_shuffle = {
+            "none": hdf5plugin.Blosc.NOSHUFFLE,
+            "byte": hdf5plugin.Blosc.SHUFFLE,
+            "bit": hdf5plugin.Blosc.BITSHUFFLE,
+        }[shuffle]
+        return dict(hdf5plugin.Blosc(cname=codec.split("-")[1], clevel=level, shuffle=blosc_shuffle))
+
+    # The remaining codecs are plain hdf5plugin filters, optionally preceded by the HDF5 shuffle filter.
+    options = dict(hdf5plugin.Zstd(clevel=level)) if codec == "zstd" else dict(hdf5plugin.LZ4())
+    if shuffle == "byte":
+        options["shuffle"] = True
+    return options
+
+
+class ChunkCompressor:
+    """
+    Compresses a chunk in Python through the same filter pipeline HDF5 would
+    apply for ``compression_options(codec, level, shuffle)``, so that the
+    result can be committed with ``write_direct_chunk()``.
+
+    Every codec of ``CODECS`` is supported, through the python-lzf, numcodecs
+    (blosc), zstandard and lz4 bindings. As HDF5 does for optional filters, a
+    chunk that a codec does not shrink is stored unfiltered.
+
+    zlib and the bindings release the GIL while compressing, so chunks can be
+    compressed in parallel in a thread pool, except for python-lzf which only
+    takes the compression off the writer thread. The bit transpose of the
+    bitshuffle codecs is done with NumPy, about 3 times slower per core than
+    the hdf5plugin filter: with few cores, bitshuffle frames are written
+    faster without compression workers.
+    """
+
+    codecs = CODECS
+
+    def __init__(self, codec, level=5, shuffle="none"):
+        # Raises for an unknown codec or shuffle filter, or a combination HDF5 does not support.
+        compression_options(codec, level=level, shuffle=shuffle)
+        self._codec = codec
+        self._level = level
+        # The HDF5 shuffle filter precedes the codec, except for blosc and bitshuffle which shuffle internally.
+        self._shuffle = shuffle == "byte" and codec in ("lzf", "gzip", "zstd", "lz4")
+        self._encode = _encoder(codec, level, shuffle)
+        # The bit of the codec in the filter mask, after the optional shuffle filter.
+        self._skip_mask = 1 << int(self._shuffle)
+
+    def __call__(self, chunk):
+        """
+        Returns the filter mask and the bytes of the compressed chunk, as
+        taken by ``write_direct_chunk()``.
+        """
+        chunk = np.ascontiguousarray(chunk)
+        data = _shuffle(chunk) if self._shuffle and chunk.itemsize > 1 else chunk
+        if self._encode is None:
+            return 0, data.tobytes()
+        compressed = self._encode(data)
+        if compressed is None:
+            return self._skip_mask, data.tobytes()
+        return 0, compressed
+
+
+def _encoder(codec, level, shuffle):
+    """
+    Returns a function encoding a contiguous array as the given codec, or
+    returning None when the codec does not shrink it; None for "none".
+    """
+    if codec == "none":
+        return None
+    if codec == "gzip":
+        return functools.partial(zlib.compress, level=level)
+    if codec == "lzf":
+        return lambda data: lzf.compress(data.tobytes())
+    if codec == "zstd":
+        return _ZstdEncoder(level)
+    if codec == "lz4":
+        return _encode_lz4
+    if codec.startswith("blosc-"):
+        blosc_shuffle = {
+            "none": numcodecs.Blosc.NOSHUFFLE,
+            "byte": numcodecs.Blosc.SHUFFLE,
+            "bit": numcodecs.Blosc.BITSHUFFLE,
+        }[shuffle]
+        blosc = numcodecs.Blosc(cname=codec.split("-")[1], clevel=level, shuffle=blosc_shuffle)
+        # The blosc filter fails, and is skipped, when the chunk does not fit in its uncompressed size.
+        return lambda data: _unless_larger(blosc.encode(data), data.nbytes)
+
+    # The bitshuffle codecs.
+    if codec == "bitshuffle-lz4":
+        compress = functools.partial(lz4_block.compress, store_size=False)
+    else:
+        compress = _ZstdEncoder(level)
+    return functools.partial(_encode_bitshuffle, compress=compress)
+
+
+def _unless_larger(compressed, nbytes):
+    return None if len(compressed) > nbytes else compressed
+
+
+class _ZstdEncoder:
+    """
+    Compresses to zstd frames, with a compression context per thread as
+    contexts cannot be shared between threads.
+    """
+
+    def __init__(self, level):
+        self._level = level
+        self._local = threading.local()
+
+    def __call__(self, data):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self._level)
+        return compressor.compress(data)
+
+
+def _encode_lz4(data, block_size=2**30):
+    """
+    Encodes an array as the LZ4 HDF5 filter does: the big-endian 64-bit size
+    of the data and 32-bit size of the blocks, followed by each block as its
+    32-bit size and its LZ4 block, or its raw bytes if LZ4 does not shrink it.
+    """
+    raw = memoryview(data).cast("B")
+    parts = [struct.pack(">QI", raw.nbytes, min(block_size, raw.nbytes))]
+    for start in range(0, raw.nbytes, block_size):
+        block = raw[start : start + block_size]
+        compressed = lz4_block.compress(block, store_size=False)
+        if len(compressed) >= len(block):
+            compressed = block.tobytes()
+        parts += [struct.pack(">I", len(compressed)), compressed]
+    return b"".join(parts)
+
+
+def _bitshuffle(blocks):
+    """
+    Transposes the bits of blocks of elements, shaped as (num_blocks,
+    block_size) with a multiple of 8 elements per block, as bitshuffle does:
+    bit k of byte j of every element of a block goes to its row 8 * j + k,
+    eight elements per byte.
+    """
+    num_blocks, size = blocks.shape
+    itemsize = blocks.itemsize
+    # Group the j-th bytes of the elements of each block.
+    data = np.ascontiguousarray(blocks.view(np.uint8).reshape(num_blocks, size, itemsize).transpose(0, 2, 1))
+    # Transpose each 8x8 bit matrix of 8 consecutive bytes, read as a little-endian 64-bit integer.
+    x = data.view("<u8")
+    for shift, mask in ((7, 0x00AA00AA00AA00AA), (14, 0x0000CCCC0000CCCC), (28, 0x00000000F0F0F0F0)):
+        t = (x ^ (x >> np.uint64(shift))) & np.uint64(mask)
+        x = x ^ t ^ (t << np.uint64(shift))
+    # Byte k of each integer now holds bit k of its 8 bytes, gather them by bit row.
+    rows = x.view(np.uint8).reshape(num_blocks, itemsize, size // 8, 8).transpose(0, 1, 3, 2)
+    return rows.reshape(num_blocks, size * itemsize)
+
+
+def _encode_bitshuffle(data, compress):
+    """
+    Encodes an array as the bitshuffle HDF5 filter does with its default
+    block size: the big-endian 64-bit size of the data and 32-bit size of the
+    blocks in bytes, followed by each bit-shuffled block as its 32-bit
+    compressed size and its compressed bytes, and the raw bytes of the last
+    elements that do not fill a multiple of 8.
+    """
+    flat = data.reshape(-1)
+    block_size = max(8192 // flat.itemsize // 8 * 8, 128)
+    end = flat.size - flat.size % 8
+    full = end - end % block_size
+    blocks = [_bitshuffle(flat[:full].reshape(-1, block_size))]
+    if full < end:
+        blocks.append(_bitshuffle(flat[full:end].reshape(1, -1)))
+
+    parts = [struct.pack(">QI", flat.nbytes, block_size * flat.itemsize)]
+    for block in (block for shuffled in blocks for block in shuffled):
+        compressed = compress(block)
+        parts += [struct.pack(">I", len(compressed)), compressed]
+    parts.append(flat[end:].tobytes())
+    return b"".join(parts)
+
+
+class ChunkDecompressor:
+    """
+    Decodes raw chunks read with ``read_direct_chunk()`` in Python, for the
+    filter pipelines of every codec of ``CODECS``: the HDF5 shuffle filter,
+    deflate, lzf, and the blosc, bitshuffle, zstd and lz4 filters of
+    hdf5plugin.
+
+    zlib and the numcodecs, zstandard and lz4 bindings release the GIL while
+    decompressing, so chunks can be decoded in parallel in a thread pool,
+    outside of h5py's global lock; python-lzf holds the GIL. As for
+    ``ChunkCompressor``, the NumPy bit transpose of the bitshuffle codecs is
+    several times slower per core than the hdf5plugin filter.
+    """
+
+    supported_filters = (
+        h5py.h5z.FILTER_SHUFFLE,
+        h5py.h5z.FILTER_DEFLATE,
+        h5py.h5z.FILTER_LZF,
+        hdf5plugin.BLOSC_ID,
+        hdf5plugin.BSHUF_ID,
+        hdf5plugin.ZSTD_ID,
+        hdf5plugin.LZ4_ID,
+    )
+    # The compression options of the bitshuffle filter: lz4 and zstd.
+    _bitshuffle_compressions = (2, 3)
+
+    def __init__(self, filters, chunk_shape, dtype):
+        self._chunk_shape = chunk_shape
+        self._dtype = np.dtype(dtype)
+        self._nbytes = int(np.prod(chunk_shape)) * self._dtype.itemsize
+        self.filter_ids = tuple(filter_id for filter_id, _ in filters)
+        # The filters as (filter_id, options), each decoded by a function returning bytes or a flat array.
+        self._decoders = [self._decoder(filter_id, options) for filter_id, options in filters]
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """
+        Returns a decompressor for the chunks of the dataset, or None if its
+        filter pipeline is not supported.
+        """
+        if dataset.chunks is None:
+            return None
+        plist = dataset.id.get_create_plist()
+        filters = []
+        for i in range(plist.get_nfilters()):
+            filter_id, _, options, _ = plist.get_filter(i)
+            if filter_id not in cls.supported_filters:
+                return None
+            if filter_id == hdf5plugin.BSHUF_ID and options[4] not in cls._bitshuffle_compressions:
+                return None
+            filters.append((filter_id, options))
+        return cls(filters, dataset.chunks, dataset.dtype)
+
+    def _decoder(self, filter_id, options):
+        if filter_id == h5py.h5z.FILTER_SHUFFLE:
+            return functools.partial(_unshuffle, dtype=self._dtype) if self._dtype.itemsize > 1 else _identity
+        if filter_id == h5py.h5z.FILTER_DEFLATE:
+            return functools.partial(zlib.decompress, bufsize=self._nbytes)
+        if filter_id == h5py.h5z.FILTER_LZF:
+            return lambda chunk: lzf.decompress(chunk, self._nbytes)
+        if filter_id == hdf5plugin.BLOSC_ID:
+            return numcodecs.Blosc().decode
+        if filter_id == hdf5plugin.ZSTD_ID:
+            return functools.partial(_ZstdDecoder(), nbytes=self._nbytes)
+        if filter_id == hdf5plugin.LZ4_ID:
+            return _decode_lz4
+        if options[4] == 2:
+            decompress = _decompress_lz4_block
+        else:
+            decompress = _ZstdDecoder()
+        return functools.partial(_decode_bitshuffle, dtype=self._dtype, decompress=decompress)
+
+    def __call__(self, chunk, filter_mask=0):
+        # Undo the filters in reverse order, skipping those flagged in the filter mask.
+        for i in reversed(range(len(self._decoders))):
+            if not filter_mask & (1 << i):
+                chunk = self._decoders[i](chunk)
+        image = chunk if isinstance(chunk, np.ndarray) else np.frombuffer(chunk, dtype=self._dtype)
+        return image.reshape(self._chunk_shape)
+
+
+class _ZstdDecoder:
+    """
+    Decompresses zstd frames, with a decompression context per thread as
+    contexts cannot be shared between threads.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, data, nbytes):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data, max_output_size=nbytes)
+
+
+def _identity(chunk):
+    return chunk
+
+
+def _decompress_lz4_block(data, nbytes):
+    return lz4_block.decompress(data, uncompressed_size=nbytes)
+
+
+def _decode_lz4(chunk):
+    """
+    Reverts ``_encode_lz4()``.
+    """
+    chunk = memoryview(chunk)
+    nbytes, block_size = struct.unpack_from(">QI", chunk)
+    offset = 12
+    parts = []
+    for start in range(0, nbytes, block_size):
+        size = min(block_size, nbytes - start)
+        (compressed_size,) = struct.unpack_from(">I", chunk, offset)
+        block = chunk[offset + 4 : offset + 4 + compressed_size]
+        offset += 4 + compressed_size
+        # Blocks that LZ4 did not shrink are stored raw.
+        parts.append(block if compressed_size == size else _decompress_lz4_block(block, size))
+    return b"".join(parts)
+
+
+def _bitunshuffle(rows, dtype):
+    """
+    Reverts ``_bitshuffle()`` on blocks of bit rows shaped as (num_blocks,
+    block_size * itemsize), returning the elements shaped as (num_blocks,
+    block_size).
+    """
+    num_blocks = rows.shape[0]
+    itemsize = dtype.itemsize
+    size = rows.shape[1] // itemsize
+    # Gather the k-th bytes of the 8 bit rows of each byte, as the 8x8 bit matrices _bitshuffle() produced,
+    # one strided copy per row as NumPy transposes of bytes are slow.
+    bit_rows = rows.reshape(num_blocks, itemsize, 8, size // 8)
+    data = np.empty((num_blocks, itemsize, size // 8, 8), dtype=np.uint8)
+    for k in range(8):
+        data[..., k] = bit_rows[:, :, k]
+    # The transpose of the bit matrices is its own inverse.
+    x = data.view("<u8")
+    for shift, mask in ((7, 0x00AA00AA00AA00AA), (14, 0x0000CCCC0000CCCC), (28, 0x00000000F0F0F0F0)):
+        t = (x ^ (x >> np.uint64(shift))) & np.uint64(mask)
+        x = x ^ t ^ (t << np.uint64(shift))
+    planes = x.view(np.uint8).reshape(num_blocks, itemsize, size)
+    elements = np.empty((num_blocks, size), dtype=dtype)
+    interleaved = elements.view(np.uint8).reshape(num_blocks, size, itemsize)
+    for j in range(itemsize):
+        interleaved[:, :, j] = planes[:, j]
+    return elements
+
+
+def _decode_bitshuffle(chunk, dtype, decompress):
+    """
+    Reverts ``_encode_bitshuffle()``, returning a flat array of the given
+    dtype.
+    """
+    chunk = memoryview(chunk)
+    nbytes, block_nbytes = struct.unpack_from(">QI", chunk)
+    size = nbytes // dtype.itemsize
+    block_size = block_nbytes // dtype.itemsize
+    end = size - size % 8
+
+    # Decompress the blocks into one buffer, then revert the bit transpose of the full blocks at once.
+    raw = bytearray(nbytes)
+    offset = 12
+    for start in range(0, end, block_size):
+        stop = min(start + block_size, end)
+        (compressed_size,) = struct.unpack_from(">I", chunk, offset)
+        block = chunk[offset + 4 : offset + 4 + compressed_size]
+        offset += 4 + compressed_size
+        raw[start * dtype.itemsize : stop * dtype.itemsize] = decompress(block, (stop - start) * dtype.itemsize)
+    # The last elements that do not fill a multiple of 8 are stored raw.
+    raw[end * dtype.itemsize :] = chunk[offset:]
+
+    rows = np.frombuffer(raw, dtype=np.uint8)
+    flat = np.empty(size, dtype=dtype)
+    flat.view(np.uint8)[end * dtype.itemsize :] = rows[end * dtype.itemsize :]
+    full = end - end % block_size
+    if full:
+        flat[:full] = _bitunshuffle(rows[: full * dtype.itemsize].reshape(-1, block_nbytes), dtype).reshape(-1)
+    if full < end:
+        flat[full:end] = _bitunshuffle(rows[full * dtype.itemsize : end * dtype.itemsize].reshape(1, -1), dtype)[0]
+    return flat
+
+
+def _shuffle(array):
+    """
+    Applies the HDF5 shuffle filter, which groups the n-th bytes of all the
+    elements together, one strided copy per byte of the dtype.
+    """
+    data = array.reshape(-1).view(np.uint8)
+    shuffled = np.empty_like(data)
+    for k in range(array.itemsize):
+        shuffled[k * array.size : (k + 1) * array.size] = data[k :: array.itemsize]
+    return shuffled
+
+
+def _unshuffle(buffer, dtype):
+    """
+    Reverts ``_shuffle()``, returning a flat array of the given dtype.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    size = data.size // dtype.itemsize
+    array = np.empty(size, dtype=dtype)
+    unshuffled = array.view(np.uint8)
+    for k in range(dtype.itemsize):
+        unshuffled[k :: dtype.itemsize] = data[k * size : (k + 1) * size]
+    return array
@@ -0,0 +1,142 @@
+import bluesky.plan_stubs as bps
+import bluesky.plans as bp
+import bluesky.preprocessors as bpp
+import h5py
+import numpy as np
+
+CALIBRATIONS = ("dark", "flat")
+
+
+def average_frames(filename, block_size=16):
+    """
+    Returns the average of the frames of a BASLER_CAM_HDF5 file, as float32.
+
+    The frames are read and accumulated in float64 by blocks of
+    ``block_size`` frames, so the whole run is never held in memory.
+    """
+    with h5py.File(filename, "r") as f:
+        dataset = f["/entry/image"]
+        num_frames = dataset.shape[0]
+        if not num_frames:
+            raise ValueError(f"{filename!r} has no frames to average.")
+        total = np.zeros(dataset.shape[1:], dtype=np.float64)
+        for start in range(0, num_frames, block_size):
+            total += dataset[start : start + block_size].sum(axis=0, dtype=np.float64)
+    return (total / num_frames).astype(np.float32)
+
+
+class FrameCorrection:
+    """
+    Dark-frame subtraction and flat-field correction of frames.
+
+    A corrected frame is ``(raw - dark) * gain``, where the gain is
+    ``mean(flat - dark) / (flat - dark)``, and 0 where the flat has no signal
+    above the dark. The dark frame and the gain are cached as float32, so a
+    frame is corrected with two vectorized passes, straight into the output
+    buffer.
+    """
+
+    def __init__(self):
+        self._calibrations = {}
+        self._dark = None
+        self._gain = None
+
+    @property
+    def active(self):
+        """Whether a dark or a flat frame is set."""
+        return bool(self._calibrations)
+
+    @property
+    def shape(self):
+        """The shape of the calibration frames, or None if none is set."""
+        return next((frame.shape for frame in self._calibrations.values()), None)
+
+    def set(self, calibration, frame):
+        """
+        Sets the "dark" or "flat" frame, or clears it if ``frame`` is None.
+        """
+        if calibration not in CALIBRATIONS:
+            raise ValueError(f"Unknown calibration {calibration!r}, expected one of {CALIBRATIONS}.")
+        previous = dict(self._calibrations)
+        if frame is None:
+            self._calibrations.pop(calibration, None)
+        else:
+            frame = np.asarray(frame, dtype=np.float32)
+            for other, other_frame in previous.items():
+                if other != calibration and other_frame.shape != frame.shape:
+                    raise ValueError(
+                        f"The {calibration} frame is shaped as {frame.shape}, "
+                        f"but the {other} frame is shaped as {other_frame.shape}."
+                    )
+            self._calibrations[calibration] = frame
+        try:
+            self._update()
+        except ValueError:
+            self._calibrations = previous
+            self._update()
+            raise
+
+    def _update(self):
+        dark = self._calibrations.get("dark")
+        flat = self._calibrations.get("flat")
+        self._dark = dark
+        self._gain = None
+        if flat is not None:
+            signal = flat - dark if dark is not None else flat.copy()
+            valid = signal > 0
+            if not valid.any():
+                raise ValueError("The flat frame has no signal above the dark frame.")
+            self._gain = np.zeros_like(signal)
+            np.divide(signal[valid].mean(), signal, out=self._gain, where=valid)
+
+    def __call__(self, image, out=None):
+        """
+        Returns the corrected frame as float32, written into ``out`` if given.
+        """
+        if out is None:
+            out = np.empty(image.shape, dtype=np.float32)
+        if self._dark is not None:
+            np.subtract(image, self._dark, out=out, dtype=np.float32)
+        else:
+            np.copyto(out, image)
+        if self._gain is not None:
+            np.multiply(out, self._gain, out=out)
+        return out
+
+
+def capture_calibration(camera, calibration, num_frames=16, md=None):
+    """
+    Records a run of ``num_frames`` uncorrected frames and loads their
+    average as the "dark" or "flat" frame of the camera.
+
+    Parameters
+    ----------
+    camera : ophyd_basler.basler_camera.BaslerCamera
+        the camera; shutter or illuminate it as needed beforehand.
+    calibration : str
+        "dark" or "flat".
+    num_frames : int
+        the number of frames to average.
+    md : dict
+        metadata added to the start document.
+
+    Returns
+    -------
+    the uid of the calibration run.
+    """
+    if calibration not in CALIBRATIONS:
+        raise ValueError(f"Unknown calibration {calibration!r}, expected one of {CALIBRATIONS}.")
+
+    enabled = camera.correction_enabled.get()
+
+    def _restore():
+        yield from bps.mv(camera.correction_enabled, enabled)
+
+    def _capture():
+        yield from bps.mv(camera.correction_enabled, False)
+        uid = yield from bp.count([camera], num=num_frames, md={**(md or {}), "calibration": calibration})
+        # The file of the run is the one the camera wrote while it was staged.
+        camera.load_calibration(calibration, camera._data_file)
+        return uid
+
+    return (yield from bpp.finalize_wrapper(_capture(), _restore()))
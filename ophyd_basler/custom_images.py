@@ -1,5 +1,9 @@
+import hashlib
 import os
+import shutil
 import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
@@ -19,12 +23,11 @@ def gaussian_2d(x, y, a, cx, cy, sx, sy):
     return a * np.exp(-0.5 * (np.square((x - cx) / sx) + np.square((y - cy) / sy)))
 
 
-def get_wandering_gaussian_beam(nf, nx, ny, seed=0):
+def _wandering_beam_params(nf, nx, ny, seed):
     """
-    Generates a slowly-fluctuating Gaussian beam, and returns it in an array of
-    images with shape (nf, ny, nx).
+    Returns the parameters (a, cx, cy, sx, sy) of a slowly-fluctuating
+    Gaussian beam for each of ``nf`` frames, shaped as (5, nf).
     """
-
     rng = np.random.default_rng(seed)
 
     # hard-coded for now
@@ -41,25 +44,370 @@ def get_wandering_gaussian_beam(nf, nx, ny, seed=0):
 
     # scale the generated data so that it varies between the specified bounds
     beam_params -= beam_params.min(axis=1)[:, None]
-    beam_params *= (bounds.ptp(axis=1) / beam_params.ptp(axis=1))[:, None]
+    beam_params *= (np.ptp(bounds, axis=1) / np.ptp(beam_params, axis=1))[:, None]
     beam_params += bounds.min(axis=1)[:, None]
 
-    # get image coordinates
-    X, Y = np.meshgrid(np.arange(nx), np.arange(ny))
+    return beam_params
+
+
+class WanderingGaussianBeam:
+    """
+    A slowly-fluctuating Gaussian beam, as a sequence of ``nf`` frames shaped
+    as (ny, nx) that are only computed when accessed.
+
+    A Gaussian beam is separable, so each frame is the outer product of the
+    1-D profiles of the beam along y and x, rather than a 2-D exponential
+    over the whole grid. Frame ``i`` is the same whether it is computed alone,
+    in a batch or by iterating, and it equals frame ``i`` of
+    ``get_wandering_gaussian_beam()`` up to floating-point rounding.
+
+    Parameters
+    ----------
+    nf, nx, ny : int
+        the number of frames and their width and height.
+    seed : int
+        the seed of the beam fluctuations.
+    dtype : dtype
+        the dtype of the frames: float64, float32, or uint8, for which the
+        frames are rounded and clipped to [0, 255].
+
+    Usage
+    -----
+
+        beam = WanderingGaussianBeam(nf=256, nx=1024, ny=1040, seed=6313448000, dtype=np.uint8)
+        frame = beam[42]
+        for frames in beam.batches(16):
+            ...
+    """
+
+    dtypes = (np.dtype(np.float64), np.dtype(np.float32), np.dtype(np.uint8))
+
+    def __init__(self, nf, nx, ny, seed=0, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in self.dtypes:
+            raise ValueError(f"Unsupported dtype {self.dtype}, expected one of {[str(d) for d in self.dtypes]}.")
+        self.shape = (nf, ny, nx)
+        self._params = _wandering_beam_params(nf, nx, ny, seed)
+        self._x = np.arange(nx, dtype=np.float64)
+        self._y = np.arange(ny, dtype=np.float64)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _frames(self, indices):
+        a, cx, cy, sx, sy = self._params[:, indices, None]
+        profile_x = np.exp(-0.5 * np.square((self._x - cx) / sx))
+        profile_y = a * np.exp(-0.5 * np.square((self._y - cy) / sy))
+
+        frames = np.empty((len(indices), *self.shape[1:]), dtype=self.dtype)
+        if self.dtype.kind == "f":
+            np.multiply(profile_y[:, :, None], profile_x[:, None, :], out=frames)
+            return frames
+        for frame, py, px in zip(frames, profile_y, profile_x):
+            values = np.multiply.outer(py, px)
+            np.clip(np.rint(values, out=values), 0, 255, out=values)
+            frame[...] = values
+        return frames
+
+    def __getitem__(self, key):
+        """
+        Returns frame ``key``, or the frames of a slice shaped as (n, ny, nx).
+        """
+        if isinstance(key, slice):
+            return self._frames(np.arange(len(self))[key])
+        index = range(len(self))[key]
+        return self._frames(np.array([index]))[0]
 
-    return gaussian_2d(X[None, :, :], Y[None, :, :], *beam_params[:, :, None, None])
+    def __iter__(self):
+        for frames in self.batches():
+            yield from frames
 
+    def batches(self, batch_size=16):
+        """
+        Yields the frames in batches of up to ``batch_size`` frames, shaped as (n, ny, nx).
+        """
+        for start in range(0, len(self), batch_size):
+            yield self[start : start + batch_size]
+
+    def fingerprint(self):
+        """
+        Returns bytes that identify the frames, without computing them: the
+        frames are determined by their shape, dtype and beam parameters.
+        """
+        return repr((type(self).__name__, self.shape, self.dtype.str)).encode() + self._params.tobytes()
+
+
+def get_wandering_gaussian_beam(nf, nx, ny, seed=0, dtype=np.float64):
+    """
+    Generates a slowly-fluctuating Gaussian beam, and returns it in an array of
+    images with shape (nf, ny, nx).
+
+    The whole stack is held in memory; use ``WanderingGaussianBeam`` to
+    compute the frames one at a time or in batches instead.
+    """
+    return WanderingGaussianBeam(nf, nx, ny, seed=seed, dtype=dtype)[:]
+
+
+IMAGE_FORMATS = ("png", "tiff", "bmp")
+
+# cv2.imwrite() parameters of each format; TIFF frames are written uncompressed.
+_IMWRITE_PARAMS = {
+    "png": [],
+    "tiff": [cv2.IMWRITE_TIFF_COMPRESSION, 1],
+    "bmp": [],
+}
+
+
+# The OpenCV depths of the dtypes frames can be saved as, and of the dtypes cv2.addWeighted() accepts.
+_CV_DEPTHS = {
+    np.dtype(np.uint8): cv2.CV_8U,
+    np.dtype(np.int8): cv2.CV_8S,
+    np.dtype(np.uint16): cv2.CV_16U,
+    np.dtype(np.int16): cv2.CV_16S,
+    np.dtype(np.int32): cv2.CV_32S,
+    np.dtype(np.float32): cv2.CV_32F,
+    np.dtype(np.float64): cv2.CV_64F,
+}
+
+
+def convert_image(image, dtype=np.uint8, scale=1.0, offset=0.0):
+    """
+    Converts a frame to an integer dtype, as ``rint(image * scale + offset)``
+    clipped to the range of the dtype.
+
+    The conversion is a single pass of ``cv2.addWeighted()``, which releases
+    the GIL. A frame that already has the dtype is returned as it is when
+    there is nothing to scale.
+    """
+    dtype = np.dtype(dtype)
+    image = np.asarray(image)
+    if image.dtype == dtype and scale == 1 and offset == 0:
+        return image
+    if image.dtype in _CV_DEPTHS:
+        return cv2.addWeighted(image, scale, image, 0.0, offset, dtype=_CV_DEPTHS[dtype])
+
+    # Other dtypes, e.g. int64, are converted by NumPy in a few more passes.
+    values = np.multiply(image, scale, dtype=np.float64)
+    values += offset
+    info = np.iinfo(dtype)
+    np.clip(np.rint(values, out=values), info.min, info.max, out=values)
+    return values.astype(dtype)
+
+
+def save_images(images, img_dir=None, fmt="png", dtype=np.uint8, scale=1.0, offset=0.0, workers=4):
+    """
+    Saves frames as image files that the pylon camera emulation can load.
+
+    Each frame is converted to the target dtype, see ``convert_image()``, and
+    written by a pool of threads, as OpenCV releases the GIL. Only a few
+    frames per thread are held in memory at a time, so ``images`` can be any
+    iterable of frames.
+
+    Parameters
+    ----------
+    images : iterable of ndarray
+        the frames, e.g. an array shaped as (num_frames, ny, nx) or a
+        ``WanderingGaussianBeam``.
+    img_dir : str
+        the directory to write the frames to; a temporary directory by default.
+    fmt : str
+        one of ``IMAGE_FORMATS``; TIFF and BMP frames are not compressed, so
+        they are faster to write than PNG frames.
+    dtype : dtype
+        uint8, or uint16 for the PNG and TIFF formats.
+    scale, offset : float
+        the frames are saved as ``rint(images * scale + offset)``, clipped to
+        the range of the dtype.
+    workers : int
+        the number of writing threads.
+    """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format {fmt!r}, expected one of {IMAGE_FORMATS}.")
+    dtype = np.dtype(dtype)
+    if dtype not in (np.uint8, np.uint16) or (fmt == "bmp" and dtype != np.uint8):
+        raise ValueError(f"Cannot save {fmt!r} images as {dtype}.")
 
-def save_images(images, img_dir=None):
     if img_dir is None:
         img_dir = tempfile.mkdtemp()
     else:
         if not os.path.exists(img_dir):
             os.makedirs(img_dir, exist_ok=True)
 
-    logger.info(f"Using '{img_dir}' to save {len(images)} images to.")
-    for i, image in enumerate(images):
-        cv2.imwrite(os.path.join(img_dir, "pattern_%03d.png" % i), image)
-    logger.info(f"Saved {len(os.listdir(img_dir))} images into '{img_dir}'")
+    logger.info(f"Using '{img_dir}' to save images to.")
+
+    def _write(index, image):
+        filename = os.path.join(img_dir, f"pattern_{index:03d}.{fmt}")
+        image = convert_image(image, dtype=dtype, scale=scale, offset=offset)
+        if not cv2.imwrite(filename, image, _IMWRITE_PARAMS[fmt]):
+            raise RuntimeError(f"Failed to write {filename!r}.")
+
+    num_images = 0
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="basler-save") as executor:
+        for image in images:
+            pending.append(executor.submit(_write, num_images, image))
+            num_images += 1
+            # Bound the number of frames waiting to be written.
+            if len(pending) > 2 * workers:
+                pending.popleft().result()
+        while pending:
+            pending.popleft().result()
+
+    logger.info(f"Saved {num_images} images into '{img_dir}'")
 
     return img_dir
+
+
+def load_images(img_dir):
+    """
+    Returns the frames saved in a directory, e.g. by ``save_images()``, as a
+    list of arrays in the order of their file names; only the files of the
+    ``IMAGE_FORMATS`` are loaded.
+    """
+    filenames = sorted(name for name in os.listdir(img_dir) if name.rpartition(".")[2] in IMAGE_FORMATS)
+    if not filenames:
+        raise ValueError(f"No images were found in {img_dir!r}.")
+    images = []
+    for filename in filenames:
+        image = cv2.imread(os.path.join(img_dir, filename), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise RuntimeError(f"Failed to read {os.path.join(img_dir, filename)!r}.")
+        images.append(image)
+    return images
+
+
+# The environment variable setting the root directory of the default ImageCache.
+IMAGE_CACHE_ENV = "OPHYD_BASLER_IMAGE_CACHE"
+
+
+class ImageCache:
+    """
+    A content-addressed cache of directories of saved frames, so that the
+    same frames are only written once for the pylon camera emulation.
+
+    Each directory is named after a hash of the frames and of how they are
+    saved (format, dtype, scale and offset). A cached directory is reused as
+    it is, and its modification time is updated as it is used; when the
+    cache holds more than ``max_bytes``, the least recently used directories
+    are removed. Frames are written to a staging directory and renamed into
+    place, so a directory of the cache is always complete, even with several
+    processes sharing the cache.
+
+    Only frames that can be hashed without being consumed are cached: arrays,
+    lists and tuples of frames, whose bytes are hashed, and objects with a
+    ``fingerprint()`` method, such as ``WanderingGaussianBeam``. Other
+    iterables are saved into a fresh temporary directory, as by
+    ``save_images()``.
+
+    Parameters
+    ----------
+    root : str
+        the directory of the cache; the ``OPHYD_BASLER_IMAGE_CACHE``
+        environment variable, or ``ophyd_basler_images`` in the temporary
+        directory, by default.
+    max_bytes : int
+        the size above which least recently used directories are removed.
+    """
+
+    def __init__(self, root=None, max_bytes=2**31):
+        if root is None:
+            root = os.environ.get(IMAGE_CACHE_ENV) or os.path.join(tempfile.gettempdir(), "ophyd_basler_images")
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def key(self, images, fmt="png", dtype=np.uint8, scale=1.0, offset=0.0):
+        """
+        Returns the hash of the frames and of how they are saved, or None if
+        the frames cannot be hashed without consuming them.
+        """
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(repr((fmt, np.dtype(dtype).str, float(scale), float(offset))).encode())
+        if hasattr(images, "fingerprint"):
+            hasher.update(images.fingerprint())
+        elif isinstance(images, (np.ndarray, list, tuple)):
+            # Frame by frame, so a stack is never copied as a whole.
+            for image in images:
+                image = np.ascontiguousarray(image)
+                hasher.update(repr((image.shape, image.dtype.str)).encode())
+                hasher.update(image.data)
+        else:
+            return None
+        return hasher.hexdigest()
+
+    def save_images(self, images, fmt="png", dtype=np.uint8, scale=1.0, offset=0.0, workers=4):
+        """
+        Returns the cached directory of the frames, saving them with
+        ``save_images()`` if they are not cached yet.
+        """
+        key = self.key(images, fmt=fmt, dtype=dtype, scale=scale, offset=offset)
+        if key is None:
+            logger.info("The images cannot be hashed, they are not cached.")
+            return save_images(images, fmt=fmt, dtype=dtype, scale=scale, offset=offset, workers=workers)
+
+        img_dir = os.path.join(self.root, key)
+        if os.path.isdir(img_dir):
+            os.utime(img_dir)
+            logger.info(f"Using the cached images of '{img_dir}'.")
+            return img_dir
+
+        os.makedirs(self.root, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=self.root)
+        try:
+            save_images(
+                images, img_dir=staging_dir, fmt=fmt, dtype=dtype, scale=scale, offset=offset, workers=workers
+            )
+            os.rename(staging_dir, img_dir)
+        except OSError:
+            # Another process may have cached the same frames meanwhile.
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            if not os.path.isdir(img_dir):
+                raise
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        self.evict(keep=img_dir)
+        return img_dir
+
+    def entries(self):
+        """
+        Returns the cached directories as (path, size in bytes), from the
+        least to the most recently used.
+        """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for entry in os.scandir(self.root):
+            # Staging directories are hidden.
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, entry.path, size))
+        return [(path, size) for _, path, size in sorted(entries)]
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used directories, other than ``keep``,
+        until the cache holds at most ``max_bytes``.
+        """
+        entries = self.entries()
+        total = sum(size for _, size in entries)
+        for path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logger.info(f"Evicting the cached images of '{path}'.")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """
+        Removes every cached directory.
+        """
+        for path, _ in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
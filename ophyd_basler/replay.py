@@ -0,0 +1,204 @@
+import os
+
+import numpy as np
+from event_model import unpack_datum_page, unpack_event_page
+from ophyd import Component as Cpt
+from ophyd import Signal
+
+from .basler_camera import BaslerCamera
+from .simulation import RecordedFrames, SimulatedCamera
+
+# The pixel formats the frames of a recorded run are replayed in, by dtype.
+REPLAY_PIXEL_FORMATS = {np.dtype(np.uint8): "Mono8", np.dtype(np.uint16): "Mono16"}
+
+
+def recorded_run(documents, field="basler_cam_image", stream="primary"):
+    """
+    Returns the file of the images recorded in a run, and the time each of
+    its frames was acquired, so that the run can be replayed with its
+    original timing.
+
+    Parameters
+    ----------
+    documents : iterable of (name, doc)
+        the documents of the run, e.g. ``hdr.documents(fill=False)``.
+    field : str
+        the name of the image field.
+    stream : str
+        the name of the event stream.
+
+    Returns
+    -------
+    (filename, timestamps), where ``timestamps[i]`` is the time of frame ``i``
+    of the file, in seconds since the epoch.
+    """
+    resources = {}
+    datums = {}
+    descriptors = set()
+    events = []
+
+    for name, doc in documents:
+        if name == "resource" and doc["spec"] == "BASLER_CAM_HDF5":
+            resources[doc["uid"]] = os.path.join(doc.get("root", ""), doc["resource_path"])
+        elif name == "datum":
+            datums[doc["datum_id"]] = (doc["resource"], doc["datum_kwargs"]["frame"])
+        elif name == "datum_page":
+            for datum in unpack_datum_page(doc):
+                datums[datum["datum_id"]] = (datum["resource"], datum["datum_kwargs"]["frame"])
+        elif name == "descriptor" and doc.get("name") == stream and field in doc["data_keys"]:
+            descriptors.add(doc["uid"])
+        elif name == "event" and doc["descriptor"] in descriptors:
+            events.append(doc)
+        elif name == "event_page" and doc["descriptor"] in descriptors:
+            events.extend(unpack_event_page(doc))
+
+    if not events:
+        raise ValueError(f"No {field!r} images found in the {stream!r} stream.")
+    references = [datums[event["data"][field]] for event in events]
+    resource_uids = {resource_uid for resource_uid, _ in references}
+    if len(resource_uids) != 1:
+        raise ValueError(f"The {field!r} images of the run are spread over {len(resource_uids)} files.")
+    frames = [frame for _, frame in references]
+    if frames != list(range(len(frames))):
+        raise ValueError(f"The {field!r} images of the run are not the consecutive frames of their file.")
+
+    timestamps = np.array([event["timestamps"].get(field, event["time"]) for event in events])
+    return resources[resource_uids.pop()], timestamps
+
+
+class ReplayCamera(SimulatedCamera):
+    """
+    A simulated camera replaying the frames of a recorded BASLER_CAM_HDF5
+    file once, in order, see ``RecordedFrames``.
+
+    Free-running, frame ``i`` is produced ``(timestamps[i] - timestamps[0]) /
+    speed`` seconds after the first grab since ``rewind()``, or as soon as it
+    is retrieved without timestamps or with a ``speed`` of 0; a frame that is
+    retrieved late is produced late rather than skipped, so every frame is
+    replayed. With ``TriggerMode`` "On", each software trigger produces the
+    next frame. Grabs fail once all the frames were replayed.
+
+    Parameters
+    ----------
+    frames : RecordedFrames
+        the recorded frames.
+    timestamps : sequence of float
+        the time each frame was acquired, in seconds, see ``recorded_run()``.
+    speed : float
+        the factor the original timing is accelerated by.
+    """
+
+    def __init__(self, frames, timestamps=None, speed=1.0, **kwargs):
+        self._offsets = None
+        self._epoch = None
+        super().__init__(frames, **kwargs)
+        self.set_timing(timestamps, speed)
+
+    def set_timing(self, timestamps=None, speed=1.0):
+        """
+        Sets the timing of the replay, see ``ReplayCamera``.
+        """
+        if speed < 0:
+            raise ValueError(f"The replay speed must be positive, not {speed}.")
+        offsets = None
+        if timestamps is not None and speed > 0:
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            if timestamps.shape != (len(self._sequence),):
+                raise ValueError(f"There are {len(timestamps)} timestamps for {len(self._sequence)} frames.")
+            if np.any(np.diff(timestamps) < 0):
+                raise ValueError("The timestamps are not in increasing order.")
+            offsets = (timestamps - timestamps[0]) / speed
+        with self._condition:
+            self._offsets = offsets
+
+    def rewind(self):
+        """
+        Restarts the replay from the first frame.
+        """
+        with self._condition:
+            if self._grabbing:
+                raise RuntimeError("Cannot rewind while grabbing.")
+            self._index = 0
+            self._epoch = None
+
+    def _start_grabbing(self, max_frames):
+        super()._start_grabbing(max_frames)
+        with self._condition:
+            if self._epoch is None:
+                self._epoch = self._start
+
+    def _ready_time(self):
+        if self.TriggerMode() == "On":
+            return super()._ready_time()
+        if self._offsets is None or self._index >= len(self._offsets):
+            return self._start
+        return self._epoch + self._offsets[self._index]
+
+    def _skipped(self, now):
+        return 0
+
+    def _frame(self, index):
+        if index >= len(self._sequence):
+            raise StopIteration
+        return super()._frame(index)
+
+
+class ReplayBaslerCamera(BaslerCamera):
+    """
+    A ``BaslerCamera`` replaying the frames of a recorded BASLER_CAM_HDF5 run,
+    e.g. to load-test downstream consumers at production frame rates.
+
+    The frames go through the same grab, correction, statistics and writing
+    path as those of a camera, into a new file with new resource and datum
+    documents. Each time the camera is staged, the replay restarts from the
+    first frame, with the original timing accelerated by ``replay_speed``, or
+    as fast as possible with a ``replay_speed`` of 0 or without timestamps,
+    see ``ReplayCamera``. The frames are read ahead by blocks on a background
+    thread, so that the disk does not hold the replay back.
+
+    Only raw monochrome frames can be replayed; they are replayed in the
+    Mono8 or Mono16 pixel format, depending on their dtype.
+
+    Parameters
+    ----------
+    source : str
+        the recorded BASLER_CAM_HDF5 file.
+    timestamps : sequence of float
+        the time each frame was acquired, in seconds.
+    block_size : int
+        the number of frames read at once.
+    prefetch : int
+        the number of blocks read ahead.
+
+    Usage
+    -----
+
+        filename, timestamps = recorded_run(db[uid].documents(fill=False))
+        camera = ReplayBaslerCamera(source=filename, timestamps=timestamps, name="basler_cam")
+        camera.replay_speed.put(4)
+        RE(bp.count([camera], num=len(timestamps)))
+    """
+
+    replay_source = Cpt(Signal, value="", kind="config")
+    replay_speed = Cpt(Signal, value=1.0, kind="config")  # 1 for the original timing, 0 for as fast as possible
+
+    def __init__(self, *args, source, timestamps=None, block_size=16, prefetch=4, **kwargs):
+        frames = RecordedFrames(os.fspath(source), block_size=block_size, prefetch=prefetch)
+        if frames.dtype not in REPLAY_PIXEL_FORMATS or len(frames.shape) != 3:
+            frames.close()
+            raise ValueError(
+                f"Only raw monochrome frames can be replayed, "
+                f"not {frames.dtype} frames shaped as {frames.shape[1:]}."
+            )
+        kwargs.setdefault("pixel_format", REPLAY_PIXEL_FORMATS[frames.dtype])
+        self._timestamps = timestamps
+        super().__init__(*args, camera_object=ReplayCamera(frames, timestamps), **kwargs)
+        self.replay_source.put(frames.filename)
+
+    def set_custom_images(self, *args, **kwargs):
+        raise TypeError("The frames of a replay are those of the recorded run.")
+
+    def stage(self):
+        self.camera_object.set_timing(self._timestamps, self.replay_speed.get())
+        self.camera_object.rewind()
+        super().stage()
@@ -0,0 +1,532 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from ophyd import Component as Cpt
+from ophyd import Signal
+from pypylon import pylon
+
+from .basler_camera import BaslerCamera
+from .basler_handler import BaslerCamHDF5Handler
+from .custom_images import WanderingGaussianBeam, convert_image, load_images
+from .utils import pixel_format_dtype
+
+# The pixel formats of the simulated camera, and the maximum level of their pixels.
+PIXEL_FORMATS = {"Mono8": 255, "Mono10": 1023, "Mono12": 4095, "Mono16": 65535}
+
+
+class SimulatedFeature:
+    """
+    A parameter of the simulated camera, with the subset of the interface of
+    a pylon (GenICam) feature that ``BaslerCamera`` uses: ``GetValue()``,
+    ``SetValue()``, ``Value``, calling it for its value, and ``Min``, ``Max``
+    and ``Symbolics``.
+    """
+
+    def __init__(self, value, minimum=None, maximum=None, symbolics=None, writable=True):
+        self._value = value
+        self.Min = minimum
+        self.Max = maximum
+        self.Symbolics = symbolics
+        self._writable = writable
+
+    def GetValue(self):
+        return self._value
+
+    def SetValue(self, value):
+        if not self._writable:
+            raise ValueError("The feature is read-only.")
+        if self.Symbolics is not None and value not in self.Symbolics:
+            raise ValueError(f"Unknown value {value!r}, expected one of {self.Symbolics}.")
+        if (self.Min is not None and value < self.Min) or (self.Max is not None and value > self.Max):
+            raise ValueError(f"{value} is out of the range [{self.Min}, {self.Max}].")
+        self._value = value
+
+    @property
+    def Value(self):
+        return self._value
+
+    @Value.setter
+    def Value(self, value):
+        self.SetValue(value)
+
+    def __call__(self):
+        return self._value
+
+    def __eq__(self, other):
+        if isinstance(other, SimulatedFeature):
+            other = other._value
+        return self._value == other
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._value!r})"
+
+
+class SimulatedDeviceInfo:
+    """
+    The device information of the simulated camera.
+    """
+
+    def __init__(self, model_name="Simulation", serial_number="0815-0000", user_defined_name=""):
+        self._model_name = model_name
+        self._serial_number = serial_number
+        self._user_defined_name = user_defined_name
+
+    def GetModelName(self):
+        return self._model_name
+
+    def GetSerialNumber(self):
+        return self._serial_number
+
+    def GetUserDefinedName(self):
+        return self._user_defined_name
+
+
+class SimulatedGrabResult:
+    """
+    The result of ``SimulatedCamera.RetrieveResult()``, with the subset of the
+    interface of a pylon grab result that ``BaslerCamera`` uses.
+
+    A result without an image is not valid, as a pylon result returned on a
+    timeout; a result with an error is valid, but not successful.
+    """
+
+    def __init__(self, image=None, image_number=0, timestamp=0, skipped=0, error=None):
+        self._image = image
+        self._image_number = image_number
+        self._timestamp = timestamp
+        self._skipped = skipped
+        self._error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Release()
+
+    def Release(self):
+        self._image = None
+
+    def IsValid(self):
+        return self._image is not None or self._error is not None
+
+    def GrabSucceeded(self):
+        return self._image is not None and self._error is None
+
+    def GetErrorDescription(self):
+        return self._error or ""
+
+    def GetNumberOfSkippedImages(self):
+        return self._skipped
+
+    def GetImageNumber(self):
+        return self._image_number
+
+    def GetTimeStamp(self):
+        """The time the frame was grabbed, in nanoseconds."""
+        return self._timestamp
+
+    @contextmanager
+    def GetArrayZeroCopy(self):
+        yield self._image
+
+    @property
+    def Array(self):
+        return np.array(self._image)
+
+
+class RecordedFrames:
+    """
+    The frames of a recorded BASLER_CAM_HDF5 file, as a sequence.
+
+    The frames are read through ``BaslerCamHDF5Handler`` by blocks of
+    ``block_size`` consecutive frames, with one read per block, so iterating
+    over the frames in order costs one read every ``block_size`` frames.
+    With ``prefetch``, the next ``prefetch`` blocks are read ahead on a
+    background thread, so that a reader going through the frames in order
+    rarely waits for the disk.
+    """
+
+    def __init__(self, filename, block_size=16, prefetch=0):
+        self.filename = filename
+        self._handler = BaslerCamHDF5Handler(filename)
+        self._block_size = block_size
+        self._prefetch = prefetch
+        with self._handler.file_pool.file(filename) as f:
+            dataset = f["/entry/image"]
+            self.shape = dataset.shape
+            self.dtype = dataset.dtype
+        self._block = None
+        self._block_start = None
+        # The blocks being read ahead, as {start: Future}.
+        self._pending = {}
+        self._executor = None
+        if prefetch:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="basler-prefetch")
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read_block(self, start):
+        return self._handler.get_frame_range(start, min(start + self._block_size, len(self)))
+
+    def __getitem__(self, index):
+        index = range(len(self))[index]
+        start = index - index % self._block_size
+        if start != self._block_start:
+            future = self._pending.pop(start, None)
+            self._block = future.result() if future is not None else self._read_block(start)
+            self._block_start = start
+            if self._executor is not None:
+                self._read_ahead(start)
+        return self._block[index - start]
+
+    def _read_ahead(self, start):
+        ahead = range(start + self._block_size, start + (self._prefetch + 1) * self._block_size, self._block_size)
+        # Blocks that are not ahead any more are not needed, e.g. after jumping back to the first frame.
+        for other in [other for other in self._pending if other not in ahead]:
+            self._pending.pop(other).cancel()
+        for other in ahead:
+            if other < len(self) and other not in self._pending:
+                self._pending[other] = self._executor.submit(self._read_block, other)
+
+    def close(self):
+        if self._executor is not None:
+            for future in self._pending.values():
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._pending = {}
+        self._block = None
+        self._block_start = None
+        self._handler.close()
+
+
+class SimulatedCamera:
+    """
+    A pure-Python camera with the subset of the interface of
+    ``pylon.InstantCamera`` that ``BaslerCamera`` uses, which needs neither a
+    camera nor the pylon camera emulation.
+
+    The camera produces the frames of an array, of a sequence such as a
+    ``WanderingGaussianBeam``, of an iterable, or of a recorded
+    BASLER_CAM_HDF5 file, converted to its pixel format, see
+    ``set_frames()``. The frames of a sequence are cycled through, and, as
+    with the pylon camera emulation, each grab continues from the frame
+    after the last one grabbed. Frames that already have the dtype of the
+    pixel format are not copied.
+
+    Free-running, the camera produces a frame every ``ExposureTimeAbs``
+    microseconds, or every ``1 / AcquisitionFrameRateAbs`` seconds if that is
+    longer; when more than ``MaxNumBuffer`` frames are waiting to be
+    retrieved, the oldest ones are skipped, as a camera whose grab buffers
+    are full. With ``TriggerMode`` "On", a frame is produced an exposure time
+    after each ``ExecuteSoftwareTrigger()``, if the ``TriggerSource`` is
+    "Software"; no hardware trigger ever fires.
+
+    Parameters
+    ----------
+    frames : ndarray, sequence, iterable or str
+        the frames, see ``set_frames()``; by default, a wandering Gaussian
+        beam of 256 frames.
+    width, height : int
+        the size of the default frames.
+    serial_number, user_defined_name : str
+        the device information of the camera.
+    """
+
+    def __init__(self, frames=None, width=1024, height=1040, serial_number="0815-0000", user_defined_name=""):
+        self._condition = threading.Condition()
+        self._open = False
+        self.DeviceInfo = SimulatedDeviceInfo(serial_number=serial_number, user_defined_name=user_defined_name)
+
+        self.Width = SimulatedFeature(width, writable=False)
+        self.Height = SimulatedFeature(height, writable=False)
+        self.PixelFormat = SimulatedFeature("Mono8", symbolics=tuple(PIXEL_FORMATS))
+        self.TriggerSelector = SimulatedFeature("FrameStart", symbolics=("FrameStart",))
+        self.TriggerMode = SimulatedFeature("Off", symbolics=("Off", "On"))
+        self.TriggerSource = SimulatedFeature("Line1", symbolics=("Line1", "Software"))
+        self.AcquisitionMode = SimulatedFeature("Continuous", symbolics=("SingleFrame", "Continuous"))
+        self.MaxNumBuffer = SimulatedFeature(10, minimum=1, maximum=1024)
+        self.ExposureTimeAbs = SimulatedFeature(10000.0, minimum=1.0, maximum=1e7)  # microseconds
+        self.AcquisitionFrameRateAbs = SimulatedFeature(0.0, minimum=0.0, maximum=1e6)  # 0 for unlimited
+
+        # The state of the grab.
+        self._grabbing = False
+        self._remaining = None  # the number of frames left to retrieve, or None for an unlimited grab
+        self._period = 0.0
+        self._start = 0.0
+        self._produced = 0  # the number of frames produced since the grab started, including skipped ones
+        self._triggers = deque()
+        self._last_ready = 0.0
+        self._image_number = 0
+
+        # The source of the frames, and the index of the next frame.
+        self._sequence = None
+        self._iterator = None
+        self._position = 0
+        self._index = 0
+
+        if frames is None:
+            frames = WanderingGaussianBeam(nf=256, nx=width, ny=height, seed=6313448000, dtype=np.uint8)
+        self.set_frames(frames)
+
+    def set_frames(self, frames):
+        """
+        Sets the frames the camera produces, starting over from the first one.
+
+        Parameters
+        ----------
+        frames : ndarray, sequence, iterable or str
+            frames shaped as (ny, nx): an array shaped as (num_frames, ny, nx)
+            or any sequence of frames, which is cycled through; an iterable
+            of frames, after which grabs fail; or the filename of a recorded
+            BASLER_CAM_HDF5 file, see ``RecordedFrames``. The size of the
+            frames sets the ``Width`` and ``Height`` of the camera.
+        """
+        if isinstance(frames, (str, os.PathLike)):
+            frames = RecordedFrames(os.fspath(frames))
+
+        if hasattr(frames, "__len__") and hasattr(frames, "__getitem__"):
+            if not len(frames):
+                raise ValueError("There are no frames.")
+            sequence, iterator, first = frames, None, np.asarray(frames[0])
+        else:
+            iterator = iter(frames)
+            first = next(iterator, None)
+            if first is None:
+                raise ValueError("There are no frames.")
+            sequence, first = None, np.asarray(first)
+            iterator = itertools.chain([first], iterator)
+        if first.ndim != 2:
+            raise ValueError(
+                f"The simulated camera only produces monochrome frames, not frames shaped as {first.shape}."
+            )
+
+        with self._condition:
+            if self._grabbing:
+                raise RuntimeError("Cannot set the frames while grabbing.")
+            self._sequence, self._iterator = sequence, iterator
+            self._position = 0
+            self._index = 0
+            self.Height._value, self.Width._value = first.shape
+
+    def GetDeviceInfo(self):
+        return self.DeviceInfo
+
+    @property
+    def PixelDynamicRangeMin(self):
+        return SimulatedFeature(0, writable=False)
+
+    @property
+    def PixelDynamicRangeMax(self):
+        return SimulatedFeature(PIXEL_FORMATS[self.PixelFormat()], writable=False)
+
+    @property
+    def PayloadSize(self):
+        itemsize = pixel_format_dtype(self.PixelFormat()).itemsize
+        return SimulatedFeature(self.Width() * self.Height() * itemsize, writable=False)
+
+    def Open(self):
+        self._open = True
+
+    def Close(self):
+        if self._grabbing:
+            self.StopGrabbing()
+        self._open = False
+
+    def IsOpen(self):
+        return self._open
+
+    def StartGrabbing(self):
+        self._start_grabbing(None)
+
+    def StartGrabbingMax(self, max_frames):
+        self._start_grabbing(max_frames)
+
+    def _start_grabbing(self, max_frames):
+        with self._condition:
+            if self._grabbing:
+                raise RuntimeError("The camera is already grabbing.")
+            exposure = 1e-6 * self.ExposureTimeAbs()
+            frame_rate = self.AcquisitionFrameRateAbs()
+            self._period = max(exposure, 1 / frame_rate) if frame_rate > 0 else exposure
+            self._remaining = max_frames
+            self._start = time.monotonic()
+            self._produced = 0
+            self._triggers.clear()
+            self._last_ready = 0.0
+            self._grabbing = True
+
+    def StopGrabbing(self):
+        with self._condition:
+            self._grabbing = False
+            self._condition.notify_all()
+
+    def IsGrabbing(self):
+        return self._grabbing
+
+    def WaitForFrameTriggerReady(self, timeout, handling=pylon.TimeoutHandling_ThrowException):
+        """
+        Returns whether the camera accepts frame triggers, which it does while grabbing.
+        """
+        if self._grabbing:
+            return True
+        if handling == pylon.TimeoutHandling_ThrowException:
+            raise TimeoutError(f"The camera was not ready for a frame trigger within {timeout} ms.")
+        return False
+
+    def ExecuteSoftwareTrigger(self):
+        with self._condition:
+            if self._grabbing and self.TriggerMode() == "On" and self.TriggerSource() == "Software":
+                self._triggers.append(time.monotonic())
+                self._condition.notify_all()
+
+    def _ready_time(self):
+        """
+        Returns the time the next frame is ready, or None if it waits for a trigger.
+        """
+        if self.TriggerMode() == "On":
+            if not self._triggers:
+                return None
+            return max(self._triggers[0] + 1e-6 * self.ExposureTimeAbs(), self._last_ready + self._period)
+        return self._start + (self._produced + 1) * self._period
+
+    def _skipped(self, now):
+        """
+        Returns the number of frames of the free-running camera that are
+        skipped before the next one, as they did not fit in the grab buffers.
+        """
+        if self._period <= 0:
+            return 0
+        available = int((now - self._start) / self._period)
+        return max(available - self._produced - self.MaxNumBuffer(), 0)
+
+    def RetrieveResult(self, timeout, handling=pylon.TimeoutHandling_ThrowException):
+        """
+        Waits for the next frame, for at most ``timeout`` milliseconds.
+
+        On a timeout, raises a TimeoutError, or returns an invalid result
+        with ``pylon.TimeoutHandling_Return``. An invalid result is also
+        returned once the camera stops grabbing.
+        """
+        deadline = time.monotonic() + 1e-3 * timeout
+        with self._condition:
+            while True:
+                if not self._grabbing:
+                    return SimulatedGrabResult()
+                now = time.monotonic()
+                ready = self._ready_time()
+                if ready is not None and ready <= now:
+                    break
+                if now >= deadline:
+                    if handling == pylon.TimeoutHandling_ThrowException:
+                        raise TimeoutError(f"No frame was grabbed within {timeout} ms.")
+                    return SimulatedGrabResult()
+                self._condition.wait((deadline if ready is None else min(ready, deadline)) - now)
+
+            skipped = 0
+            if self.TriggerMode() == "On":
+                self._triggers.popleft()
+                self._last_ready = ready
+            else:
+                skipped = self._skipped(now)
+                self._produced += skipped + 1
+
+            index = self._index + skipped
+            self._index = index + 1
+            image_number = self._image_number = self._image_number + 1
+            if self._remaining is not None:
+                self._remaining -= 1
+                if not self._remaining:
+                    self._grabbing = False
+
+        timestamp = int(1e9 * (time.time() - (time.monotonic() - ready)))
+        try:
+            image = self._frame(index)
+        except StopIteration:
+            return SimulatedGrabResult(
+                image_number=image_number, error="The frames of the simulated camera ran out."
+            )
+        return SimulatedGrabResult(image, image_number=image_number, timestamp=timestamp, skipped=skipped)
+
+    def _frame(self, index):
+        if self._sequence is not None:
+            frame = self._sequence[index % len(self._sequence)]
+        else:
+            while self._position < index:
+                next(self._iterator)
+                self._position += 1
+            frame = next(self._iterator)
+            self._position += 1
+
+        frame = np.asarray(frame)
+        if frame.shape != (self.Height(), self.Width()):
+            raise ValueError(f"The frame {index} is shaped as {frame.shape}, not as the other frames.")
+        pixel_format = self.PixelFormat()
+        dtype = pixel_format_dtype(pixel_format)
+        image = convert_image(frame, dtype=dtype)
+        if PIXEL_FORMATS[pixel_format] < np.iinfo(dtype).max:
+            image = np.minimum(image, PIXEL_FORMATS[pixel_format])
+        return image
+
+
+class SimulatedBaslerCamera(BaslerCamera):
+    """
+    A ``BaslerCamera`` backed by a ``SimulatedCamera`` instead of a pylon
+    device, e.g. to test or benchmark the storage, statistics and document
+    pipeline at frame rates beyond those of the pylon camera emulation.
+
+    It grabs, triggers, stages and flies as ``BaslerCamera`` does;
+    ``frame_rate`` limits the rate of the free-running camera, in frames per
+    second, and ``exposure_time`` sets the time it takes to produce a frame.
+
+    Parameters
+    ----------
+    frames : ndarray, sequence, iterable or str
+        the frames, see ``SimulatedCamera.set_frames()``.
+    image_shape : tuple
+        the (height, width) of the default frames.
+
+    Usage
+    -----
+
+        camera = SimulatedBaslerCamera(frames=WanderingGaussianBeam(256, 1024, 1040, dtype=np.uint8), name="cam")
+        camera.exposure_time.put(1)
+        camera.frame_rate.put(500)
+        RE(bp.count([camera], num=1000))
+    """
+
+    frame_rate = Cpt(Signal, value=0.0, kind="config")  # frames per second, 0 for as fast as the exposure allows
+
+    def __init__(self, *args, frames=None, image_shape=(1040, 1024), **kwargs):
+        height, width = image_shape
+        camera_object = SimulatedCamera(frames, width=width, height=height)
+        super().__init__(*args, camera_object=camera_object, **kwargs)
+
+    def set_custom_images(self, images=None, img_dir=None, **kwargs):
+        """
+        Set the frames of the simulated camera, either via an ndarray, a
+        sequence or iterable of frames, or a recorded BASLER_CAM_HDF5 file, or
+        via a directory with images, see ``load_images()``.
+
+        The frames are used as they are, so the arguments of
+        ``BaslerCamera.set_custom_images()`` about saving them are ignored.
+        """
+        if images is None and img_dir is None:
+            raise ValueError("Either the 'images' or the 'img_dir' kwarg should be passed.")
+        if images is None:
+            images = load_images(img_dir)
+            self._img_dir = img_dir
+        self.camera_object.set_frames(images)
+        self.image_shape.put((self.camera_object.Height(), self.camera_object.Width()))
+        self.payload_size.put(self.camera_object.PayloadSize())
+
+    def stage(self):
+        self.camera_object.AcquisitionFrameRateAbs.SetValue(self.frame_rate.get())
+        super().stage()
@@ -0,0 +1,326 @@
+import numpy as np
+from ophyd import Component as Cpt
+from ophyd import Device, Kind, Signal
+
+STATS = ("total", "min", "max", "sigma", "centroid_x", "centroid_y", "sigma_x", "sigma_y", "sigma_xy")
+ROI_STATS = ("sum", "mean", "max", "centroid_x", "centroid_y")
+
+# The statistics that need the projections of the frame on the x and y axes.
+_PROFILE_STATS = {"centroid_x", "centroid_y", "sigma_x", "sigma_y", "sigma_xy"}
+
+
+def compute_stats(image, stats=STATS):
+    """
+    Computes statistics of a frame, as areaDetector's NDPluginStats does.
+
+    Every statistic is a reduction over the frame in its native dtype; the
+    accumulations run in float64 through NumPy's buffered casting, so the frame
+    is never copied or converted as a whole. The moments are computed from the
+    x and y profiles of the frame, and only the statistics asked for are
+    computed. The channels of color frames are summed.
+
+    Parameters
+    ----------
+    image : ndarray
+        a frame shaped as (ny, nx) or (ny, nx, channels).
+    stats : iterable of str
+        the statistics to compute, among ``STATS``:
+
+        - total: the sum of the pixel values;
+        - min, max: the extreme pixel values;
+        - sigma: the standard deviation of the pixel values;
+        - centroid_x, centroid_y: the intensity-weighted mean column and row;
+        - sigma_x, sigma_y: the intensity-weighted standard deviations of the
+          column and row;
+        - sigma_xy: the intensity-weighted correlation of the column and row,
+          between -1 and 1.
+
+    Returns
+    -------
+    a dict of the statistics, as floats; the moments are NaN for a frame
+    without intensity.
+    """
+    stats = set(stats)
+    unknown = stats.difference(STATS)
+    if unknown:
+        raise ValueError(f"Unknown statistics {sorted(unknown)}, expected some of {STATS}.")
+
+    # The einsum subscripts of the frame: rows, columns and channels, if any.
+    axes = "ijk"[: image.ndim]
+
+    values = {}
+    if "min" in stats:
+        values["min"] = float(image.min())
+    if "max" in stats:
+        values["max"] = float(image.max())
+    if "sigma" in stats:
+        mean = image.mean(dtype=np.float64)
+        mean_square = np.einsum(f"{axes},{axes}->", image, image, dtype=np.float64) / image.size
+        values["sigma"] = float(np.sqrt(max(mean_square - mean**2, 0.0)))
+
+    if not stats & _PROFILE_STATS:
+        if "total" in stats:
+            values["total"] = float(image.sum(dtype=np.float64))
+        return values
+
+    # Only project the frame on the axes the statistics need; each projection is one pass over the frame.
+    moments = {}
+    total = None
+    for axis, subscript, needed in (
+        ("x", "j", {"centroid_x", "sigma_x", "sigma_xy"}),
+        ("y", "i", {"centroid_y", "sigma_y", "sigma_xy"}),
+    ):
+        if stats & needed:
+            profile = np.einsum(f"{axes}->{subscript}", image, dtype=np.float64)
+            total = profile.sum()
+            coords = np.arange(len(profile), dtype=np.float64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                centroid = profile @ coords / total
+                variance = max(profile @ coords**2 / total - centroid**2, 0.0)
+            moments[axis] = (coords, centroid, variance)
+            values[f"centroid_{axis}"] = float(centroid)
+            values[f"sigma_{axis}"] = float(np.sqrt(variance))
+    if "total" in stats:
+        values["total"] = float(total)
+
+    if "sigma_xy" in stats:
+        (x, centroid_x, var_x), (y, centroid_y, var_y) = moments["x"], moments["y"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            moment_xy = y @ np.einsum(f"{axes},j->i", image, x, dtype=np.float64) / total
+            values["sigma_xy"] = float((moment_xy - centroid_x * centroid_y) / np.sqrt(var_x * var_y))
+
+    return {name: value for name, value in values.items() if name in stats}
+
+
+def _band_profiles(image, edges, rois_spans, axis, dtype):
+    """
+    Returns the cumulative profiles of the bands of a frame between
+    consecutive ``edges`` along ``axis``, shaped as (len(edges), length) for
+    bands of rows (axis 0) or (length, len(edges)) for bands of columns.
+
+    Bands covered by none of the ``rois_spans`` are skipped, as no region
+    profile depends on them.
+    """
+    length = image.shape[1 - axis]
+    profiles = np.zeros((len(edges), length) if axis == 0 else (length, len(edges)), dtype=dtype)
+    for k, (start, stop) in enumerate(zip(edges[:-1], edges[1:])):
+        if not any(span_start <= start and stop <= span_stop for span_start, span_stop in rois_spans):
+            continue
+        if axis == 0:
+            np.sum(image[start:stop], axis=0, dtype=dtype, out=profiles[k + 1])
+        else:
+            np.sum(image[:, start:stop], axis=1, dtype=dtype, out=profiles[:, k + 1])
+    return np.cumsum(profiles, axis=axis, out=profiles)
+
+
+def compute_roi_stats(image, rois):
+    """
+    Computes the sum, mean, maximum and centroid of several rectangular
+    regions of interest of a frame in one batch.
+
+    The frame is cut into bands of rows and bands of columns at the edges of
+    the regions, and each band is projected once, so the projections cost at
+    most two passes over the frame however many regions there are. The x and
+    y profiles of every region are then differences of cumulative band
+    projections, and only its maximum is a reduction over its view of the
+    frame. The channels of color frames are summed.
+
+    Parameters
+    ----------
+    image : ndarray
+        a frame shaped as (ny, nx) or (ny, nx, channels).
+    rois : dict
+        the regions, as {name: (x, y, width, height)}.
+
+    Returns
+    -------
+    a dict of {name: {statistic: value}}, with the statistics of ``ROI_STATS``;
+    the centroids are in the pixel coordinates of the frame, and NaN for a
+    region without intensity.
+    """
+    if not rois:
+        return {}
+    if image.ndim == 3:
+        image = image.sum(axis=-1)
+
+    # Integer frames are summed exactly, and the differences of unsigned cumulative sums cannot wrap.
+    if image.dtype.kind == "u":
+        dtype = np.uint64
+    elif image.dtype.kind == "i":
+        dtype = np.int64
+    else:
+        dtype = np.float64
+
+    x_spans = [(x, x + width) for x, _, width, _ in rois.values()]
+    y_spans = [(y, y + height) for _, y, _, height in rois.values()]
+    x_edges = sorted({edge for span in x_spans for edge in span})
+    y_edges = sorted({edge for span in y_spans for edge in span})
+    x0, y0 = x_edges[0], y_edges[0]
+    box = image[y0 : y_edges[-1], x0 : x_edges[-1]]
+
+    # Cumulative x profiles of the bands of rows, and y profiles of the bands of columns.
+    columns = _band_profiles(
+        box, [edge - y0 for edge in y_edges], [(a - y0, b - y0) for a, b in y_spans], 0, dtype
+    )
+    rows = _band_profiles(box, [edge - x0 for edge in x_edges], [(a - x0, b - x0) for a, b in x_spans], 1, dtype)
+    x_index = {edge: k for k, edge in enumerate(x_edges)}
+    y_index = {edge: k for k, edge in enumerate(y_edges)}
+
+    values = {}
+    for name, (x, y, width, height) in rois.items():
+        bx, by = x - x0, y - y0
+        profile_x = columns[y_index[y + height], bx : bx + width] - columns[y_index[y], bx : bx + width]
+        profile_y = rows[by : by + height, x_index[x + width]] - rows[by : by + height, x_index[x]]
+        total = np.float64(profile_x.sum())
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centroid_x = x + profile_x @ np.arange(width, dtype=np.float64) / total
+            centroid_y = y + profile_y @ np.arange(height, dtype=np.float64) / total
+        values[name] = {
+            "sum": float(total),
+            "mean": float(total / (width * height)),
+            "max": float(box[by : by + height, bx : bx + width].max()),
+            "centroid_x": float(centroid_x),
+            "centroid_y": float(centroid_y),
+        }
+    return values
+
+
+class StatsPlugin(Device):
+    """
+    The statistics of the acquired frames.
+
+    Only the statistics listed in ``enabled`` are computed and read; the
+    others are omitted, so that high frame rates only pay for what is used.
+    Their kind is updated when the device is staged.
+    """
+
+    enabled = Cpt(Signal, value=(), kind="config")  # some of ophyd_basler.stats.STATS
+    total = Cpt(Signal, kind="omitted")
+    min = Cpt(Signal, kind="omitted")
+    max = Cpt(Signal, kind="omitted")
+    sigma = Cpt(Signal, kind="omitted")
+    centroid_x = Cpt(Signal, kind="omitted")
+    centroid_y = Cpt(Signal, kind="omitted")
+    sigma_x = Cpt(Signal, kind="omitted")
+    sigma_y = Cpt(Signal, kind="omitted")
+    sigma_xy = Cpt(Signal, kind="omitted")
+
+    def _enabled_stats(self):
+        enabled = tuple(self.enabled.get())
+        unknown = set(enabled).difference(STATS)
+        if unknown:
+            raise ValueError(f"Unknown statistics {sorted(unknown)}, expected some of {STATS}.")
+        return enabled
+
+    def stage(self):
+        enabled = self._enabled_stats()
+        for name in STATS:
+            getattr(self, name).kind = Kind.normal if name in enabled else Kind.omitted
+        return super().stage()
+
+    def compute(self, image):
+        """
+        Returns the enabled statistics of a frame, keyed by their signal.
+        """
+        values = compute_stats(image, self._enabled_stats())
+        return {getattr(self, name): value for name, value in values.items()}
+
+
+class ROIPlugin(Device):
+    """
+    The statistics of named rectangular regions of interest of the acquired
+    frames, see ``compute_roi_stats()``.
+
+    The regions are set with ``set_rois()``, which creates a signal for each
+    of their ``ROI_STATS``, named e.g. ``basler_cam_rois_spot_sum``, and a
+    configuration signal holding the region itself, as (x, y, width, height).
+    These signals are not components, so ``read()``, ``describe()`` and their
+    configuration counterparts are extended to report them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._rois = {}
+        self._region_signals = {}
+        self._stat_signals = {}
+
+    @property
+    def rois(self):
+        """The regions, as {name: (x, y, width, height)}."""
+        return dict(self._rois)
+
+    def set_rois(self, rois):
+        """
+        Sets the regions of interest, replacing the previous ones.
+
+        Parameters
+        ----------
+        rois : dict
+            the regions, as {name: (x, y, width, height)}, in pixels.
+        """
+        rois = {name: tuple(int(v) for v in region) for name, region in (rois or {}).items()}
+        for name, region in rois.items():
+            if not name.isidentifier():
+                raise ValueError(f"The region name {name!r} is not a valid identifier.")
+            if len(region) != 4 or min(region) < 0 or min(region[2:]) < 1:
+                raise ValueError(f"The region {name!r} must be a non-empty (x, y, width, height) rectangle.")
+
+        self._rois = rois
+        self._region_signals = {
+            name: Signal(name=f"{self.name}_{name}_region", value=region, parent=self, kind="config")
+            for name, region in rois.items()
+        }
+        self._stat_signals = {
+            name: {stat: Signal(name=f"{self.name}_{name}_{stat}", parent=self) for stat in ROI_STATS}
+            for name in rois
+        }
+
+    def validate(self, frame_shape):
+        """
+        Raises if a region does not fit in frames of the given shape.
+        """
+        ny, nx = frame_shape[:2]
+        for name, (x, y, width, height) in self._rois.items():
+            if x + width > nx or y + height > ny:
+                raise ValueError(f"The region {name!r} does not fit in frames of {nx}x{ny} pixels.")
+
+    def compute(self, image):
+        """
+        Returns the statistics of the regions of a frame, keyed by their signal.
+        """
+        values = compute_roi_stats(image, self._rois)
+        return {
+            self._stat_signals[name][stat]: value
+            for name, stats in values.items()
+            for stat, value in stats.items()
+        }
+
+    def _collect(self, signals, method):
+        res = {}
+        for signal in signals:
+            res.update(getattr(signal, method)())
+        return res
+
+    def read(self):
+        res = super().read()
+        res.update(self._collect(self._iter_stat_signals(), "read"))
+        return res
+
+    def describe(self):
+        res = super().describe()
+        res.update(self._collect(self._iter_stat_signals(), "describe"))
+        return res
+
+    def read_configuration(self):
+        res = super().read_configuration()
+        res.update(self._collect(self._region_signals.values(), "read"))
+        return res
+
+    def describe_configuration(self):
+        res = super().describe_configuration()
+        res.update(self._collect(self._region_signals.values(), "describe"))
+        return res
+
+    def _iter_stat_signals(self):
+        for signals in self._stat_signals.values():
+            yield from signals.values()
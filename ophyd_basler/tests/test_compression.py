@@ -0,0 +1,70 @@
+import h5py
+import numpy as np
+import pytest
+
+from ophyd_basler.basler_handler import BaslerCamHDF5Handler
+from ophyd_basler.compression import CODECS, SHUFFLES, ChunkCompressor, ChunkDecompressor, compression_options
+from ophyd_basler.simulation import SimulatedBaslerCamera
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_handler_reads_codec(tmp_path, codec):
+    shuffle = "bit" if codec.startswith(("bitshuffle-", "blosc-")) else "none"
+    images = np.random.default_rng(0).integers(0, 256, size=(4, 32, 48), dtype=np.uint8)
+
+    filename = str(tmp_path / "images.h5")
+    with h5py.File(filename, "x") as f:
+        f.create_dataset(
+            "/entry/image",
+            data=images,
+            chunks=(1, 32, 48),
+            **compression_options(codec, level=3, shuffle=shuffle),
+        )
+
+    handler = BaslerCamHDF5Handler(filename)
+    for frame, image in enumerate(images):
+        np.testing.assert_array_equal(handler(frame=frame), image)
+
+
+@pytest.mark.parametrize("shuffle", SHUFFLES)
+@pytest.mark.parametrize("codec", CODECS)
+def test_chunk_decompressor(tmp_path, codec, shuffle):
+    try:
+        options = compression_options(codec, shuffle=shuffle)
+    except ValueError:
+        pytest.skip(f"The {codec!r} codec does not support the {shuffle!r} shuffle filter.")
+    rng = np.random.default_rng(0)
+    # More elements than a bitshuffle block, and not a multiple of 8; the noise does not compress.
+    image = rng.integers(0, 64, size=(1, 67, 93), dtype=np.uint16)
+    noise = rng.integers(0, 2**16, size=(1, 67, 93), dtype=np.uint16)
+
+    with h5py.File(str(tmp_path / "images.h5"), "x") as f:
+        dataset = f.create_dataset(
+            "/entry/image", data=np.concatenate([image, noise]), chunks=(1, 67, 93), **options
+        )
+        decompressor = ChunkDecompressor.from_dataset(dataset)
+        for frame, expected in enumerate((image, noise)):
+            filter_mask, chunk = dataset.id.read_direct_chunk((frame, 0, 0))
+            np.testing.assert_array_equal(decompressor(chunk, filter_mask), expected)
+
+    # The chunks of ChunkCompressor decode as well.
+    compressor = ChunkCompressor(codec, shuffle=shuffle)
+    for expected in (image, noise):
+        filter_mask, chunk = compressor(expected)
+        np.testing.assert_array_equal(decompressor(chunk, filter_mask), expected)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        compression_options("snappy")
+    with pytest.raises(ValueError):
+        compression_options("lzf", shuffle="bit")
+
+
+def test_unknown_codec_at_stage(tmp_path):
+    camera = SimulatedBaslerCamera(root_dir=str(tmp_path), name="basler_cam")
+    camera.compression.put("snappy")
+    with pytest.raises(ValueError):
+        camera.stage()
+    # The codec is checked before the file is created.
+    assert not list(tmp_path.iterdir())
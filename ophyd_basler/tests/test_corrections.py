@@ -0,0 +1,93 @@
+import hashlib
+import os
+
+import bluesky.plans as bp
+import h5py
+import numpy as np
+import pytest
+
+from ophyd_basler.basler_camera import BaslerCamera
+from ophyd_basler.corrections import FrameCorrection, average_frames, capture_calibration
+from ophyd_basler.custom_images import get_wandering_gaussian_beam
+
+
+def test_frame_correction():
+    rng = np.random.default_rng(0)
+    dark = rng.uniform(0, 10, size=(6, 8))
+    flat = dark + rng.uniform(50, 100, size=(6, 8))
+    flat[0, 0] = dark[0, 0]
+    image = rng.integers(0, 256, size=(6, 8), dtype=np.uint8)
+
+    correction = FrameCorrection()
+    assert not correction.active
+
+    correction.set("dark", dark)
+    np.testing.assert_allclose(correction(image), image - dark, rtol=1e-6)
+
+    correction.set("flat", flat)
+    signal = flat - dark
+    gain = signal[signal > 0].mean() / signal
+    expected = (image - dark) * gain
+    expected[0, 0] = 0
+    out = np.empty((6, 8), dtype=np.float32)
+    assert correction(image, out=out) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-4, atol=1e-3)
+
+    with pytest.raises(ValueError):
+        correction.set("dark", np.zeros((4, 4)))
+    with pytest.raises(ValueError):
+        correction.set("flat", dark)
+    np.testing.assert_allclose(correction(image), expected, rtol=1e-4, atol=1e-3)
+
+    correction.set("dark", None)
+    correction.set("flat", None)
+    assert not correction.active
+
+
+def test_average_frames(tmp_path):
+    images = np.random.default_rng(0).integers(0, 256, size=(40, 4, 5), dtype=np.uint8)
+    filename = str(tmp_path / "images.h5")
+    with h5py.File(filename, "x") as f:
+        f.create_dataset("/entry/image", data=images)
+
+    average = average_frames(filename, block_size=16)
+    assert average.dtype == np.float32
+    np.testing.assert_allclose(average, images.mean(axis=0), rtol=1e-6)
+
+
+def test_camera_corrections(RE, db, make_dirs, num_counts=4):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, name="basler_cam")
+    emulated_basler_camera.exposure_time.put(10)
+
+    ny, nx = emulated_basler_camera.image_shape.get()
+    WGB = get_wandering_gaussian_beam(nf=num_counts, nx=nx, ny=ny, seed=6313448000)
+    emulated_basler_camera.set_custom_images(WGB)
+
+    (calibration_uid,) = RE(capture_calibration(emulated_basler_camera, "dark", num_frames=num_counts))
+    dark = np.array(list(db[calibration_uid].data(field="basler_cam_image", fill=True))).mean(axis=0)
+    assert emulated_basler_camera.dark_source.get() == emulated_basler_camera._data_file
+    assert emulated_basler_camera.correction_enabled.get()
+
+    flat = np.full((ny, nx), 300.0)
+    flat[:, : nx // 2] = 200.0
+    emulated_basler_camera.load_calibration("flat", flat)
+    flat_source = emulated_basler_camera.flat_source.get()
+    assert flat_source == f"array:{hashlib.blake2b(flat.data, digest_size=16).hexdigest()}:{ny}x{nx}:float64"
+    gain = (flat - dark).mean() / (flat - dark)
+
+    (uid,) = RE(bp.count([emulated_basler_camera], num=num_counts))
+    hdr = db[uid]
+    images = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+    assert images.dtype == np.uint8
+    expected = ((images - dark) * gain).mean(axis=(1, 2))
+    np.testing.assert_allclose(hdr.table()["basler_cam_mean"], expected, rtol=1e-4)
+    assert hdr.config_data("basler_cam")["primary"][0]["basler_cam_flat_source"] == flat_source
+
+    emulated_basler_camera.correct_stored.put(True)
+    (uid,) = RE(bp.count([emulated_basler_camera], num=num_counts))
+    hdr = db[uid]
+    images = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+    assert images.dtype == np.float32
+    np.testing.assert_allclose(hdr.table()["basler_cam_mean"], images.mean(axis=(1, 2)), rtol=1e-4)
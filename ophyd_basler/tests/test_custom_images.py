@@ -0,0 +1,149 @@
+import os
+
+import bluesky.plans as bp
+import cv2
+import numpy as np
+import pytest
+
+from ophyd_basler import custom_images
+from ophyd_basler.basler_camera import BaslerCamera
+from ophyd_basler.custom_images import (
+    IMAGE_FORMATS,
+    ImageCache,
+    WanderingGaussianBeam,
+    convert_image,
+    gaussian_2d,
+    get_wandering_gaussian_beam,
+    save_images,
+)
+
+
+def test_wandering_gaussian_beam():
+    nf, nx, ny = 12, 40, 30
+    beam = WanderingGaussianBeam(nf=nf, nx=nx, ny=ny, seed=1)
+    frames = get_wandering_gaussian_beam(nf=nf, nx=nx, ny=ny, seed=1)
+
+    assert len(beam) == nf
+    assert frames.shape == beam.shape == (nf, ny, nx)
+    np.testing.assert_array_equal(beam[5], frames[5])
+    np.testing.assert_array_equal(beam[-1], frames[-1])
+    np.testing.assert_array_equal(np.array(list(beam)), frames)
+    np.testing.assert_array_equal(np.concatenate(list(beam.batches(5))), frames)
+
+    # The separable frames match the 2-D Gaussian evaluated over the grid.
+    X, Y = np.meshgrid(np.arange(nx), np.arange(ny))
+    a, cx, cy, sx, sy = beam._params[:, 5]
+    np.testing.assert_allclose(frames[5], gaussian_2d(X, Y, a, cx, cy, sx, sy), atol=1e-9)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.uint8])
+def test_wandering_gaussian_beam_dtype(dtype):
+    frames = get_wandering_gaussian_beam(nf=4, nx=20, ny=10, seed=2)
+    beam = WanderingGaussianBeam(nf=4, nx=20, ny=10, seed=2, dtype=dtype)
+
+    assert beam[0].dtype == dtype
+    if dtype == np.uint8:
+        frames = np.clip(np.rint(frames), 0, 255)
+    np.testing.assert_array_equal(beam[:], frames.astype(dtype))
+
+    with pytest.raises(ValueError):
+        WanderingGaussianBeam(nf=4, nx=20, ny=10, dtype=np.int16)
+
+
+def test_convert_image():
+    image = np.array([[-3.0, 0.5, 1.5, 254.6, 300.0]])
+    np.testing.assert_array_equal(convert_image(image), [[0, 0, 2, 255, 255]])
+    np.testing.assert_array_equal(convert_image(image, scale=0.5, offset=10), [[8, 10, 11, 137, 160]])
+    np.testing.assert_array_equal(convert_image(image.astype(np.int64), dtype=np.uint16), [[0, 0, 1, 254, 300]])
+
+    frame = np.zeros((3, 4), dtype=np.uint8)
+    assert convert_image(frame) is frame
+
+
+@pytest.mark.parametrize("fmt", IMAGE_FORMATS)
+def test_save_images(tmp_path, fmt):
+    beam = WanderingGaussianBeam(nf=5, nx=32, ny=24, seed=3)
+
+    img_dir = save_images(iter(beam), img_dir=str(tmp_path / "images"), fmt=fmt, workers=2)
+
+    filenames = sorted(os.listdir(img_dir))
+    assert filenames == [f"pattern_{i:03d}.{fmt}" for i in range(5)]
+    for filename, frame in zip(filenames, beam):
+        image = cv2.imread(os.path.join(img_dir, filename), cv2.IMREAD_UNCHANGED)
+        np.testing.assert_array_equal(image, convert_image(frame))
+
+    with pytest.raises(ValueError):
+        save_images(beam, fmt="bmp", dtype=np.uint16)
+
+
+def test_image_cache(tmp_path, monkeypatch):
+    cache = ImageCache(root=str(tmp_path / "cache"))
+    beam = WanderingGaussianBeam(nf=4, nx=32, ny=24, seed=4)
+    frames = beam[:]
+
+    saved = []
+    monkeypatch.setattr(
+        custom_images, "save_images", lambda *args, **kwargs: saved.append(1) or save_images(*args, **kwargs)
+    )
+
+    img_dir = cache.save_images(frames)
+    assert sorted(os.listdir(img_dir)) == [f"pattern_{i:03d}.png" for i in range(4)]
+    assert cache.save_images(frames.copy()) == img_dir
+    assert cache.save_images(list(frames)) == img_dir
+    assert len(saved) == 1
+
+    # The format and the dtype are part of the key, and a beam is keyed by its parameters.
+    assert cache.save_images(frames, fmt="bmp") != img_dir
+    assert cache.save_images(frames, dtype=np.uint16) != img_dir
+    assert cache.save_images(beam) == cache.save_images(WanderingGaussianBeam(nf=4, nx=32, ny=24, seed=4))
+    beam = WanderingGaussianBeam(nf=64, nx=32, ny=24, seed=4)
+    assert cache.save_images(beam) != cache.save_images(WanderingGaussianBeam(nf=64, nx=32, ny=24, seed=5))
+    assert len(saved) == 6
+    assert not [name for name in os.listdir(cache.root) if name.startswith(".")]
+
+    # Iterators cannot be hashed without consuming them, so they are not cached.
+    other_dir = cache.save_images(iter(frames))
+    assert not other_dir.startswith(cache.root)
+    assert len(saved) == 7
+
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_image_cache_eviction(tmp_path):
+    cache = ImageCache(root=str(tmp_path / "cache"))
+    stacks = [np.full((2, 24, 32), level, dtype=np.uint8) for level in range(4)]
+    img_dirs = [cache.save_images(frames, fmt="bmp") for frames in stacks]
+    size = cache.entries()[0][1]
+    assert [path for path, _ in cache.entries()] == img_dirs
+
+    # Using a directory makes it the most recently used one.
+    os.utime(img_dirs[0], (0, 0))
+    os.utime(img_dirs[1], (1, 1))
+    os.utime(img_dirs[2], (2, 2))
+    os.utime(img_dirs[3], (3, 3))
+    assert cache.save_images(stacks[0], fmt="bmp") == img_dirs[0]
+
+    cache.max_bytes = 2 * size
+    cache.save_images(np.full((2, 24, 32), 9, dtype=np.uint8), fmt="bmp")
+    remaining = [path for path, _ in cache.entries()]
+    assert len(remaining) == 2
+    assert img_dirs[0] in remaining
+    assert not any(os.path.exists(path) for path in img_dirs[1:])
+
+
+@pytest.mark.parametrize("fmt", IMAGE_FORMATS)
+def test_emulated_camera_image_formats(RE, db, make_dirs, fmt, num_counts=3):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, name="basler_cam")
+    emulated_basler_camera.exposure_time.put(10)
+
+    ny, nx = emulated_basler_camera.image_shape.get()
+    levels = np.array([10, 20, 30], dtype=np.uint8)
+    emulated_basler_camera.set_custom_images(np.repeat(levels, ny * nx).reshape(-1, ny, nx), fmt=fmt)
+
+    (uid,) = RE(bp.count([emulated_basler_camera], num=num_counts))
+
+    images = np.array(list(db[uid].data(field="basler_cam_image", fill=True)))
+    assert set(np.unique(images)) <= set(levels)
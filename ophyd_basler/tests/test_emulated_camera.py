@@ -1,12 +1,14 @@
 import os
+from datetime import datetime
 
 import bluesky.plans as bp
+import bluesky.preprocessors as bpp
 import numpy as np
 import pytest
 
 import ophyd_basler
 from ophyd_basler.basler_camera import BaslerCamera
-from ophyd_basler.custom_images import get_wandering_gaussian_beam
+from ophyd_basler.custom_images import WanderingGaussianBeam, get_wandering_gaussian_beam
 from ophyd_basler.utils import plot_images
 
 
@@ -19,7 +21,8 @@ def test_emulated_basler_camera(RE, db, make_dirs, exposure_ms, num_counts=8):
     emulated_basler_camera = BaslerCamera(cam_num=0, verbose=True, name="basler_cam")
 
     ny, nx = emulated_basler_camera.image_shape.get()
-    WGB = get_wandering_gaussian_beam(nf=256, nx=nx, ny=ny, seed=6313448000)
+    # The frames are computed one at a time while they are saved, rather than held in memory.
+    WGB = WanderingGaussianBeam(nf=256, nx=nx, ny=ny, seed=6313448000)
 
     emulated_basler_camera.set_custom_images(WGB)
     emulated_basler_camera.exposure_time.put(exposure_ms)
@@ -45,3 +48,136 @@ def test_emulated_basler_camera(RE, db, make_dirs, exposure_ms, num_counts=8):
     plot_images(
         images, ncols=4, nrows=2, save_path=f"/tmp/test_emulated_basler_camera_exposure_ms={exposure_ms:d}.png"
     )
+
+
+@pytest.mark.parametrize("trigger_mode", ["Off", "On"])
+def test_continuous_grab_mode(RE, db, make_dirs, trigger_mode, num_counts=8):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, trigger_mode=trigger_mode, name="basler_cam")
+    emulated_basler_camera.grab_mode.put("continuous")
+    emulated_basler_camera.exposure_time.put(10)
+
+    ny, nx = emulated_basler_camera.image_shape.get()
+    WGB = get_wandering_gaussian_beam(nf=16, nx=nx, ny=ny, seed=6313448000)
+    emulated_basler_camera.set_custom_images(WGB)
+
+    (uid,) = RE(bp.count([emulated_basler_camera], num=num_counts))
+
+    hdr = db[uid]
+    images = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+
+    assert images.shape == (num_counts, ny, nx)
+    assert np.allclose(images.mean(axis=(1, 2)), hdr.table()["basler_cam_mean"])
+    assert emulated_basler_camera._grabber is None
+
+
+def test_invalid_grab_mode(make_dirs, tmp_path):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, root_dir=str(tmp_path), name="basler_cam")
+    emulated_basler_camera.grab_mode.put("burst")
+
+    with pytest.raises(ValueError):
+        emulated_basler_camera.stage()
+    # Nothing is created for an invalid configuration.
+    assert not list(tmp_path.iterdir())
+
+    # A failure once staged, here a missing directory, also leaves the camera unstaged.
+    emulated_basler_camera.grab_mode.put("single")
+    with pytest.raises(FileNotFoundError):
+        emulated_basler_camera.stage()
+    assert not list(emulated_basler_camera.collect_asset_docs())
+
+    (tmp_path / datetime.now().strftime("%Y/%m/%d")).mkdir(parents=True)
+    emulated_basler_camera.stage()
+    emulated_basler_camera.unstage()
+
+
+@pytest.mark.parametrize("grab_mode", ["single", "continuous"])
+@pytest.mark.parametrize("accumulate_mode, dtype", [("sum", np.uint32), ("mean", np.float32), ("max", np.uint8)])
+def test_frames_per_trigger(RE, db, make_dirs, grab_mode, accumulate_mode, dtype, num_counts=4):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, name="basler_cam")
+    emulated_basler_camera.grab_mode.put(grab_mode)
+    emulated_basler_camera.exposure_time.put(10)
+    emulated_basler_camera.frames_per_trigger.put(3)
+    emulated_basler_camera.accumulate_mode.put(accumulate_mode)
+
+    ny, nx = emulated_basler_camera.image_shape.get()
+    levels = np.array([100, 110, 120, 130], dtype=np.uint8)
+    emulated_basler_camera.set_custom_images(np.repeat(levels, ny * nx).reshape(-1, ny, nx))
+
+    (uid,) = RE(bp.count([emulated_basler_camera], num=num_counts))
+
+    hdr = db[uid]
+    images = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+
+    assert images.shape == (num_counts, ny, nx)
+    assert images.dtype == dtype
+    assert np.allclose(images.mean(axis=(1, 2)), hdr.table()["basler_cam_mean"])
+    values = images[:, 0, 0]
+    assert np.all(images == values[:, None, None])
+    if accumulate_mode == "sum":
+        # Three frames were summed without overflowing.
+        assert np.all((values >= 3 * levels.min()) & (values <= 3 * levels.max()))
+    elif accumulate_mode == "mean":
+        assert np.all((values >= levels.min()) & (values <= levels.max()))
+    else:
+        assert set(values) <= set(levels)
+
+
+def test_trigger_status(make_dirs):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, name="basler_cam")
+    emulated_basler_camera.exposure_time.put(10)
+
+    emulated_basler_camera.stage()
+    try:
+        status = emulated_basler_camera.trigger()
+        status.wait(timeout=10)
+        assert status.success
+
+        def broken_grab_image():
+            raise RuntimeError("broken camera")
+
+        emulated_basler_camera.grab_image = broken_grab_image
+        status = emulated_basler_camera.trigger()
+        with pytest.raises(RuntimeError, match="broken camera"):
+            status.wait(timeout=10)
+    finally:
+        emulated_basler_camera.unstage()
+
+
+def test_fly_scan(RE, db, make_dirs, num_frames=20):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, name="basler_cam")
+    emulated_basler_camera.exposure_time.put(1)
+    emulated_basler_camera.fly_num_frames.put(num_frames)
+
+    ny, nx = emulated_basler_camera.image_shape.get()
+    WGB = get_wandering_gaussian_beam(nf=16, nx=nx, ny=ny, seed=6313448000)
+    emulated_basler_camera.set_custom_images(WGB)
+
+    (uid,) = RE(bpp.stage_wrapper(bp.fly([emulated_basler_camera]), [emulated_basler_camera]))
+
+    hdr = db[uid]
+    images = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+
+    assert images.shape == (num_frames, ny, nx)
+    assert np.allclose(images.mean(axis=(1, 2)), hdr.table()["basler_cam_mean"])
+
+
+def test_unsupported_pixel_format(make_dirs, tmp_path):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    # The emulator offers BGRA8Packed, but pypylon cannot return its frames as arrays.
+    emulated_basler_camera = BaslerCamera(
+        cam_num=0, pixel_format="BGRA8Packed", root_dir=str(tmp_path), name="basler_cam"
+    )
+    with pytest.raises(ValueError, match="Unsupported pixel format 'BGRA8Packed'"):
+        emulated_basler_camera.stage()
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,196 @@
+import h5py
+import numpy as np
+import pytest
+
+from ophyd_basler.basler_handler import (
+    BaslerCamHDF5Handler,
+    FilePool,
+    FrameCache,
+    FrameMap,
+    _frame_decompressor,
+    contiguous_runs,
+    get_dask_array,
+    read_frames,
+)
+from ophyd_basler.compression import CODECS, compression_options
+
+
+@pytest.fixture
+def image_files(tmp_path):
+    filenames = []
+    for i in range(3):
+        filename = str(tmp_path / f"images_{i}.h5")
+        with h5py.File(filename, "x") as f:
+            f.create_dataset("/entry/image", data=np.full((4, 2, 3), i, dtype=np.uint8), chunks=(1, 2, 3))
+        filenames.append(filename)
+    return filenames
+
+
+def test_handler_keeps_files_open(monkeypatch, image_files):
+    monkeypatch.setattr(BaslerCamHDF5Handler, "file_pool", FilePool(max_open_files=2))
+    handlers = [BaslerCamHDF5Handler(filename) for filename in image_files]
+
+    for _ in range(2):
+        for i, handler in enumerate(handlers):
+            for frame in range(4):
+                np.testing.assert_array_equal(handler(frame=frame), i)
+            assert len(BaslerCamHDF5Handler.file_pool._files) <= 2
+
+    for handler in handlers:
+        handler.close()
+    assert not BaslerCamHDF5Handler.file_pool._files
+
+
+def test_contiguous_runs():
+    assert contiguous_runs([0, 1, 2, 5, 6, 9]) == [(0, 3, 0), (5, 7, 3), (9, 10, 5)]
+
+
+@pytest.mark.parametrize("frames", [[0, 1, 2, 3], [1, 3], [3, 0, 2, 2], []])
+def test_handler_get_frames(tmp_path, frames):
+    images = np.arange(4 * 2 * 3, dtype=np.uint16).reshape(4, 2, 3)
+    filename = str(tmp_path / "images.h5")
+    with h5py.File(filename, "x") as f:
+        f.create_dataset("/entry/image", data=images, chunks=(1, 2, 3))
+
+    with BaslerCamHDF5Handler(filename) as handler:
+        np.testing.assert_array_equal(handler.get_frames(frames), images[frames])
+
+        out = np.zeros((len(frames), 2, 3), dtype=np.uint16)
+        assert handler.get_frames(frames, out=out) is out
+        np.testing.assert_array_equal(out, images[frames])
+
+        np.testing.assert_array_equal(handler.get_frame_range(1, 4), images[1:4])
+
+
+def test_get_dask_array(monkeypatch, image_files):
+    monkeypatch.setattr(BaslerCamHDF5Handler, "file_pool", FilePool())
+    documents = [("descriptor", {"uid": "d", "name": "primary", "data_keys": {"basler_cam_image": {}}})]
+    expected = []
+    for i, filename in enumerate(image_files[:2]):
+        documents.append(
+            ("resource", {"uid": f"r{i}", "spec": "BASLER_CAM_HDF5", "root": "", "resource_path": filename})
+        )
+        for frame in (0, 1, 3):
+            datum_id = f"r{i}/{frame}"
+            documents.append(
+                ("datum", {"datum_id": datum_id, "resource": f"r{i}", "datum_kwargs": {"frame": frame}})
+            )
+            documents.append(("event", {"descriptor": "d", "data": {"basler_cam_image": datum_id}}))
+            expected.append(np.full((2, 3), i))
+
+    images = get_dask_array(documents)
+    # Building the graph does not hold on to the files.
+    assert not BaslerCamHDF5Handler.file_pool._users
+
+    assert images.shape == (6, 2, 3)
+    assert images.chunks[1:] == ((2,), (3,))
+    np.testing.assert_array_equal(images.compute(), expected)
+
+
+def test_frame_cache(monkeypatch, image_files):
+    frame_nbytes = 2 * 3
+    monkeypatch.setattr(BaslerCamHDF5Handler, "frame_cache", FrameCache(max_bytes=3 * frame_nbytes))
+
+    handlers = [BaslerCamHDF5Handler(filename) for filename in image_files[:2]]
+    for handler in handlers:
+        handler(frame=0)
+    # Another instance shares the cache.
+    BaslerCamHDF5Handler(image_files[0])(frame=0)
+
+    cache = BaslerCamHDF5Handler.frame_cache
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    for frame in range(1, 4):
+        handlers[0](frame=frame)
+    assert len(cache) == 3
+    assert cache.nbytes == 3 * frame_nbytes
+
+    image = handlers[0](frame=3)
+    assert cache.hits == 2
+    # The frames are copies of the cached ones.
+    image[:] = 7
+    np.testing.assert_array_equal(handlers[0](frame=3), 0)
+
+    # A rewritten file is not served from the cache.
+    BaslerCamHDF5Handler.file_pool.discard(image_files[0])
+    with h5py.File(image_files[0], "w") as f:
+        f.create_dataset("/entry/image", data=np.full((4, 2, 3), 5, dtype=np.uint8), chunks=(1, 2, 3))
+    np.testing.assert_array_equal(handlers[0](frame=3), 5)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_read_frames(tmp_path, codec):
+    shuffle = "none" if codec == "none" else "bit" if codec.startswith("blosc-") else "byte"
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 4096, size=(2, 5, 8, 6), dtype=np.uint16)
+    filenames = []
+    for i in range(2):
+        filename = str(tmp_path / f"images_{i}.h5")
+        with h5py.File(filename, "x") as f:
+            f.create_dataset(
+                "/entry/image",
+                data=images[i],
+                chunks=(1, 8, 6),
+                **compression_options(codec, shuffle=shuffle),
+            )
+        filenames.append(filename)
+        # Only the bitshuffle chunks are left to h5py.
+        assert (_frame_decompressor(filename) is None) == codec.startswith("bitshuffle-")
+
+    references = [(filenames[1], 4), (filenames[0], 0), (filenames[1], 1), (filenames[0], 3)]
+    expected = np.array([images[1, 4], images[0, 0], images[1, 1], images[0, 3]])
+
+    np.testing.assert_array_equal(read_frames(references, workers=3), expected)
+    with BaslerCamHDF5Handler(filenames[0]) as handler:
+        np.testing.assert_array_equal(handler.get_frames([3, 1], workers=2), images[0, [3, 1]])
+
+
+@pytest.mark.parametrize(
+    "chunks, compression", [(None, None), ((1, 8, 6), None), ((1, 8, 6), "lzf"), ((2, 8, 6), None)]
+)
+def test_memory_mapped_frames(monkeypatch, tmp_path, chunks, compression):
+    monkeypatch.setattr(BaslerCamHDF5Handler, "use_memmap", True)
+    images = np.arange(5 * 8 * 6, dtype=np.uint16).reshape(5, 8, 6)
+    filename = str(tmp_path / "images.h5")
+    with h5py.File(filename, "x") as f:
+        f.create_dataset("/entry/image", data=images, chunks=chunks, compression=compression)
+
+    mapped = chunks == (1, 8, 6) and compression is None or chunks is None
+    with BaslerCamHDF5Handler(filename) as handler:
+        for frame in (3, 0, 4, 3):
+            image = handler(frame=frame)
+            np.testing.assert_array_equal(image, images[frame])
+            assert isinstance(image.base, np.memmap) == mapped
+            # Mapped frames are read-only views, the others are copies.
+            assert image.flags.writeable != mapped
+        assert isinstance(handler._frame_map, FrameMap) == mapped
+
+
+def test_memory_mapped_frames_of_a_growing_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(BaslerCamHDF5Handler, "use_memmap", True)
+    filename = str(tmp_path / "images.h5")
+    with h5py.File(filename, "x") as f:
+        dataset = f.create_dataset(
+            "/entry/image",
+            shape=(3, 4, 4),
+            maxshape=(None, 4, 4),
+            chunks=(1, 4, 4),
+            dtype=np.uint8,
+            fill_time="never",
+        )
+        dataset[0] = 1
+
+    with BaslerCamHDF5Handler(filename) as handler:
+        np.testing.assert_array_equal(handler(frame=0), 1)
+        # Frames not stored in the file are read by h5py.
+        assert handler._frame_map.get(1) is None
+        handler(frame=1)
+
+        # HDF5 does not allow opening the file for writing while the pool holds it open.
+        BaslerCamHDF5Handler.file_pool.discard(filename)
+        with h5py.File(filename, "a") as f:
+            f["/entry/image"].resize(10, axis=0)
+            f["/entry/image"][9] = 9
+        image = handler(frame=9)
+        np.testing.assert_array_equal(image, 9)
+        assert isinstance(image.base, np.memmap)
@@ -0,0 +1,100 @@
+import time
+
+import bluesky.plans as bp
+import h5py
+import numpy as np
+import pytest
+
+from ophyd_basler.replay import ReplayBaslerCamera, recorded_run
+from ophyd_basler.simulation import RecordedFrames, SimulatedBaslerCamera
+
+
+def _record(RE, db, num_counts, pixel_format="Mono8"):
+    frames = np.random.default_rng(0).integers(0, 256, size=(num_counts, 40, 50), dtype=np.uint8)
+    camera = SimulatedBaslerCamera(frames=frames, pixel_format=pixel_format, name="basler_cam")
+    # Each point takes at least an exposure time.
+    camera.exposure_time.put(20)
+    (uid,) = RE(bp.count([camera], num=num_counts))
+    return db[uid]
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_recorded_frames(tmp_path, prefetch):
+    images = np.random.default_rng(0).integers(0, 256, size=(40, 4, 5), dtype=np.uint8)
+    filename = str(tmp_path / "images.h5")
+    with h5py.File(filename, "x") as f:
+        f.create_dataset("/entry/image", data=images, chunks=(1, 4, 5))
+
+    frames = RecordedFrames(filename, block_size=8, prefetch=prefetch)
+    assert len(frames) == 40
+    assert frames.dtype == np.uint8
+    np.testing.assert_array_equal([frames[i] for i in range(40)], images)
+    np.testing.assert_array_equal(frames[3], images[3])
+    np.testing.assert_array_equal(frames[-1], images[-1])
+    frames.close()
+
+
+def test_replay(RE, db, make_dirs, num_counts=8):
+    hdr = _record(RE, db, num_counts)
+    recorded = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+    filename, timestamps = recorded_run(hdr.documents(fill=False))
+    assert len(timestamps) == num_counts
+    duration = timestamps[-1] - timestamps[0]
+
+    camera = ReplayBaslerCamera(source=filename, timestamps=timestamps, name="basler_cam")
+    camera.exposure_time.put(0.01)
+    assert camera.image_shape.get() == (40, 50)
+
+    for speed in (1, 0):
+        camera.replay_speed.put(speed)
+        start = time.monotonic()
+        (uid,) = RE(bp.count([camera], num=num_counts))
+        elapsed = time.monotonic() - start
+
+        replay = db[uid]
+        np.testing.assert_array_equal(np.array(list(replay.data(field="basler_cam_image", fill=True))), recorded)
+        # The frames are written to a new file, referenced by the documents of the new run.
+        replay_filename, _ = recorded_run(replay.documents(fill=False))
+        assert replay_filename != filename
+        assert replay.config_data("basler_cam")["primary"][0]["basler_cam_replay_source"] == filename
+        if speed == 1:
+            assert elapsed >= 0.9 * duration
+
+    # The replay is over after the frames of the recorded run.
+    camera.replay_speed.put(0)
+    with pytest.raises(Exception):
+        RE(bp.count([camera], num=num_counts + 1))
+
+
+def test_continuous_replay(RE, db, make_dirs, num_counts=8):
+    hdr = _record(RE, db, num_counts)
+    recorded = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+    filename, _ = recorded_run(hdr.documents(fill=False))
+
+    camera = ReplayBaslerCamera(source=filename, trigger_mode="On", name="basler_cam")
+    camera.grab_mode.put("continuous")
+    camera.exposure_time.put(0.01)
+    (uid,) = RE(bp.count([camera], num=num_counts))
+
+    np.testing.assert_array_equal(np.array(list(db[uid].data(field="basler_cam_image", fill=True))), recorded)
+
+
+def test_replay_pixel_formats(RE, db, make_dirs, tmp_path, num_counts=3):
+    hdr = _record(RE, db, num_counts, pixel_format="Mono12")
+    filename, _ = recorded_run(hdr.documents(fill=False))
+
+    camera = ReplayBaslerCamera(source=filename, name="basler_cam")
+    assert camera.active_format.get() == "Mono16"
+    camera.replay_speed.put(0)
+    (uid,) = RE(bp.count([camera], num=num_counts))
+    images = np.array(list(db[uid].data(field="basler_cam_image", fill=True)))
+    assert images.dtype == np.uint16
+    np.testing.assert_array_equal(images, np.array(list(hdr.data(field="basler_cam_image", fill=True))))
+
+    corrected = str(tmp_path / "corrected.h5")
+    with h5py.File(corrected, "x") as f:
+        f.create_dataset("/entry/image", data=np.zeros((2, 4, 5), dtype=np.float32))
+    with pytest.raises(ValueError):
+        ReplayBaslerCamera(source=corrected, name="basler_cam")
+    with pytest.raises(TypeError):
+        camera.set_custom_images(np.zeros((2, 40, 50)))
@@ -0,0 +1,212 @@
+import time
+
+import bluesky.plans as bp
+import bluesky.preprocessors as bpp
+import numpy as np
+import pytest
+from bluesky.utils import FailedStatus
+from pypylon import pylon
+
+from ophyd_basler.acquisition import accumulated_dtype
+from ophyd_basler.custom_images import WanderingGaussianBeam
+from ophyd_basler.simulation import SimulatedBaslerCamera, SimulatedCamera
+
+
+def _grab(camera, num_frames, timeout=1000):
+    images = []
+    camera.StartGrabbingMax(num_frames)
+    while camera.IsGrabbing():
+        with camera.RetrieveResult(timeout, pylon.TimeoutHandling_ThrowException) as res:
+            assert res.GrabSucceeded()
+            with res.GetArrayZeroCopy() as array:
+                images.append(np.array(array))
+    return images
+
+
+def test_simulated_camera():
+    frames = np.random.default_rng(0).integers(0, 256, size=(5, 6, 8), dtype=np.uint8)
+    camera = SimulatedCamera(frames)
+    camera.ExposureTimeAbs.SetValue(100.0)
+
+    assert (camera.Height(), camera.Width()) == (6, 8)
+    assert camera.PayloadSize() == 48
+    assert camera.GetDeviceInfo().GetModelName() == "Simulation"
+
+    # The frames are cycled through, and each grab continues after the last frame grabbed.
+    np.testing.assert_array_equal(_grab(camera, 3), frames[:3])
+    np.testing.assert_array_equal(_grab(camera, 4), frames[[3, 4, 0, 1]])
+    assert not camera.IsGrabbing()
+
+    camera.PixelFormat.SetValue("Mono12")
+    image = _grab(camera, 1)[0]
+    assert image.dtype == np.uint16
+    np.testing.assert_array_equal(image, frames[2])
+    with pytest.raises(ValueError):
+        camera.PixelFormat.SetValue("RGB8")
+    with pytest.raises(ValueError):
+        camera.ExposureTimeAbs.SetValue(0.0)
+
+
+def test_simulated_camera_sources():
+    beam = WanderingGaussianBeam(nf=64, nx=16, ny=12, seed=1)
+    camera = SimulatedCamera(beam)
+    camera.ExposureTimeAbs.SetValue(100.0)
+    assert (camera.Height(), camera.Width()) == (12, 16)
+    np.testing.assert_array_equal(_grab(camera, 4), np.clip(np.rint(beam[:4]), 0, 255))
+
+    # The frames of an iterable are not cycled through.
+    frames = np.arange(3 * 4 * 5, dtype=np.uint8).reshape(3, 4, 5)
+    camera.set_frames(iter(frames))
+    np.testing.assert_array_equal(_grab(camera, 3), frames)
+    camera.StartGrabbingMax(1)
+    with camera.RetrieveResult(1000) as res:
+        assert res.IsValid() and not res.GrabSucceeded()
+
+    with pytest.raises(ValueError):
+        camera.set_frames(np.zeros((2, 4, 5, 3), dtype=np.uint8))
+
+
+def test_simulated_camera_timing():
+    camera = SimulatedCamera(np.zeros((2, 4, 4), dtype=np.uint8))
+    camera.ExposureTimeAbs.SetValue(1000.0)
+    camera.AcquisitionFrameRateAbs.SetValue(100.0)
+
+    start = time.monotonic()
+    _grab(camera, 5)
+    assert time.monotonic() - start >= 0.05
+
+    # Frames that are not retrieved in time are skipped once the grab buffers are full.
+    camera.AcquisitionFrameRateAbs.SetValue(1000.0)
+    camera.MaxNumBuffer.SetValue(2)
+    camera.StartGrabbing()
+    time.sleep(0.05)
+    with camera.RetrieveResult(1000) as res:
+        assert res.GetNumberOfSkippedImages() > 0
+    camera.StopGrabbing()
+
+    # A triggered camera only produces a frame after a trigger.
+    camera.TriggerMode.SetValue("On")
+    camera.StartGrabbing()
+    camera.ExecuteSoftwareTrigger()
+    with camera.RetrieveResult(20, pylon.TimeoutHandling_Return) as res:
+        assert not res.IsValid(), "a software trigger needs the software trigger source"
+    camera.TriggerSource.SetValue("Software")
+    with pytest.raises(TimeoutError):
+        camera.RetrieveResult(20)
+    camera.ExecuteSoftwareTrigger()
+    with camera.RetrieveResult(1000) as res:
+        assert res.GrabSucceeded()
+    camera.StopGrabbing()
+
+
+@pytest.mark.parametrize(
+    "grab_mode, trigger_mode", [("single", "Off"), ("continuous", "Off"), ("continuous", "On")]
+)
+def test_simulated_basler_camera(RE, db, make_dirs, grab_mode, trigger_mode, num_counts=6):
+    frames = np.random.default_rng(0).integers(0, 256, size=(num_counts, 60, 80), dtype=np.uint8)
+    camera = SimulatedBaslerCamera(frames=frames, trigger_mode=trigger_mode, name="basler_cam")
+    camera.grab_mode.put(grab_mode)
+    camera.exposure_time.put(1)
+    assert camera.image_shape.get() == (60, 80)
+
+    (uid,) = RE(bp.count([camera], num=num_counts))
+
+    images = np.array(list(db[uid].data(field="basler_cam_image", fill=True)))
+    assert images.shape == (num_counts, 60, 80)
+    # The software trigger is only set up while the grab loop runs.
+    assert camera.camera_object.TriggerMode() == trigger_mode
+    assert camera.camera_object.TriggerSource() == "Line1"
+    if grab_mode == "single":
+        np.testing.assert_array_equal(images, frames)
+    else:
+        # The continuous grab loop claims the freshest frames.
+        assert all(any(np.array_equal(image, frame) for frame in frames) for image in images)
+
+
+def test_simulated_fly_scan(RE, db, make_dirs, num_frames=200):
+    frames = np.random.default_rng(0).integers(0, 256, size=(num_frames, 60, 80), dtype=np.uint8)
+    camera = SimulatedBaslerCamera(frames=frames, name="basler_cam")
+    camera.exposure_time.put(1)
+    camera.frame_rate.put(1000)
+    camera.fly_num_frames.put(num_frames)
+
+    (uid,) = RE(bpp.stage_wrapper(bp.fly([camera]), [camera]))
+
+    hdr = db[uid]
+    images = np.array(list(hdr.data(field="basler_cam_image", fill=True)))
+    np.testing.assert_array_equal(images, frames)
+    assert np.allclose(images.mean(axis=(1, 2)), hdr.table()["basler_cam_mean"])
+
+
+def test_simulated_fly_scan_skipped_frames(RE, make_dirs, monkeypatch, num_frames=20):
+    camera = SimulatedBaslerCamera(image_shape=(48, 64), name="basler_cam")
+    with pytest.raises(RuntimeError, match="stage"):
+        camera.kickoff()
+
+    camera.exposure_time.put(0.1)
+    camera.frame_rate.put(1000)
+    camera.fly_num_frames.put(num_frames)
+    camera.frame_buffer_size.put(1)
+    camera.camera_object.MaxNumBuffer.SetValue(1)
+    # Frames are processed more slowly than the camera produces them, so it runs out of grab buffers.
+    reduce = camera._reduce
+    monkeypatch.setattr(camera, "_reduce", lambda image: time.sleep(0.005) or reduce(image))
+
+    with pytest.raises(FailedStatus):
+        RE(bpp.stage_wrapper(bp.fly([camera]), [camera]))
+    assert camera.fly_skipped_frames.get() > 0
+
+
+def test_simulated_fly_scan_frames_per_trigger(make_dirs):
+    camera = SimulatedBaslerCamera(image_shape=(48, 64), name="basler_cam")
+    camera.frames_per_trigger.put(2)
+    camera.stage()
+    try:
+        with pytest.raises(RuntimeError, match="frames_per_trigger"):
+            camera.kickoff()
+        # Nothing was started, the frames of the burst would not fit the accumulated dtype of the file.
+        assert camera._grabber is None
+        assert camera.camera_object.AcquisitionMode() == "Continuous"
+    finally:
+        camera.unstage()
+
+
+def test_simulated_basler_camera_recorded_run(RE, db, make_dirs, num_counts=5):
+    camera = SimulatedBaslerCamera(image_shape=(48, 64), name="basler_cam")
+    camera.exposure_time.put(1)
+    (uid,) = RE(bp.count([camera], num=num_counts))
+    recorded = np.array(list(db[uid].data(field="basler_cam_image", fill=True)))
+    filename = camera._data_file
+
+    camera.set_custom_images(filename)
+    camera.frame_rate.put(200)
+    (uid,) = RE(bp.count([camera], num=num_counts))
+
+    hdr = db[uid]
+    np.testing.assert_array_equal(np.array(list(hdr.data(field="basler_cam_image", fill=True))), recorded)
+    assert hdr.config_data("basler_cam")["primary"][0]["basler_cam_frame_rate"] == 200
+
+
+def test_simulated_frames_per_trigger_cleanup(make_dirs):
+    frames = np.arange(3 * 4 * 5, dtype=np.uint8).reshape(3, 4, 5)
+    camera = SimulatedBaslerCamera(frames=frames, name="basler_cam")
+    camera.camera_object.AcquisitionMode.SetValue("SingleFrame")
+    # The grab fails after 3 frames, in the middle of the second accumulation.
+    camera.camera_object.set_frames(iter(frames))
+    camera.frames_per_trigger.put(2)
+
+    camera.stage()
+    try:
+        np.testing.assert_array_equal(camera.grab_image(), frames[0] + frames[1].astype(np.uint32))
+        with pytest.raises(Exception, match="Could not grab"):
+            camera.grab_image()
+        # The buffer of the failed accumulation went back to the pool.
+        pool = camera._frame_pool
+        allocations = pool.allocations
+        pool.take((4, 5), accumulated_dtype("sum", np.uint8))
+        assert pool.allocations == allocations
+    finally:
+        camera.unstage()
+
+    # The acquisition mode is only switched to Continuous while staged.
+    assert camera.camera_object.AcquisitionMode() == "SingleFrame"
@@ -0,0 +1,122 @@
+import os
+
+import bluesky.plans as bp
+import numpy as np
+import pytest
+
+from ophyd_basler.basler_camera import BaslerCamera
+from ophyd_basler.custom_images import get_wandering_gaussian_beam
+from ophyd_basler.stats import STATS, compute_roi_stats, compute_stats
+
+
+def reference_stats(image):
+    weights = image.astype(np.float64)
+    if weights.ndim == 3:
+        weights = weights.sum(axis=-1)
+    y, x = np.mgrid[: weights.shape[0], : weights.shape[1]]
+    total = weights.sum()
+    centroid_x = (weights * x).sum() / total
+    centroid_y = (weights * y).sum() / total
+    sigma_x = np.sqrt((weights * (x - centroid_x) ** 2).sum() / total)
+    sigma_y = np.sqrt((weights * (y - centroid_y) ** 2).sum() / total)
+    return {
+        "total": total,
+        "min": image.min(),
+        "max": image.max(),
+        "sigma": image.std(),
+        "centroid_x": centroid_x,
+        "centroid_y": centroid_y,
+        "sigma_x": sigma_x,
+        "sigma_y": sigma_y,
+        "sigma_xy": (weights * (x - centroid_x) * (y - centroid_y)).sum() / total / (sigma_x * sigma_y),
+    }
+
+
+@pytest.mark.parametrize("dtype, shape", [(np.uint8, (30, 40)), (np.uint16, (30, 40)), (np.uint8, (30, 40, 3))])
+def test_compute_stats(dtype, shape):
+    image = np.random.default_rng(0).integers(0, np.iinfo(dtype).max, size=shape, dtype=dtype)
+
+    stats = compute_stats(image)
+
+    assert set(stats) == set(STATS)
+    expected = reference_stats(image)
+    for name in STATS:
+        assert stats[name] == pytest.approx(expected[name]), name
+
+
+def test_compute_some_stats():
+    image = np.zeros((8, 8), dtype=np.uint8)
+    assert compute_stats(image, ["max"]) == {"max": 0.0}
+    assert np.isnan(compute_stats(image, ["centroid_x"])["centroid_x"])
+    with pytest.raises(ValueError):
+        compute_stats(image, ["median"])
+
+
+def test_camera_stats(RE, db, make_dirs, num_counts=4):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    emulated_basler_camera = BaslerCamera(cam_num=0, name="basler_cam")
+    emulated_basler_camera.exposure_time.put(10)
+    emulated_basler_camera.stats.enabled.put(("total", "centroid_x", "sigma_y"))
+
+    ny, nx = emulated_basler_camera.image_shape.get()
+    WGB = get_wandering_gaussian_beam(nf=num_counts, nx=nx, ny=ny, seed=6313448000)
+    emulated_basler_camera.set_custom_images(WGB)
+
+    (uid,) = RE(bp.count([emulated_basler_camera], num=num_counts))
+
+    hdr = db[uid]
+    table = hdr.table()
+    assert "basler_cam_stats_max" not in table
+    for image, (_, row) in zip(hdr.data(field="basler_cam_image", fill=True), table.iterrows()):
+        expected = compute_stats(image, ["total", "centroid_x", "sigma_y"])
+        assert row["basler_cam_stats_total"] == expected["total"]
+        assert row["basler_cam_stats_centroid_x"] == pytest.approx(expected["centroid_x"], nan_ok=True)
+        assert row["basler_cam_stats_sigma_y"] == pytest.approx(expected["sigma_y"], nan_ok=True)
+
+
+def test_compute_roi_stats():
+    image = np.random.default_rng(0).integers(0, 4096, size=(40, 50), dtype=np.uint16)
+    rois = {"spot": (10, 5, 8, 6), "reference": (30, 20, 12, 15), "background": (0, 0, 50, 40)}
+
+    values = compute_roi_stats(image, rois)
+
+    assert set(values) == set(rois)
+    for name, (x, y, width, height) in rois.items():
+        region = image[y : y + height, x : x + width]
+        expected = reference_stats(region)
+        assert values[name]["sum"] == region.sum()
+        assert values[name]["mean"] == pytest.approx(region.mean())
+        assert values[name]["max"] == region.max()
+        assert values[name]["centroid_x"] == pytest.approx(x + expected["centroid_x"])
+        assert values[name]["centroid_y"] == pytest.approx(y + expected["centroid_y"])
+
+
+def test_camera_rois(RE, db, make_dirs, num_counts=3):
+    os.environ["PYLON_CAMEMU"] = "1"
+
+    rois = {"spot": (100, 50, 64, 32), "background": (0, 0, 16, 16)}
+    emulated_basler_camera = BaslerCamera(cam_num=0, name="basler_cam", rois=rois)
+    emulated_basler_camera.exposure_time.put(10)
+    assert emulated_basler_camera.rois.rois == rois
+
+    ny, nx = emulated_basler_camera.image_shape.get()
+    WGB = get_wandering_gaussian_beam(nf=num_counts, nx=nx, ny=ny, seed=6313448000)
+    emulated_basler_camera.set_custom_images(WGB)
+
+    (uid,) = RE(bp.count([emulated_basler_camera], num=num_counts))
+
+    hdr = db[uid]
+    table = hdr.table()
+    assert hdr.config_data("basler_cam")["primary"][0]["basler_cam_rois_spot_region"] == [100, 50, 64, 32]
+    for image, (_, row) in zip(hdr.data(field="basler_cam_image", fill=True), table.iterrows()):
+        assert row["basler_cam_rois_spot_sum"] == image[50:82, 100:164].sum()
+        assert row["basler_cam_rois_background_max"] == image[:16, :16].max()
+
+    emulated_basler_camera.rois.set_rois({"outside": (nx - 8, 0, 16, 16)})
+    with pytest.raises(ValueError):
+        emulated_basler_camera.stage()
+    # The camera was left unstaged, so it stages again once the configuration is fixed.
+    emulated_basler_camera.rois.set_rois(rois)
+    emulated_basler_camera.stage()
+    emulated_basler_camera.unstage()
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from ophyd_basler.utils import pixel_format_channels, pixel_format_dtype
+
+
+@pytest.mark.parametrize(
+    "pixel_format, dtype, channels",
+    [
+        ("Mono8", np.uint8, None),
+        ("Mono12", np.uint16, None),
+        ("BayerRG8", np.uint8, None),
+        ("BayerRG12", np.uint16, None),
+        ("RGB8", np.uint8, 3),
+        ("BGR8Packed", np.uint8, 3),
+        ("YUV422Packed", np.uint8, 2),
+    ],
+)
+def test_pixel_formats(pixel_format, dtype, channels):
+    assert pixel_format_dtype(pixel_format) == dtype
+    assert pixel_format_channels(pixel_format) == channels
+
+
+@pytest.mark.parametrize("pixel_format", ["Confidence8", "Mono12p", "Mono12Packed", "BayerRG12p", "BGRA8Packed"])
+def test_unsupported_pixel_format(pixel_format):
+    # pypylon cannot return the frames of packed formats as arrays.
+    with pytest.raises(ValueError, match=repr(pixel_format)):
+        pixel_format_dtype(pixel_format)
+    with pytest.raises(ValueError, match=repr(pixel_format)):
+        pixel_format_channels(pixel_format)
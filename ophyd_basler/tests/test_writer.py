@@ -0,0 +1,196 @@
+import threading
+from collections import deque
+
+import h5py
+import numpy as np
+import pytest
+
+from ophyd_basler.basler_handler import BaslerCamHDF5Handler, BaslerCamSWMRReader
+from ophyd_basler.compression import CODECS, SHUFFLES, ChunkCompressor, compression_options
+from ophyd_basler.simulation import SimulatedBaslerCamera
+from ophyd_basler.writer import FrameWriter
+
+
+def test_frame_writer(tmp_path, num_frames=10):
+    images = np.arange(num_frames * 6, dtype=np.uint8).reshape(num_frames, 2, 3)
+    written = []
+
+    with h5py.File(tmp_path / "images.h5", "x") as f:
+        dataset = f.create_dataset("/entry/image", shape=(0, 2, 3), maxshape=(None, 2, 3), dtype=np.uint8)
+        writer = FrameWriter(dataset, queue_size=4)
+        for image in images:
+            writer.submit(image, lambda index, error: written.append((index, error)))
+        writer.close()
+
+        np.testing.assert_array_equal(dataset[()], images)
+
+    assert written == [(i, None) for i in range(num_frames)]
+    assert 1 <= writer.high_water <= 4
+
+
+def test_frame_writer_backpressure(tmp_path):
+    release = threading.Event()
+
+    def blocked_callback(index, error):
+        release.wait()
+
+    with h5py.File(tmp_path / "images.h5", "x") as f:
+        dataset = f.create_dataset("/entry/image", shape=(0, 2, 3), maxshape=(None, 2, 3), dtype=np.uint8)
+        writer = FrameWriter(dataset, queue_size=1)
+        image = np.zeros((2, 3), dtype=np.uint8)
+
+        # The first frame blocks the writer thread, and the second one fills the queue.
+        writer.submit(image, blocked_callback)
+        writer.submit(image, blocked_callback, timeout=1)
+        with pytest.raises(RuntimeError, match="write queue"):
+            writer.submit(image, blocked_callback, timeout=0.1)
+
+        release.set()
+        writer.close()
+        assert dataset.shape == (2, 2, 3)
+
+
+@pytest.mark.parametrize("reserved, capacities", [(0, [64, 128, 256]), (100, [100, 200])])
+def test_frame_writer_growth(tmp_path, reserved, capacities, num_frames=150):
+    image = np.ones((2, 3), dtype=np.uint8)
+    seen_capacities = []
+
+    with h5py.File(tmp_path / "images.h5", "x") as f:
+        dataset = f.create_dataset("/entry/image", shape=(0, 2, 3), maxshape=(None, 2, 3), dtype=np.uint8)
+        writer = FrameWriter(dataset, reserved=reserved)
+        for _ in range(num_frames):
+            writer.submit(image, lambda index, error: seen_capacities.append(dataset.shape[0]))
+        writer.close()
+
+        assert sorted(set(seen_capacities)) == capacities
+        assert dataset.shape == (num_frames, 2, 3)
+        np.testing.assert_array_equal(dataset[()], 1)
+
+
+@pytest.mark.parametrize("shuffle", SHUFFLES)
+@pytest.mark.parametrize("codec", CODECS)
+def test_frame_writer_direct_chunks(tmp_path, codec, shuffle, num_frames=10):
+    try:
+        compression_options(codec, shuffle=shuffle)
+    except ValueError:
+        pytest.skip(f"HDF5 does not support the {codec!r} codec with the {shuffle!r} shuffle filter")
+    images = np.random.default_rng(0).integers(0, 4096, size=(num_frames, 32, 48), dtype=np.uint16)
+    # A frame that the codecs compress well, and one that they cannot shrink, which is stored unfiltered.
+    images[1] = 0
+    images[2] = np.random.default_rng(1).integers(0, 2**16, size=(32, 48), dtype=np.uint16)
+    filename = str(tmp_path / "images.h5")
+
+    with h5py.File(filename, "x") as f:
+        dataset = f.create_dataset(
+            "/entry/image",
+            shape=(0, 32, 48),
+            maxshape=(None, 32, 48),
+            chunks=(1, 32, 48),
+            dtype=np.uint16,
+            **compression_options(codec, level=3, shuffle=shuffle),
+        )
+        writer = FrameWriter(dataset, compressor=ChunkCompressor(codec, level=3, shuffle=shuffle), workers=2)
+        for image in images:
+            writer.submit(image, lambda index, error: None)
+        writer.close()
+
+    handler = BaslerCamHDF5Handler(filename)
+    for frame, image in enumerate(images):
+        np.testing.assert_array_equal(handler(frame=frame), image)
+
+
+@pytest.mark.parametrize("codec", ["none", "gzip"])
+def test_frame_writer_casts_frames(tmp_path, codec, num_frames=4):
+    images = np.random.default_rng(0).integers(0, 256, size=(num_frames, 32, 48), dtype=np.uint8)
+    filename = str(tmp_path / "images.h5")
+
+    with h5py.File(filename, "x") as f:
+        dataset = f.create_dataset(
+            "/entry/image",
+            shape=(0, 32, 48),
+            maxshape=(None, 32, 48),
+            chunks=(1, 32, 48),
+            dtype=np.uint32,
+            **compression_options(codec),
+        )
+        # The uint8 frames are compressed as the uint32 elements of the chunks.
+        writer = FrameWriter(dataset, compressor=ChunkCompressor(codec), workers=2)
+        for image in images:
+            writer.submit(image, lambda index, error: None)
+        writer.close()
+
+    handler = BaslerCamHDF5Handler(filename)
+    for frame, image in enumerate(images):
+        np.testing.assert_array_equal(handler(frame=frame), image)
+
+
+def test_frame_writer_swmr(tmp_path):
+    filename = str(tmp_path / "images.h5")
+
+    with h5py.File(filename, "x", libver="latest") as f:
+        dataset = f.create_dataset(
+            "/entry/image", shape=(0, 2, 3), maxshape=(None, 2, 3), chunks=(1, 2, 3), dtype=np.uint8
+        )
+        f.swmr_mode = True
+        writer = FrameWriter(dataset, swmr=True)
+
+        with BaslerCamSWMRReader(filename) as reader:
+            for batch in ([0, 1, 2], [3, 4]):
+                for value in batch:
+                    writer.submit(np.full((2, 3), value, dtype=np.uint8), lambda index, error: None)
+                writer.flush()
+                np.testing.assert_array_equal(reader.poll()[:, 0, 0], batch)
+
+            assert reader.poll().shape == (0, 2, 3)
+            assert reader.num_frames == 5
+
+        writer.close()
+
+
+class _InterleavedDeque(deque):
+    """
+    A deque running ``on_access()`` once, right before it is first drained, as
+    if a frame had been written on the writer thread in the middle of a collect.
+    """
+
+    def __init__(self, items, on_access):
+        super().__init__(items)
+        self._on_access = on_access
+
+    def _interleave(self):
+        on_access, self._on_access = self._on_access, None
+        if on_access is not None:
+            on_access()
+
+    def popleft(self):
+        self._interleave()
+        return super().popleft()
+
+    def clear(self):
+        self._interleave()
+        super().clear()
+
+
+def test_collect_asset_docs_interleaved(make_dirs, num_frames=4):
+    camera = SimulatedBaslerCamera(name="basler_cam")
+    camera.stage()
+    image = np.zeros(camera.image_shape.get(), dtype=np.uint8)
+
+    def write_frame():
+        written = threading.Event()
+        camera._commit_frame(image, lambda datum, error: written.set())
+        assert written.wait(5)
+
+    try:
+        write_frame()
+        camera._asset_docs_cache = _InterleavedDeque(camera._asset_docs_cache, write_frame)
+        docs = list(camera.collect_asset_docs())
+        for _ in range(num_frames - 2):
+            write_frame()
+        docs += list(camera.collect_asset_docs())
+    finally:
+        camera.unstage()
+
+    names = [name for name, _ in docs]
+    assert names == ["resource"] + ["datum"] * num_frames
+    assert [doc["datum_kwargs"]["frame"] for name, doc in docs if name == "datum"] == list(range(num_frames))
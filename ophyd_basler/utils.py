@@ -3,6 +3,7 @@ import logging
 from logging import StreamHandler
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 logger_basler = logging.getLogger("basler")
 
@@ -21,6 +22,50 @@ def configure_logger(logger, log_level=logging.DEBUG, handlers=[StreamHandler]):
         handler.setLevel(log_level)
 
 
+# The dtype and number of channels of the frames grabbed in each supported
+# pylon pixel format, None for single-channel formats. These are the formats
+# pypylon returns as NumPy arrays; it refuses packed formats such as Mono12p.
+PIXEL_FORMATS = {
+    "Mono8": (np.uint8, None),
+    **{f"Mono{bits}": (np.uint16, None) for bits in (10, 12, 16)},
+    **{f"Bayer{pattern}8": (np.uint8, None) for pattern in ("GR", "RG", "GB", "BG")},
+    **{
+        f"Bayer{pattern}{bits}": (np.uint16, None) for pattern in ("GR", "RG", "GB", "BG") for bits in (10, 12, 16)
+    },
+    "RGB8": (np.uint8, 3),
+    "RGB8Packed": (np.uint8, 3),
+    "BGR8": (np.uint8, 3),
+    "BGR8Packed": (np.uint8, 3),
+    "YUV422Packed": (np.uint8, 2),
+    "YUV422_YUYV_Packed": (np.uint8, 2),
+}
+
+
+def _pixel_format(pixel_format):
+    try:
+        return PIXEL_FORMATS[pixel_format]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported pixel format {pixel_format!r}, the supported formats are {', '.join(PIXEL_FORMATS)}."
+        ) from None
+
+
+def pixel_format_dtype(pixel_format):
+    """
+    Returns the NumPy dtype of the frames grabbed in the given pylon pixel
+    format, e.g. uint8 for Mono8 and uint16 for Mono10/12/16.
+    """
+    return np.dtype(_pixel_format(pixel_format)[0])
+
+
+def pixel_format_channels(pixel_format):
+    """
+    Returns the number of channels of the frames grabbed in the given pylon
+    pixel format, or None for single-channel formats.
+    """
+    return _pixel_format(pixel_format)[1]
+
+
 def plot_images(data, nrows=None, ncols=None, save_path=None):
     """
     Usage
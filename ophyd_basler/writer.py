@@ -0,0 +1,220 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .utils import logger_basler as logger
+
+
+class FrameWriter:
+    """
+    Writes frames into an HDF5 dataset from a dedicated thread.
+
+    Frames are queued with ``submit()`` and written in submission order. The
+    queue is bounded: when it is full, ``submit()`` blocks until the writer
+    catches up, and raises if it does not within the timeout.
+
+    Instead of resizing the dataset for every frame, the writer allocates the
+    number of frames reserved with ``reserve()`` up front, and otherwise grows
+    the dataset geometrically. ``close()`` trims it to the written frames.
+
+    With a ``compressor``, each frame is compressed in a pool of worker threads
+    as soon as it is submitted, and the compressed chunks are committed in
+    frame order with ``write_direct_chunk()``.
+
+    Parameters
+    ----------
+    dataset : h5py.Dataset
+        a resizable dataset shaped as (num_frames, *frame_shape).
+    queue_size : int
+        the maximum number of frames waiting to be written.
+    on_depth : callable
+        if given, called as ``on_depth(depth, high_water)`` whenever the queue
+        depth changes.
+    reserved : int
+        the number of frames expected in the dataset, if known.
+    min_growth : int
+        the minimum number of frames added when the dataset grows.
+    compressor : callable
+        if given, turns a frame into the filter mask and the bytes of a chunk
+        ready for ``write_direct_chunk()``, matching the filters of the
+        dataset, e.g. a ``ophyd_basler.compression.ChunkCompressor``; the
+        dataset must be chunked frame by frame.
+    workers : int
+        the number of compression threads.
+    swmr : bool
+        whether the file is open in SWMR mode; the dataset is then flushed
+        after each batch of written frames, before their callbacks run, and
+        never grown beyond the written frames.
+    swmr_batch : int
+        the maximum number of frames written between two flushes.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        queue_size=16,
+        on_depth=None,
+        reserved=0,
+        min_growth=64,
+        compressor=None,
+        workers=4,
+        swmr=False,
+        swmr_batch=16,
+    ):
+        self._dataset = dataset
+        self._dtype = dataset.dtype
+        self._swmr = swmr
+        self._swmr_batch = swmr_batch
+        self._compressor = compressor
+        self._compression_pool = None
+        if compressor is not None:
+            self._compression_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="basler-compress")
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._on_depth = on_depth
+        self._reserved = reserved
+        self._min_growth = min_growth
+        self._num_submitted = 0
+        self._num_written = 0
+        self._lock = threading.Lock()
+        self._high_water = 0
+        self._thread = threading.Thread(target=self._run, name="basler-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """The number of frames waiting to be written."""
+        return self._queue.qsize()
+
+    @property
+    def num_submitted(self):
+        """The number of frames submitted so far."""
+        return self._num_submitted
+
+    @property
+    def high_water(self):
+        """The largest queue depth seen so far."""
+        return self._high_water
+
+    def reserve(self, num_frames):
+        """
+        Preallocate room for ``num_frames`` frames on the next write that needs it.
+        """
+        self._reserved = num_frames
+
+    def _report_depth(self):
+        depth = self._queue.qsize()
+        self._high_water = max(self._high_water, depth)
+        if self._on_depth is not None:
+            self._on_depth(depth, self._high_water)
+
+    def submit(self, image, callback, timeout=None):
+        """
+        Queue a frame for writing.
+
+        Parameters
+        ----------
+        image : ndarray
+            the frame, cast to the dtype of the dataset; it must not be
+            modified until the callback runs.
+        callback : callable
+            called on the writer thread as ``callback(index, error)`` once the
+            frame has been written at ``index``, or failed with ``error``.
+        timeout : float
+            how long to wait for room in the queue, in seconds.
+
+        Returns
+        -------
+        the index of the frame in the dataset.
+        """
+        # Cast before compressing, so that the chunks hold the bytes of the dataset's dtype.
+        image = np.asarray(image, dtype=self._dtype)
+        # The lock keeps the indices in queue order when several threads submit frames.
+        with self._lock:
+            index = self._num_submitted
+            data = image
+            if self._compression_pool is not None:
+                data = self._compression_pool.submit(self._compressor, image)
+            try:
+                self._queue.put((index, data, callback), timeout=timeout)
+            except queue.Full:
+                raise RuntimeError(f"The write queue stayed full for {timeout} s.") from None
+            self._num_submitted += 1
+        self._report_depth()
+        return index
+
+    def _write(self, index, data):
+        capacity = self._dataset.shape[0]
+        if self._swmr:
+            # Readers see the whole dataset, so it only grows by the frames actually written.
+            self._dataset.resize(index + 1, axis=0)
+        elif index >= capacity:
+            capacity = max(index + 1, self._reserved, 2 * capacity, capacity + self._min_growth)
+            logger.debug(f"growing the dataset to {capacity} frames")
+            self._dataset.resize(capacity, axis=0)
+        if self._compressor is not None:
+            offset = (index,) + (0,) * (self._dataset.ndim - 1)
+            filter_mask, chunk = data.result()
+            self._dataset.id.write_direct_chunk(offset, chunk, filter_mask)
+        else:
+            self._dataset[index] = data
+        self._num_written = index + 1
+
+    def _commit(self, written):
+        if self._swmr and written:
+            try:
+                self._dataset.flush()
+            except Exception as e:
+                logger.exception("failed to flush the dataset")
+                written = [(index, error or e, callback) for index, error, callback in written]
+
+        for index, error, callback in written:
+            try:
+                callback(index, error)
+            except Exception:
+                logger.exception(f"the callback of frame {index} failed")
+            self._queue.task_done()
+        written.clear()
+        self._report_depth()
+
+    def _run(self):
+        written = []
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._commit(written)
+                self._queue.task_done()
+                break
+
+            index, data, callback = item
+            error = None
+            try:
+                self._write(index, data)
+            except Exception as e:
+                logger.exception(f"failed to write frame {index}")
+                error = e
+            written.append((index, error, callback))
+
+            # In SWMR mode, flush once per batch of frames that were queued together.
+            if not self._swmr or self._queue.empty() or len(written) >= self._swmr_batch:
+                self._commit(written)
+
+    def flush(self):
+        """
+        Wait until every queued frame has been written.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Write the remaining frames, stop the writer thread, and trim the
+        dataset to the frames that were written.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._compression_pool is not None:
+            self._compression_pool.shutdown()
+        if self._dataset.shape[0] != self._num_written:
+            self._dataset.resize(self._num_written, axis=0)
+        logger.debug(f"closed the writer (high-water mark: {self._high_water} frames)")